@@ -284,12 +284,16 @@ class Lock(object):
             self._writes += 1
             return False
 
-    def release_read(self):
+    def release_read(self, release_fn=None):
         """Releases a read lock.
 
         Returns True if the last recursive lock was released, False if
         there are still outstanding locks.
 
+        If ``release_fn`` is given, it is called right *before* the last
+        recursive lock is released, and its result is returned instead
+        of True.
+
         Does limited correctness checking: if a read lock is released
         when none are held, this will raise an assertion error.
 
@@ -297,22 +301,31 @@ class Lock(object):
         assert self._reads > 0
 
         if self._reads == 1 and self._writes == 0:
-            self._debug(
-                'READ LOCK: {0.path}[{0._start}:{0._length}] [Released]'
-                .format(self))
-            self._unlock()      # can raise LockError.
-            self._reads -= 1
-            return True
+            try:
+                result = release_fn() if release_fn else True
+            finally:
+                self._debug(
+                    'READ LOCK: {0.path}[{0._start}:{0._length}] [Released]'
+                    .format(self))
+                self._unlock()      # can raise LockError.
+                self._reads -= 1
+            return result
         else:
             self._reads -= 1
             return False
 
-    def release_write(self):
+    def release_write(self, release_fn=None):
         """Releases a write lock.
 
         Returns True if the last recursive lock was released, False if
         there are still outstanding locks.
 
+        If ``release_fn`` is given, it is called while the write lock is
+        still held, when the last recursive *write* lock is released, and
+        its result is returned instead of True. This also happens for a
+        write nested in a read, so that the write is always finished while
+        the exclusive lock is held.
+
         Does limited correctness checking: if a read lock is released
         when none are held, this will raise an assertion error.
 
@@ -320,14 +333,19 @@ class Lock(object):
         assert self._writes > 0
 
         if self._writes == 1 and self._reads == 0:
-            self._debug(
-                'WRITE LOCK: {0.path}[{0._start}:{0._length}] [Released]'
-                .format(self))
-            self._unlock()      # can raise LockError.
-            self._writes -= 1
-            return True
+            try:
+                result = release_fn() if release_fn else True
+            finally:
+                self._debug(
+                    'WRITE LOCK: {0.path}[{0._start}:{0._length}] [Released]'
+                    .format(self))
+                self._unlock()      # can raise LockError.
+                self._writes -= 1
+            return result
         else:
             self._writes -= 1
+            if self._writes == 0 and release_fn:
+                return release_fn()
             return False
 
     def _debug(self, *args):
@@ -361,6 +379,9 @@ class LockTransaction(object):
     funciton will be called before ``release_fn`` in ``__exit__``, allowing you
     to nest a context manager to be used along with the lock.
 
+    Both are called while the lock is still held, so that e.g. changes
+    written by ``release_fn`` cannot race with other processes.
+
     Timeout for lock is customizable.
 
     """
@@ -382,15 +403,17 @@ class LockTransaction(object):
                 return self._as
 
     def __exit__(self, type, value, traceback):
-        suppress = False
-        if self._exit():
+        def release_fn():
+            suppress = False
             if self._as and hasattr(self._as, '__exit__'):
                 if self._as.__exit__(type, value, traceback):
                     suppress = True
             if self._release_fn:
                 if self._release_fn(type, value, traceback):
                     suppress = True
-        return suppress
+            return suppress
+
+        return self._exit(release_fn)
 
 
 class ReadTransaction(LockTransaction):
@@ -398,8 +421,8 @@ class ReadTransaction(LockTransaction):
     def _enter(self):
         return self._lock.acquire_read(self._timeout)
 
-    def _exit(self):
-        return self._lock.release_read()
+    def _exit(self, release_fn):
+        return self._lock.release_read(release_fn)
 
 
 class WriteTransaction(LockTransaction):
@@ -407,8 +430,8 @@ class WriteTransaction(LockTransaction):
     def _enter(self):
         return self._lock.acquire_write(self._timeout)
 
-    def _exit(self):
-        return self._lock.release_write()
+    def _exit(self, release_fn):
+        return self._lock.release_write(release_fn)
 
 
 class LockError(Exception):
@@ -20,13 +20,39 @@ def spawn(f):
     return fun
 
 
-def parmap(f, elements):
+def parmap(f, elements, fallback=None):
+    """Map ``f`` over ``elements``, each in a child process of its own.
+
+    If a child exits without sending its result, e.g. because it called
+    ``sys.exit()`` or was killed, or exits with a non-zero code, its
+    element is mapped again in the parent, with ``fallback`` if given and
+    with ``f`` otherwise.
+    """
     pipe = [Pipe() for x in elements]
     proc = [Process(target=spawn(f), args=(c, x))
             for x, (p, c) in zip(elements, pipe)]
     [p.start() for p in proc]
+    # close the children's ends here, so that recv() fails instead of
+    # blocking forever if a child dies without sending anything
+    [c.close() for (p, c) in pipe]
+
+    # receive before joining, so that children with results larger than
+    # the pipe buffer can exit
+    received = []
+    for p, c in pipe:
+        try:
+            received.append((True, p.recv()))
+        except EOFError:
+            received.append((False, None))
+        p.close()
     [p.join() for p in proc]
-    return [p.recv() for (p, c) in pipe]
+
+    results = []
+    for x, p, (ok, result) in zip(elements, proc, received):
+        if not ok or p.exitcode != 0:
+            result = (fallback or f)(x)
+        results.append(result)
+    return results
 
 
 class Barrier:
@@ -3,35 +3,80 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import gzip
+import io
+import multiprocessing
 import os
+import pickle
 import re
 import tarfile
 import shutil
 import tempfile
+import time
 import hashlib
-from contextlib import closing
+from contextlib import closing, contextmanager
 
 import json
 
 from six.moves.urllib.error import URLError
 
+import llnl.util.multiproc as mp
 import llnl.util.tty as tty
 from llnl.util.filesystem import mkdirp, install_tree
 
+import spack.caches
 import spack.cmd
+import spack.error
+import spack.paths
 import spack.fetch_strategy as fs
+import spack.environment
+import spack.util.compression
 import spack.util.gpg as gpg_util
 import spack.relocate as relocate
+import spack.util.spack_json as sjson
 import spack.util.spack_yaml as syaml
 from spack.spec import Spec
 from spack.stage import Stage
+from spack.util.download import DownloadManager, DownloadError
+from spack.util.download import download_with_retries
 from spack.util.gpg import Gpg
 from spack.util.web import spider, read_from_url
-from spack.util.executable import ProcessError
+from spack.util.executable import ProcessError, which
 
 
 _build_cache_relative_path = 'build_cache'
 
+#: Index of the specs in a build cache, and file with its sha256 checksum
+_index_file_name = 'index.json'
+_index_hash_file_name = 'index.json.hash'
+
+#: Version of the format of the index of a build cache
+_index_version = 1
+
+#: Directory of the blob store of a build cache, relative to build_cache
+_blob_relative_path = os.path.join('blobs', 'sha256')
+
+#: Manifest of the files of a package that are stored as blobs, kept at
+#: the root of its tarball
+_blob_manifest_name = 'blob_manifest.json'
+
+#: Regular files at least this large are stored as blobs, when the blob
+#: store is used
+blob_min_size = 16 * 1024
+
+#: Minimum number of files each process relocates when relocating a
+#: package in parallel
+relocation_batch_size = 32
+
+#: Compression of the tarball in a .spack archive, by format:
+#: ``(extension, compressor arguments, decompressor arguments)``
+tarball_compressions = {
+    'gzip': ('.tar.gz', None, None),
+    'xz': ('.tar.xz', ['xz', '-T0', '-c'], ['xz', '-d', '-c']),
+    'zstd': ('.tar.zst', ['zstd', '-T0', '-q', '-c'],
+             ['zstd', '-d', '-q', '-c']),
+}
+
 
 class NoOverwriteException(Exception):
     """
@@ -83,6 +128,13 @@ class NoChecksumException(spack.error.SpackError):
     pass
 
 
+class MissingBlobException(spack.error.SpackError):
+    """
+    Raised if a file stored as a blob cannot be downloaded.
+    """
+    pass
+
+
 class NewLayoutException(spack.error.SpackError):
     """
     Raised if directory layout is different from buildcache.
@@ -125,17 +177,16 @@ def read_buildinfo_file(prefix):
     return buildinfo
 
 
-def write_buildinfo_file(prefix, workdir, rel=False):
+def get_buildinfo(prefix, rel=False):
     """
-    Create a cache file containing information
-    required for the relocation
+    Return the information required to relocate the files in prefix
     """
     text_to_relocate = []
     binary_to_relocate = []
     link_to_relocate = []
     blacklist = (".spack", "man")
     # Do this at during tarball creation to save time when tarball unpacked.
-    # Used by make_package_relative to determine binaries to change.
+    # Used by add_prefix_to_tarball to determine binaries to change.
     for root, dirs, files in os.walk(prefix, topdown=True):
         dirs[:] = [d for d in dirs if d not in blacklist]
         for filename in files:
@@ -167,18 +218,16 @@ def write_buildinfo_file(prefix, workdir, rel=False):
                     rel_path_name = os.path.relpath(path_name, prefix)
                     text_to_relocate.append(rel_path_name)
 
-    # Create buildinfo data and write it to disk
     buildinfo = {}
     buildinfo['relative_rpaths'] = rel
     buildinfo['buildpath'] = spack.store.layout.root
+    buildinfo['spackprefix'] = spack.paths.prefix
     buildinfo['relative_prefix'] = os.path.relpath(
         prefix, spack.store.layout.root)
     buildinfo['relocate_textfiles'] = text_to_relocate
     buildinfo['relocate_binaries'] = binary_to_relocate
     buildinfo['relocate_links'] = link_to_relocate
-    filename = buildinfo_file_name(workdir)
-    with open(filename, 'w') as outfile:
-        outfile.write(syaml.dump(buildinfo, default_flow_style=True))
+    return buildinfo
 
 
 def tarball_directory_name(spec):
@@ -204,6 +253,17 @@ def tarball_name(spec, ext):
                                  ext)
 
 
+def _tarfile_name(spec, fmt, blobs=False):
+    """
+    Return the name of the tarball of the install prefix in a .spack file.
+    Tarballs with files stored as blobs have another name, so that older
+    versions of Spack fail to find them instead of installing the package
+    without its large files.
+    """
+    ext = tarball_compressions[fmt][0]
+    return tarball_name(spec, ('.blobs' if blobs else '') + ext)
+
+
 def tarball_path_name(spec, ext):
     """
     Return the full path+name for a given spec according to the convention
@@ -225,6 +285,164 @@ def checksum_tarball(file):
     return hasher.hexdigest()
 
 
+class ChecksummedFile(object):
+    """Write-only file object that computes the size and the sha256
+    checksum of the data written to another file object."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        self.fileobj.write(data)
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+def compression_format(compression):
+    """Return the format of a compression mode (``pgzip`` is ``gzip``)."""
+    return 'gzip' if compression == 'pgzip' else compression
+
+
+def _command(args):
+    exe = which(args[0], required=True)
+    return exe.exe + args[1:]
+
+
+@contextmanager
+def open_compressed_tarball(fileobj, compression):
+    """
+    Open a tarball for writing to fileobj in stream mode.
+
+    ``compression`` is one of the formats in ``tarball_compressions``, or
+    ``pgzip`` to write gzip with one thread per core.
+    """
+    fmt = compression_format(compression)
+    if fmt not in tarball_compressions:
+        raise ValueError('unknown compression: %s' % compression)
+
+    if compression == 'gzip':
+        with closing(tarfile.open(mode='w|gz', fileobj=fileobj)) as tar:
+            yield tar
+        return
+
+    if compression == 'pgzip':
+        compressor = spack.util.compression.ParallelGzipWriter(fileobj)
+    else:
+        compressor = spack.util.compression.CompressorProcess(
+            fileobj, _command(tarball_compressions[fmt][1]))
+    try:
+        tar = tarfile.open(mode='w|', fileobj=compressor)
+        yield tar
+        tar.close()
+    finally:
+        compressor.close()
+
+
+@contextmanager
+def open_tarball(path, fmt):
+    """
+    Open a tarball compressed in one of the formats in
+    ``tarball_compressions`` for reading.
+    """
+    if fmt == 'gzip':
+        with closing(tarfile.open(path, 'r')) as tar:
+            yield tar
+        return
+
+    args = _command(tarball_compressions[fmt][2])
+    with spack.util.compression.decompressed(path, args) as stream:
+        with closing(tarfile.open(mode='r|', fileobj=stream)) as tar:
+            yield tar
+
+
+def _blob_path(blob_dir, digest):
+    return os.path.join(blob_dir, digest[:2], digest)
+
+
+def local_blob_directory():
+    """Directory where blobs downloaded from build caches are kept."""
+    return os.path.join(spack.caches.fetch_cache.root, 'build_cache',
+                        _blob_relative_path)
+
+
+def add_blob(path, blob_dir):
+    """
+    Add the contents of a file to a blob store, unless they are there.
+
+    Blobs are named after the sha256 checksum of the file, and are gzip
+    compressed.
+
+    Returns:
+        (str): the sha256 checksum of the file
+    """
+    digest = checksum_tarball(path)
+    blob_path = _blob_path(blob_dir, digest)
+    if not os.path.exists(blob_path):
+        mkdirp(os.path.dirname(blob_path))
+        with open(path, 'rb') as src:
+            with open(blob_path + '.tmp', 'wb') as f:
+                with closing(gzip.GzipFile(
+                        '', 'wb', fileobj=f, mtime=0)) as dst:
+                    shutil.copyfileobj(src, dst)
+        os.rename(blob_path + '.tmp', blob_path)
+    return digest
+
+
+def restore_blobs(workdir, manifest):
+    """
+    Write the files of an extracted package that are stored as blobs.
+
+    Blobs missing from ``local_blob_directory()`` are downloaded from the
+    mirrors first, concurrently.
+
+    Arguments:
+        workdir (str): directory the package was extracted to
+        manifest (dict): sha256 checksum and mode of the files stored as
+            blobs, by path relative to ``workdir``
+    """
+    blob_dir = local_blob_directory()
+    missing = set(
+        entry['sha256'] for entry in manifest.values()
+        if not os.path.exists(_blob_path(blob_dir, entry['sha256'])))
+    if missing:
+        mirrors = spack.config.get('mirrors')
+        tty.msg('Fetching %d blobs' % len(missing))
+        with DownloadManager() as downloads:
+            for digest in sorted(missing):
+                urls = ['/'.join([
+                    mirror_url, _build_cache_relative_path, 'blobs',
+                    'sha256', digest[:2], digest])
+                    for mirror_url in mirrors.values()]
+                downloads.add(digest, urls, _blob_path(blob_dir, digest))
+
+            for digest, _, error in downloads.as_completed():
+                if error is not None:
+                    raise MissingBlobException(
+                        'Could not download blob %s' % digest, str(error))
+
+    for rel_path, entry in sorted(manifest.items()):
+        blob_path = _blob_path(blob_dir, entry['sha256'])
+        path = os.path.join(workdir, rel_path)
+        hasher = hashlib.sha256()
+        with closing(gzip.open(blob_path, 'rb')) as src:
+            with open(path, 'wb') as dst:
+                for chunk in iter(lambda: src.read(1 << 20), b''):
+                    hasher.update(chunk)
+                    dst.write(chunk)
+
+        if hasher.hexdigest() != entry['sha256']:
+            os.remove(blob_path)
+            raise NoChecksumException(
+                "Blob %s of %s failed checksum verification.\n"
+                "It cannot be installed." % (entry['sha256'], rel_path))
+        os.chmod(path, entry['mode'])
+
+
 def sign_tarball(key, force, specfile_path):
     # Sign the packages if keys available
     if not has_gnupg2():
@@ -275,23 +493,101 @@ def generate_package_index(build_cache_dir):
     _generate_html_index(path_list, index_html_path_tmp)
     shutil.move(index_html_path_tmp, index_html_path)
 
+    _generate_json_index(build_cache_dir)
+
+
+def _generate_json_index(build_cache_dir):
+    """
+    Write the index of the specs in a build cache, with the hash file
+    used to check whether it changed.
+
+    The index has the nodes of all the specs, keyed by DAG hash, and an
+    entry for each spec.yaml file with the DAG hash of its root, its full
+    hash and the checksum of its tarball.
+    """
+    nodes = {}
+    specs = {}
+    for filename in sorted(os.listdir(build_cache_dir)):
+        if not filename.endswith('.spec.yaml'):
+            continue
+        with open(os.path.join(build_cache_dir, filename)) as f:
+            spec_dict = syaml.load(f)
+
+        node_list = spec_dict['spec']
+        for node in node_list:
+            node_hash = node[next(iter(node))].get('hash')
+            if node_hash:
+                nodes[node_hash] = node
+
+        root = node_list[0]
+        root_hash = root[next(iter(root))].get('hash')
+        if not root_hash:
+            tty.warn('Not indexing %s, which has no hashes' % filename)
+            continue
+        specs[root_hash] = {
+            'spec_yaml': filename,
+            'full_hash': spec_dict.get('full_hash'),
+            'binary_cache_checksum': spec_dict.get('binary_cache_checksum'),
+        }
+
+    index = {'buildcache': {
+        'version': _index_version,
+        'nodes': nodes,
+        'specs': specs,
+    }}
+    contents = json.dumps(index, sort_keys=True, separators=(',', ':'))
+
+    index_path = os.path.join(build_cache_dir, _index_file_name)
+    with open(index_path + '.tmp', 'w') as f:
+        f.write(contents)
+    shutil.move(index_path + '.tmp', index_path)
+
+    hash_path = os.path.join(build_cache_dir, _index_hash_file_name)
+    with open(hash_path + '.tmp', 'w') as f:
+        f.write(_index_hash(contents))
+    shutil.move(hash_path + '.tmp', hash_path)
+
+
+def _index_hash(contents):
+    return hashlib.sha256(contents.encode('utf-8')).hexdigest()
+
 
 def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
-                  allow_root=False, key=None, regenerate_index=False):
+                  allow_root=False, key=None, regenerate_index=False,
+                  compression=None, blobs=None):
     """
     Build a tarball from given spec and put it into the directory structure
     used at the mirror (following <tarball_directory_name>).
+
+    The tarball is compressed with ``compression`` (see
+    ``open_compressed_tarball()``), by default with
+    ``config:build_cache_compression``.
+
+    With ``blobs`` (by default ``config:build_cache_blobs``), large files
+    are stored in the blob store of the build cache rather than in the
+    tarball, once for all the packages that have them.
     """
     if not spec.concrete:
         raise ValueError('spec must be concrete to build tarball')
 
+    if compression is None:
+        compression = spack.config.get(
+            'config:build_cache_compression', 'pgzip')
+    fmt = compression_format(compression)
+    if fmt not in tarball_compressions:
+        raise ValueError('unknown compression: %s' % compression)
+    if blobs is None:
+        blobs = spack.config.get('config:build_cache_blobs', False)
+
     # set up some paths
     build_cache_dir = build_cache_directory(outdir)
+    blob_dir = None
+    if blobs:
+        blob_dir = os.path.join(build_cache_dir, _blob_relative_path)
 
-    tarfile_name = tarball_name(spec, '.tar.gz')
+    tarfile_name = _tarfile_name(spec, fmt, bool(blobs))
     tarfile_dir = os.path.join(build_cache_dir,
                                tarball_directory_name(spec))
-    tarfile_path = os.path.join(tarfile_dir, tarfile_name)
     mkdirp(tarfile_dir)
     spackfile_path = os.path.join(
         build_cache_dir, tarball_path_name(spec, '.spack'))
@@ -313,38 +609,33 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
             os.remove(specfile_path)
         else:
             raise NoOverwriteException(str(specfile_path))
-    # make a copy of the install directory to work with
-    workdir = os.path.join(tempfile.mkdtemp(), os.path.basename(spec.prefix))
-    install_tree(spec.prefix, workdir, symlinks=True)
-
-    # create info for later relocation and create tar
-    write_buildinfo_file(spec.prefix, workdir, rel=rel)
-
-    # optinally make the paths in the binaries relative to each other
-    # in the spack install tree before creating tarball
-    if rel:
-        try:
-            make_package_relative(workdir, spec.prefix, allow_root)
-        except Exception as e:
-            shutil.rmtree(workdir)
-            shutil.rmtree(tarfile_dir)
-            tty.die(str(e))
-    else:
-        try:
-            make_package_placeholder(workdir, spec.prefix, allow_root)
-        except Exception as e:
-            shutil.rmtree(workdir)
-            shutil.rmtree(tarfile_dir)
-            tty.die(str(e))
-    # create compressed tarball of the install prefix
-    with closing(tarfile.open(tarfile_path, 'w:gz')) as tar:
-        tar.add(name='%s' % workdir,
-                arcname='%s' % os.path.basename(spec.prefix))
-    # remove copy of install directory
-    shutil.rmtree(workdir)
+    buildinfo = get_buildinfo(spec.prefix, rel=rel)
+
+    # The compressed tarball of the install prefix is written straight
+    # into the .spack archive, as its first member. Its header is written
+    # again once its size is known, and the other files are appended.
+    tarinfo = tarfile.TarInfo(tarfile_name)
+    tarinfo.mtime = time.time()
+    tarinfo.mode = 0o644
+    try:
+        with open(spackfile_path, 'wb') as spackfile:
+            spackfile.write(tarinfo.tobuf(tarfile.GNU_FORMAT))
+            tarball = ChecksummedFile(spackfile)
+            with open_compressed_tarball(tarball, compression) as tar:
+                add_prefix_to_tarball(tar, spec.prefix, buildinfo,
+                                      allow_root, blob_dir)
+            spackfile.write(tarfile.NUL * (-tarball.size % tarfile.BLOCKSIZE))
+            spackfile.write(tarfile.NUL * (2 * tarfile.BLOCKSIZE))
+
+            tarinfo.size = tarball.size
+            spackfile.seek(0)
+            spackfile.write(tarinfo.tobuf(tarfile.GNU_FORMAT))
+    except Exception as e:
+        shutil.rmtree(tarfile_dir)
+        tty.die(str(e))
 
     # get the sha256 checksum of the tarball
-    checksum = checksum_tarball(tarfile_path)
+    checksum = tarball.hexdigest()
 
     # add sha256 checksum to spec.yaml
     spec_dict = {}
@@ -360,6 +651,9 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     buildinfo = {}
     buildinfo['relative_prefix'] = os.path.relpath(
         spec.prefix, spack.store.layout.root)
+    buildinfo['compression'] = fmt
+    if blobs:
+        buildinfo['blobs'] = True
     spec_dict['buildinfo'] = buildinfo
     spec_dict['full_hash'] = spec.full_hash()
 
@@ -373,16 +667,14 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     # sign the tarball and spec file with gpg
     if not unsigned:
         sign_tarball(key, force, specfile_path)
-    # put tarball, spec and signature files in .spack archive
-    with closing(tarfile.open(spackfile_path, 'w')) as tar:
-        tar.add(name='%s' % tarfile_path, arcname='%s' % tarfile_name)
+    # add spec and signature files to the .spack archive
+    with closing(tarfile.open(spackfile_path, 'a')) as tar:
         tar.add(name='%s' % specfile_path, arcname='%s' % specfile_name)
         if not unsigned:
             tar.add(name='%s.asc' % specfile_path,
                     arcname='%s.asc' % specfile_name)
 
     # cleanup file moved to archive
-    os.remove(tarfile_path)
     if not unsigned:
         os.remove('%s.asc' % specfile_path)
 
@@ -393,64 +685,241 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     return None
 
 
-def download_tarball(spec):
-    """
-    Download binary tarball for given package into stage area
-    Return True if successful
+def tarball_download_info(spec):
+    """Where to download the binary package of ``spec`` from, and to.
+
+    Returns:
+        (tuple): URLs of the ``.spack`` file on each mirror, in order,
+            and the path in the stage area where it is saved
     """
     mirrors = spack.config.get('mirrors')
     if len(mirrors) == 0:
         tty.die("Please add a spack mirror to allow " +
                 "download of pre-compiled packages.")
     tarball = tarball_path_name(spec, '.spack')
-    for mirror_name, mirror_url in mirrors.items():
-        url = mirror_url + '/' + _build_cache_relative_path + '/' + tarball
-        # stage the tarball into standard place
-        stage = Stage(url, name="build_cache", keep=True)
-        try:
-            stage.fetch()
-            return stage.save_filename
-        except fs.FetchError:
-            continue
-    return None
+    urls = [mirror_url + '/' + _build_cache_relative_path + '/' + tarball
+            for mirror_url in mirrors.values()]
+    return urls, _download_path(urls[0])
+
 
+def _download_path(url):
+    """Path of the file downloaded from ``url`` in the build_cache stage."""
+    stage = Stage(url, name="build_cache", keep=True)
+    stage.create()
+    return stage.save_filename
 
-def make_package_relative(workdir, prefix, allow_root):
+
+def download_tarball(spec):
     """
-    Change paths in binaries to relative paths. Change absolute symlinks
-    to relative symlinks.
+    Download binary tarball for given package into stage area
+    Return the path to the tarball, or None if it could not be downloaded
     """
-    buildinfo = read_buildinfo_file(workdir)
-    old_path = buildinfo['buildpath']
-    orig_path_names = list()
-    cur_path_names = list()
-    for filename in buildinfo['relocate_binaries']:
-        orig_path_names.append(os.path.join(prefix, filename))
-        cur_path_names.append(os.path.join(workdir, filename))
-    relocate.make_binary_relative(cur_path_names, orig_path_names,
-                                  old_path, allow_root)
-    orig_path_names = list()
-    cur_path_names = list()
-    for filename in buildinfo.get('relocate_links', []):
-        orig_path_names.append(os.path.join(prefix, filename))
-        cur_path_names.append(os.path.join(workdir, filename))
-    relocate.make_link_relative(cur_path_names, orig_path_names)
+    urls, path = tarball_download_info(spec)
+    if os.path.exists(path):
+        tty.msg("Already downloaded %s" % path)
+        return path
 
+    tty.msg("Fetching %s" % urls[0])
+    try:
+        download_with_retries(urls, path)
+        return path
+    except DownloadError as e:
+        tty.debug(e)
+        return None
 
-def make_package_placeholder(workdir, prefix, allow_root):
+
+def download_tarballs(specs):
+    """Download the binary packages of many specs concurrently.
+
+    Yields lists of ``(spec, path)`` tuples as soon as tarballs are
+    downloaded, so that they can be extracted while the others download.
+    ``path`` is None if the tarball could not be downloaded from any
+    mirror.  Closing the generator early, e.g. after an error, drops the
+    downloads that did not start yet.
     """
-    Change paths in binaries to placeholder paths
+    downloading = {}
+    with DownloadManager() as downloads:
+        downloaded = []
+        for spec in specs:
+            urls, path = tarball_download_info(spec)
+            if os.path.exists(path):
+                downloaded.append((spec, path))
+            else:
+                downloading[spec.dag_hash()] = spec
+                downloads.add(spec.dag_hash(), urls, path)
+
+        if downloaded:
+            yield downloaded
+
+        while downloads.pending:
+            batch = []
+            for key, path, error in downloads.wait():
+                if error is not None:
+                    tty.debug(error)
+                    path = None
+                batch.append((downloading[key], path))
+            yield batch
+
+
+def relocate_files(function, path_lists, *args):
+    """Apply a relocation function to files, in parallel if there are many.
+
+    The files are split among up to one process per core.  Each process
+    relocates its files one at a time, so that it can report every file
+    that still contains the install root.
+
+    Arguments:
+        function: relocation function from ``spack.relocate``, which takes
+            one or more lists of paths followed by ``args``
+        path_lists (list): lists of paths for ``function``, all of the same
+            length
+        args: remaining arguments for ``function``
+
+    Raises:
+        InstallRootStringException: for the first file that still contains
+            the install root after relocation
     """
-    buildinfo = read_buildinfo_file(workdir)
-    cur_path_names = list()
-    for filename in buildinfo['relocate_binaries']:
-        cur_path_names.append(os.path.join(workdir, filename))
-    relocate.make_binary_placeholder(cur_path_names, allow_root)
+    path_lists = [list(paths) for paths in path_lists]
+    args = list(args)
+
+    def relocate_batch(batch):
+        function(*([[paths[i] for i in batch] for paths in path_lists] +
+                   args))
+
+    nfiles = len(path_lists[0])
+    nprocs = min(multiprocessing.cpu_count(),
+                 nfiles // relocation_batch_size)
+    if nprocs <= 1:
+        relocate_batch(range(nfiles))
+        return
 
-    cur_path_names = list()
-    for filename in buildinfo.get('relocate_links', []):
-        cur_path_names.append(os.path.join(workdir, filename))
-    relocate.make_link_placeholder(cur_path_names, workdir, prefix)
+    def relocate_batch_in_child(batch):
+        errors = []
+        for n, i in enumerate(batch):
+            try:
+                relocate_batch([i])
+            except relocate.InstallRootStringException as e:
+                errors.append((i, e.file_path, e.root_path))
+            except BaseException:
+                # Other errors, including tty.die(), are reported by
+                # relocating the rest of the batch in the parent
+                return errors, batch[n:]
+        return errors, []
+
+    batches = [list(range(i, nfiles, nprocs)) for i in range(nprocs)]
+    errors = []
+    for batch_errors, rest in mp.parmap(relocate_batch_in_child, batches,
+                                        fallback=lambda b: ([], b)):
+        errors.extend(batch_errors)
+        if rest:
+            relocate_batch(rest)
+
+    if errors:
+        errors.sort()
+        for _, file_path, root_path in errors:
+            tty.debug('%s contains %s after relocation' %
+                      (file_path, root_path))
+        _, file_path, root_path = errors[0]
+        raise relocate.InstallRootStringException(file_path, root_path)
+
+
+def add_prefix_to_tarball(tar, prefix, buildinfo, allow_root, blob_dir=None):
+    """
+    Add the files of an install prefix to an open tarball, along with the
+    buildinfo file used to relocate them.
+
+    Files are read straight from the prefix. When RPATHs are made
+    relative, only the binaries that are changed are copied first, to a
+    temporary directory. Absolute links into the install tree are made
+    relative, or point to the placeholder of the install root.
+
+    If ``blob_dir`` is given, regular files of at least ``blob_min_size``
+    bytes are added to the blob store there instead, and listed in a
+    manifest at the root of the tarball.
+    """
+    binaries = buildinfo['relocate_binaries']
+    orig_path_names = [os.path.join(prefix, f) for f in binaries]
+    sources = {}
+    manifest = {}
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        if buildinfo['relative_rpaths']:
+            cur_path_names = []
+            for filename in binaries:
+                cur_path = os.path.join(tmpdir, filename)
+                mkdirp(os.path.dirname(cur_path))
+                shutil.copy2(os.path.join(prefix, filename), cur_path)
+                cur_path_names.append(cur_path)
+                sources[filename] = cur_path
+            relocate_files(relocate.make_binary_relative,
+                           [cur_path_names, orig_path_names],
+                           buildinfo['buildpath'], allow_root)
+            get_link_source = relocate.get_relative_link_source
+        else:
+            relocate_files(relocate.make_binary_placeholder,
+                           [orig_path_names], allow_root)
+            get_link_source = relocate.get_placeholder_link_source
+
+        link_sources = dict(
+            (f, get_link_source(os.path.join(prefix, f)))
+            for f in buildinfo['relocate_links'])
+
+        arcroot = os.path.basename(prefix)
+        buildinfo_path = os.path.relpath(buildinfo_file_name(prefix), prefix)
+
+        def add_member(path_name):
+            rel_path_name = os.path.relpath(path_name, prefix)
+            if rel_path_name == buildinfo_path:
+                return
+            arcname = os.path.normpath(os.path.join(arcroot, rel_path_name))
+            source = sources.get(rel_path_name, path_name)
+            info = tar.gettarinfo(source, arcname)
+            if info.islnk():
+                # store hard links as copies, so that no file is
+                # relocated twice
+                info.type = tarfile.REGTYPE
+                info.linkname = ''
+                info.size = os.stat(source).st_size
+            if info.issym():
+                info.linkname = link_sources.get(rel_path_name,
+                                                 info.linkname)
+            if info.isreg():
+                if blob_dir and info.size >= blob_min_size:
+                    manifest[rel_path_name] = {
+                        'sha256': add_blob(source, blob_dir),
+                        'mode': info.mode,
+                    }
+                    return
+                with open(source, 'rb') as f:
+                    tar.addfile(info, f)
+            else:
+                tar.addfile(info)
+
+        for root, dirs, files in os.walk(prefix):
+            dirs.sort()
+            add_member(root)
+            # links to directories are not walked into
+            links = [d for d in dirs if os.path.islink(os.path.join(root, d))]
+            for filename in sorted(files + links):
+                add_member(os.path.join(root, filename))
+
+        data = syaml.dump(buildinfo, default_flow_style=True).encode('utf-8')
+        info = tarfile.TarInfo(os.path.join(arcroot, buildinfo_path))
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0o644
+        tar.addfile(info, io.BytesIO(data))
+
+        if blob_dir:
+            data = json.dumps(manifest, sort_keys=True).encode('utf-8')
+            info = tarfile.TarInfo(_blob_manifest_name)
+            info.size = len(data)
+            info.mtime = time.time()
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+    finally:
+        shutil.rmtree(tmpdir)
 
 
 def relocate_package(workdir, allow_root):
@@ -472,7 +941,9 @@ def relocate_package(workdir, allow_root):
         # Don't add backup files generated by filter_file during install step.
         if not path_name.endswith('~'):
             path_names.add(path_name)
-    relocate.relocate_text(path_names, old_path, new_path)
+    relocate_files(relocate.relocate_text, [sorted(path_names)],
+                   old_path, new_path,
+                   buildinfo.get('spackprefix'), spack.paths.prefix)
     # If the binary files in the package were not edited to use
     # relative RPATHs, then the RPATHs need to be relocated
     if not rel:
@@ -480,7 +951,8 @@ def relocate_package(workdir, allow_root):
         for filename in buildinfo['relocate_binaries']:
             path_name = os.path.join(workdir, filename)
             path_names.add(path_name)
-        relocate.relocate_binary(path_names, old_path, new_path, allow_root)
+        relocate_files(relocate.relocate_binary, [sorted(path_names)],
+                       old_path, new_path, allow_root)
         path_names = set()
         for filename in buildinfo.get('relocate_links', []):
             path_name = os.path.join(workdir, filename)
@@ -493,49 +965,157 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
     """
     extract binary tarball for given package into install area
     """
-    if os.path.exists(spec.prefix):
-        if force:
-            shutil.rmtree(spec.prefix)
-        else:
-            raise NoOverwriteException(str(spec.prefix))
+    error = extract_tarballs(
+        [(spec, filename)], allow_root, unsigned, force)[0]
+    if error is not None:
+        raise error
 
-    tmpdir = tempfile.mkdtemp()
-    stagepath = os.path.dirname(filename)
-    spackfile_name = tarball_name(spec, '.spack')
-    spackfile_path = os.path.join(stagepath, spackfile_name)
-    tarfile_name = tarball_name(spec, '.tar.gz')
-    tarfile_path = os.path.join(tmpdir, tarfile_name)
-    specfile_name = tarball_name(spec, '.spec.yaml')
-    specfile_path = os.path.join(tmpdir, specfile_name)
 
-    with closing(tarfile.open(spackfile_path, 'r')) as tar:
-        tar.extractall(tmpdir)
-    if not unsigned:
-        if os.path.exists('%s.asc' % specfile_path):
+def extract_tarballs(tarballs, allow_root=False, unsigned=False,
+                     force=False):
+    """
+    Extract the binary tarballs of several packages into the install area.
+
+    The package tarballs are copied out of the ``.spack`` files while
+    their checksums are computed, so that they are read only once. The
+    signatures of all the packages are then verified at the same time,
+    and the packages are extracted and relocated concurrently, with up to
+    one process per core.
+
+    Arguments:
+        tarballs (list): ``(spec, path to the .spack file)`` tuples
+        allow_root (bool): allow the install root in relocated binaries
+        unsigned (bool): don't verify signatures
+        force (bool): replace packages that are already installed
+
+    Returns:
+        (list): for each package, the error that prevented installing it,
+            or None if it was installed
+    """
+    tarballs = list(tarballs)
+    errors = [None] * len(tarballs)
+    unpacked = []
+    try:
+        for i, (spec, filename) in enumerate(tarballs):
             try:
-                Gpg.verify('%s.asc' % specfile_path, specfile_path)
+                if os.path.exists(spec.prefix):
+                    if force:
+                        shutil.rmtree(spec.prefix)
+                    else:
+                        raise NoOverwriteException(str(spec.prefix))
+                tmpdir = tempfile.mkdtemp()
+                checksums = {}
+                unpacked.append((i, tmpdir, checksums))
+                checksums.update(_unpack_spackfile(filename, tmpdir))
             except Exception as e:
-                shutil.rmtree(tmpdir)
-                tty.die(str(e))
+                errors[i] = e
+
+        if not unsigned:
+            _verify_signatures(tarballs, unpacked, errors)
+
+        work = [(i, tmpdir, checksums) for i, tmpdir, checksums in unpacked
+                if errors[i] is None]
+
+        def extract(item):
+            i, tmpdir, checksums = item
+            _extract_verified(tarballs[i][0], tmpdir, checksums, allow_root)
+
+        nprocs = min(multiprocessing.cpu_count(), len(work))
+        if nprocs <= 1:
+            for item in work:
+                try:
+                    extract(item)
+                except Exception as e:
+                    errors[item[0]] = e
+            return errors
+
+        def extract_batch_in_child(batch):
+            results = []
+            for item in batch:
+                error = None
+                try:
+                    extract(item)
+                except BaseException as e:
+                    error = _picklable_error(e)
+                results.append((item[0], error))
+            return results
+
+        batches = [work[n::nprocs] for n in range(nprocs)]
+        for results in mp.parmap(extract_batch_in_child, batches):
+            for i, error in results:
+                errors[i] = error
+        return errors
+    finally:
+        for _, tmpdir, _ in unpacked:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _unpack_spackfile(path, tmpdir):
+    """
+    Copy the files of a ``.spack`` archive to ``tmpdir``.
+
+    Returns:
+        (dict): sha256 checksums of the files, by name, computed as they
+            are written
+    """
+    checksums = {}
+    with closing(tarfile.open(path, 'r')) as tar:
+        for member in tar:
+            if not member.isfile() or \
+                    os.path.basename(member.name) != member.name:
+                tty.debug('Skipping %s in %s' % (member.name, path))
+                continue
+            with open(os.path.join(tmpdir, member.name), 'wb') as f:
+                dst = ChecksummedFile(f)
+                shutil.copyfileobj(tar.extractfile(member), dst, 1 << 20)
+            checksums[member.name] = dst.hexdigest()
+    return checksums
+
+
+def _verify_signatures(tarballs, unpacked, errors):
+    """Verify the signatures of the spec files of unpacked packages, all
+    at once, and record the packages that fail."""
+    to_verify = []
+    for i, tmpdir, _ in unpacked:
+        if errors[i] is not None:
+            continue
+        specfile_path = os.path.join(
+            tmpdir, tarball_name(tarballs[i][0], '.spec.yaml'))
+        if os.path.exists('%s.asc' % specfile_path):
+            to_verify.append((i, ('%s.asc' % specfile_path, specfile_path)))
         else:
-            shutil.rmtree(tmpdir)
-            raise NoVerifyException(
+            errors[i] = NoVerifyException(
                 "Package spec file failed signature verification.\n"
                 "Use spack buildcache keys to download "
                 "and install a key for verification from the mirror.")
-    # get the sha256 checksum of the tarball
-    checksum = checksum_tarball(tarfile_path)
 
-    # get the sha256 checksum recorded at creation
-    spec_dict = {}
+    results = Gpg.verify_all([pair for _, pair in to_verify])
+    for (i, _), error in zip(to_verify, results):
+        if error is not None:
+            errors[i] = NoVerifyException(str(error))
+
+
+def _extract_verified(spec, tmpdir, checksums, allow_root):
+    """
+    Extract a package whose ``.spack`` file was unpacked into ``tmpdir``,
+    once its spec file is verified, and relocate it into its prefix.
+    """
+    specfile_path = os.path.join(tmpdir, tarball_name(spec, '.spec.yaml'))
     with open(specfile_path, 'r') as inputfile:
-        content = inputfile.read()
-        spec_dict = syaml.load(content)
-    bchecksum = spec_dict['binary_cache_checksum']
+        spec_dict = syaml.load(inputfile.read())
+
+    # build caches without a recorded compression use gzip
+    buildinfo = spec_dict.get('buildinfo', {})
+    fmt = buildinfo.get('compression', 'gzip')
+    if fmt not in tarball_compressions:
+        raise spack.error.SpackError(
+            'Package tarball uses an unknown compression: %s' % fmt)
+    tarfile_name = _tarfile_name(spec, fmt, buildinfo.get('blobs', False))
+    tarfile_path = os.path.join(tmpdir, tarfile_name)
 
     # if the checksums don't match don't install
-    if bchecksum['hash'] != checksum:
-        shutil.rmtree(tmpdir)
+    bchecksum = spec_dict['binary_cache_checksum']
+    if bchecksum['hash'] != checksums.get(tarfile_name):
         raise NoChecksumException(
             "Package tarball failed checksum verification.\n"
             "It cannot be installed.")
@@ -543,40 +1123,45 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
     new_relative_prefix = str(os.path.relpath(spec.prefix,
                                               spack.store.layout.root))
     # if the original relative prefix is in the spec file use it
-    buildinfo = spec_dict.get('buildinfo', {})
     old_relative_prefix = buildinfo.get('relative_prefix', new_relative_prefix)
     # if the original relative prefix and new relative prefix differ the
     # directory layout has changed and the  buildcache cannot be installed
     if old_relative_prefix != new_relative_prefix:
-        shutil.rmtree(tmpdir)
         msg = "Package tarball was created from an install "
         msg += "prefix with a different directory layout.\n"
         msg += "It cannot be relocated."
         raise NewLayoutException(msg)
 
     # extract the tarball in a temp directory
-    with closing(tarfile.open(tarfile_path, 'r')) as tar:
+    with open_tarball(tarfile_path, fmt) as tar:
         tar.extractall(path=tmpdir)
+    os.remove(tarfile_path)
     # the base of the install prefix is used when creating the tarball
     # so the pathname should be the same now that the directory layout
     # is confirmed
     workdir = os.path.join(tmpdir, os.path.basename(spec.prefix))
 
-    # cleanup
-    os.remove(tarfile_path)
-    os.remove(specfile_path)
+    # the manifest comes from the verified tarball, and blobs are
+    # checked against it as they are written
+    manifest_path = os.path.join(tmpdir, _blob_manifest_name)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            restore_blobs(workdir, json.load(f))
+    relocate_package(workdir, allow_root)
 
-    try:
-        relocate_package(workdir, allow_root)
-    except Exception as e:
-        shutil.rmtree(workdir)
-        tty.die(str(e))
     # Delay creating spec.prefix until verification is complete
     # and any relocation has been done.
-    else:
-        install_tree(workdir, spec.prefix, symlinks=True)
-    finally:
-        shutil.rmtree(tmpdir)
+    install_tree(workdir, spec.prefix, symlinks=True)
+
+
+def _picklable_error(error):
+    """Return an error that can be sent to the parent of a process."""
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return spack.error.SpackError(
+            '{0}: {1}'.format(type(error).__name__, str(error)))
 
 
 #: Internal cache for get_specs
@@ -598,9 +1183,19 @@ def get_specs(force=False):
         tty.warn("No Spack mirrors are currently configured")
         return {}
 
+    _cached_specs = []
     path = str(spack.architecture.sys_type())
     urls = set()
     for mirror_name, mirror_url in mirrors.items():
+        # Specs on remote mirrors are only read for this platform
+        arch = None if mirror_url.startswith('file') else path
+        if not _local_index_is_stale(mirror_url):
+            index_specs = read_index(mirror_url, arch, force)
+            if index_specs is not None:
+                _cached_specs.extend(index_specs)
+                continue
+
+        # Mirrors without an index are searched for spec.yaml files
         if mirror_url.startswith('file'):
             mirror = mirror_url.replace('file://', '') + "/" + _build_cache_relative_path
             tty.msg("Finding buildcaches in %s" % mirror)
@@ -617,27 +1212,135 @@ def get_specs(force=False):
                 if re.search("spec.yaml", link) and re.search(path, link):
                     urls.add(link)
 
-    _cached_specs = []
-    for link in urls:
-        with Stage(link, name="build_cache", keep=True) as stage:
-            if force and os.path.exists(stage.save_filename):
-                os.remove(stage.save_filename)
-            if not os.path.exists(stage.save_filename):
-                try:
-                    stage.fetch()
-                except fs.FetchError:
-                    continue
-            with open(stage.save_filename, 'r') as f:
-                # read the spec from the build cache file. All specs
-                # in build caches are concrete (as they are built) so
-                # we need to mark this spec concrete on read-in.
-                spec = Spec.from_yaml(f)
-                spec._mark_concrete()
-                _cached_specs.append(spec)
+    # Download the spec.yaml files concurrently, and read them as they come
+    with DownloadManager() as downloads:
+        for link in urls:
+            path = _download_path(link)
+            if force and os.path.exists(path):
+                os.remove(path)
+            if os.path.exists(path):
+                _cached_specs.append(_read_spec_file(path))
+            else:
+                downloads.add(link, [link], path)
+
+        for link, path, error in downloads.as_completed():
+            if error is None:
+                _cached_specs.append(_read_spec_file(path))
+            else:
+                tty.debug(error)
 
     return _cached_specs
 
 
+def _local_index_is_stale(mirror_url):
+    """Whether the build cache of a local mirror has spec.yaml files newer
+    than its index, e.g. after ``buildcache create --no-rebuild-index``.
+    The index of a remote mirror is always trusted."""
+    if not mirror_url.startswith('file'):
+        return False
+
+    build_cache_dir = build_cache_directory(mirror_url.replace('file://', ''))
+    try:
+        index_mtime = os.path.getmtime(
+            os.path.join(build_cache_dir, _index_file_name))
+        names = os.listdir(build_cache_dir)
+    except OSError:
+        return False
+
+    for name in names:
+        if name.endswith('.spec.yaml') and index_mtime < os.path.getmtime(
+                os.path.join(build_cache_dir, name)):
+            tty.debug('%s is newer than the build cache index' % name)
+            return True
+    return False
+
+
+def _read_spec_file(path):
+    with open(path, 'r') as f:
+        # read the spec from the build cache file. All specs
+        # in build caches are concrete (as they are built) so
+        # we need to mark this spec concrete on read-in.
+        spec = Spec.from_yaml(f)
+        spec._mark_concrete()
+        return spec
+
+
+def read_index(mirror_url, arch=None, force=False):
+    """
+    Read the specs in the index of the build cache on a mirror.
+
+    The index is kept in the misc_cache, and is only downloaded again when
+    its hash on the mirror changes, or if ``force`` is True.
+
+    Arguments:
+        mirror_url (str): URL of the mirror
+        arch (str): only return specs for this platform, if given
+        force (bool): download the index even if it is in the cache
+
+    Returns:
+        (list): concrete specs in the index, or None if the mirror has no
+            valid index
+    """
+    index = _read_index_json(mirror_url, force)
+    if index is None:
+        return None
+    specs_by_hash = spack.environment.read_concrete_specs(index['nodes'])
+
+    specs = []
+    for dag_hash, entry in sorted(index['specs'].items()):
+        if arch and not re.search(arch, entry['spec_yaml']):
+            continue
+        # All specs in build caches are concrete (as they are built)
+        spec = specs_by_hash[dag_hash]
+        spec._mark_concrete()
+        specs.append(spec)
+    return specs
+
+
+def _read_index_json(mirror_url, force=False):
+    """Contents of the index of the build cache on a mirror, through the
+    misc_cache (see ``read_index()``), or None if there is no valid index.
+    """
+    index_url = '/'.join([mirror_url, _build_cache_relative_path,
+                          _index_file_name])
+    try:
+        index_hash = read_from_url(
+            '/'.join([mirror_url, _build_cache_relative_path,
+                      _index_hash_file_name])).strip()
+    except Exception as e:
+        tty.debug('No build cache index on %s' % mirror_url, e)
+        return None
+
+    cache = spack.caches.misc_cache
+    key = os.path.join(
+        'build_cache',
+        hashlib.sha256(mirror_url.encode('utf-8')).hexdigest() + '.json')
+
+    contents = None
+    if not force and cache.init_entry(key):
+        with cache.read_transaction(key) as f:
+            contents = f.read()
+        if _index_hash(contents) != index_hash:
+            contents = None
+
+    if contents is None:
+        tty.msg("Reading the index of buildcaches on %s" % mirror_url)
+        try:
+            contents = read_from_url(index_url)
+        except Exception as e:
+            tty.warn('Could not read %s' % index_url, str(e))
+            return None
+        if _index_hash(contents) != index_hash:
+            tty.warn('%s does not match its hash, ignoring it' % index_url)
+            return None
+
+        cache.init_entry(key)
+        with cache.write_transaction(key) as (old, new):
+            new.write(contents)
+
+    return sjson.load(contents)['buildcache']
+
+
 def get_keys(install=False, trust=False, force=False):
     """
     Get pgp public keys available on mirror
@@ -745,6 +1448,51 @@ def needs_rebuild(spec, mirror_url, rebuild_on_errors=False):
     return False
 
 
+def specs_needing_rebuild(specs, mirror_url, rebuild_on_errors=False):
+    """Return the specs that need to be rebuilt for a mirror.
+
+    The full hash of each spec is compared with the one in the index of
+    the build cache, which is read once for all the specs.  Specs that are
+    not in the index, and specs of mirrors without an index, are checked
+    with ``needs_rebuild()``, which reads their ``.spec.yaml`` file.
+    """
+    specs = list(specs)
+    for spec in specs:
+        if not spec.concrete:
+            raise ValueError('spec must be concrete to check against mirror')
+
+    index = _read_index_json(mirror_url)
+    if index is None:
+        return [spec for spec in specs
+                if needs_rebuild(spec, mirror_url, rebuild_on_errors)]
+
+    rebuilds = []
+    for spec in specs:
+        entry = index['specs'].get(spec.dag_hash())
+        if entry is None:
+            # The index may be out of date, so misses are confirmed, and
+            # errors treated, as without an index
+            if needs_rebuild(spec, mirror_url, rebuild_on_errors):
+                rebuilds.append(spec)
+            continue
+
+        pkg_full_hash = spec.full_hash()
+        if not entry.get('full_hash'):
+            reason = 'full_hash was missing from remote spec.yaml'
+        elif entry['full_hash'] != pkg_full_hash:
+            reason = 'hash mismatch, remote = {0}, local = {1}'.format(
+                entry['full_hash'], pkg_full_hash)
+        else:
+            continue
+
+        tty.msg('Rebuilding {0}, reason: {1}'.format(
+            spec.short_spec, reason))
+        tty.msg(spec.tree())
+        rebuilds.append(spec)
+
+    return rebuilds
+
+
 def check_specs_against_mirrors(mirrors, specs, output_file=None,
                                 rebuild_on_errors=False):
     """Check all the given specs against buildcaches on the given mirrors and
@@ -764,18 +1512,16 @@ def check_specs_against_mirrors(mirrors, specs, output_file=None,
     Returns: 1 if any spec was out-of-date on any mirror, 0 otherwise.
 
     """
+    specs = list(specs)
     rebuilds = {}
     for mirror_name, mirror_url in mirrors.items():
         tty.msg('Checking for built specs at %s' % mirror_url)
 
-        rebuild_list = []
-
-        for spec in specs:
-            if needs_rebuild(spec, mirror_url, rebuild_on_errors):
-                rebuild_list.append({
-                    'short_spec': spec.short_spec,
-                    'hash': spec.dag_hash()
-                })
+        rebuild_list = [{
+            'short_spec': spec.short_spec,
+            'hash': spec.dag_hash()
+        } for spec in specs_needing_rebuild(
+            specs, mirror_url, rebuild_on_errors)]
 
         if rebuild_list:
             rebuilds[mirror_url] = {
@@ -792,20 +1538,19 @@ def check_specs_against_mirrors(mirrors, specs, output_file=None,
 
 
 def _download_buildcache_entry(mirror_root, descriptions):
-    for description in descriptions:
-        url = os.path.join(mirror_root, description['url'])
-        path = description['path']
-        fail_if_missing = not description['required']
-
-        mkdirp(path)
-
-        stage = Stage(url, name="build_cache", path=path, keep=True)
-
-        try:
-            stage.fetch()
-        except fs.FetchError:
-            if fail_if_missing:
-                tty.error('Failed to download required url {0}'.format(url))
+    urls = [os.path.join(mirror_root, d['url']) for d in descriptions]
+    with DownloadManager() as downloads:
+        for i, (url, description) in enumerate(zip(urls, descriptions)):
+            path = os.path.join(description['path'], os.path.basename(url))
+            downloads.add(i, [url], path)
+
+        for i, path, error in downloads.as_completed():
+            if error is None:
+                continue
+            tty.debug(error)
+            if descriptions[i]['required']:
+                tty.error('Failed to download required url {0}'.format(
+                    urls[i]))
                 return False
 
     return True
@@ -4,23 +4,34 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 """Caches used by Spack to store data"""
+import hashlib
 import os
+import threading
+import time
 
 import llnl.util.lang
+import llnl.util.tty as tty
 from llnl.util.filesystem import mkdirp
 
+import spack
+import spack.architecture
 import spack.paths
 import spack.config
 import spack.fetch_strategy
+import spack.repo
+import spack.spec
 import spack.util.file_cache
+import spack.util.spack_json as sjson
 from spack.util.path import canonicalize_path
+from spack.version import Version
 
 
 def _misc_cache():
     """The ``misc_cache`` is Spack's cache for small data.
 
     Currently the ``misc_cache`` stores indexes for virtual dependency
-    providers and for which packages provide which tags.
+    providers and for which packages provide which tags, and the
+    ``concretization_cache``.
     """
     path = spack.config.get('config:misc_cache')
     if not path:
@@ -34,18 +45,27 @@ def _misc_cache():
 misc_cache = llnl.util.lang.Singleton(_misc_cache)
 
 
+def _source_cache_path():
+    path = spack.config.get('config:source_cache')
+    if not path:
+        path = os.path.join(spack.paths.var_path, "cache")
+    return canonicalize_path(path)
+
+
 def _fetch_cache():
     """Filesystem cache of downloaded archives.
 
     This prevents Spack from repeatedly fetch the same files when
     building the same package different ways or multiple times.
     """
-    path = spack.config.get('config:source_cache')
-    if not path:
-        path = os.path.join(spack.paths.var_path, "cache")
-    path = canonicalize_path(path)
+    return spack.fetch_strategy.FsCache(_source_cache_path())
+
 
-    return spack.fetch_strategy.FsCache(path)
+def _git_cache():
+    """Mirrors of git repositories, in the ``git`` directory of the
+    ``source_cache``."""
+    return spack.fetch_strategy.GitCache(
+        os.path.join(_source_cache_path(), 'git'))
 
 
 class MirrorCache(object):
@@ -67,7 +87,379 @@ class MirrorCache(object):
             fetcher.archive(dst)
 
 
+class ConcretizationCache(object):
+    """Concrete specs for abstract specs, kept in the ``misc_cache``.
+
+    Entries are keyed by the abstract spec and a fingerprint of
+    everything else concretization depends on: the ``packages`` and
+    ``compilers`` configuration, the host architecture, the Spack
+    version, and the modification times of the package files in the
+    repositories.  Changing any of them makes old entries unreachable;
+    these, like entries that aren't used for a while, are evicted once
+    there are more than ``max_entries`` of them.
+
+    The size of the cache is set by ``config:concretization_cache``; a
+    size of 0 (the default) disables it.
+    """
+
+    #: Directory of the misc_cache with the entries
+    prefix = 'concretization'
+
+    def __init__(self, file_cache, max_entries):
+        self.file_cache = file_cache
+        self.max_entries = max_entries
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def fingerprint(self):
+        """Hash of the state, other than the spec, that concretization
+        depends on."""
+        repos = []
+        for repo in spack.repo.path.repos:
+            repos.append([repo.root, sorted(
+                (name, sinfo.st_mtime)
+                for name, sinfo in repo._pkg_checker.items())])
+
+        data = {
+            'spack': spack.spack_version,
+            'arch': str(spack.architecture.sys_type()),
+            'packages': spack.config.get('packages'),
+            'compilers': spack.config.get('compilers'),
+            'repos': repos,
+        }
+        return hashlib.sha1(sjson.dump(data).encode('utf-8')).hexdigest()
+
+    def _key(self, spec, tests):
+        data = [str(spec), spec.namespace, tests, self.fingerprint()]
+        digest = hashlib.sha1(sjson.dump(data).encode('utf-8')).hexdigest()
+        return '{0}/{1}.yaml'.format(self.prefix, digest)
+
+    def get(self, spec, tests=False):
+        """Return the cached concrete spec for an abstract one, or None."""
+        key = self._key(spec, tests)
+        if not self.file_cache.init_entry(key):
+            return None
+
+        with self.file_cache.read_transaction(key) as f:
+            concrete = spack.spec.Spec.from_yaml(f)
+
+        # Mark the entry as recently used
+        os.utime(self.file_cache.cache_path(key), None)
+        return concrete
+
+    def put(self, spec, concrete, tests=False):
+        """Store the concrete spec obtained from an abstract one."""
+        key = self._key(spec, tests)
+        self.file_cache.init_entry(key)
+        with self.file_cache.write_transaction(key) as (old, new):
+            concrete.to_yaml(new)
+
+        self.evict()
+
+    def concretized(self, spec, tests=False):
+        """Return a concrete copy of an abstract spec, using the cache if
+        it is enabled.
+
+        Args:
+            spec (Spec): abstract spec, which is not modified
+            tests (list or bool): list of packages that will need test
+                dependencies, or True/False for test all/none
+        """
+        if self.enabled:
+            concrete = self.get(spec, tests)
+            if concrete is not None:
+                tty.debug('Using cached concretization of {0}'.format(spec))
+                return concrete
+
+        concrete = spec.copy(caches=False)
+        concrete.concretize(tests=tests)
+
+        if self.enabled:
+            self.put(spec, concrete, tests)
+        return concrete
+
+    def entries(self):
+        """Keys of the cached entries, most recently used first."""
+        cache_dir = self.file_cache.cache_path(self.prefix)
+        if not os.path.isdir(cache_dir):
+            return []
+
+        entries = []
+        for filename in os.listdir(cache_dir):
+            if filename.endswith('.yaml'):
+                path = os.path.join(cache_dir, filename)
+                entries.append((os.stat(path).st_mtime, filename))
+
+        return ['{0}/{1}'.format(self.prefix, filename)
+                for _, filename in sorted(entries, reverse=True)]
+
+    def evict(self):
+        """Remove the least recently used entries beyond ``max_entries``."""
+        for key in self.entries()[self.max_entries:]:
+            self.file_cache.remove(key)
+
+    def destroy(self):
+        """Remove all the entries."""
+        for key in self.entries():
+            self.file_cache.remove(key)
+
+
+def _concretization_cache():
+    """Cache of concretized specs, in the ``misc_cache``."""
+    max_entries = spack.config.get('config:concretization_cache') or 0
+    return ConcretizationCache(misc_cache, max_entries)
+
+
+#: Spack's cache of concretized specs
+concretization_cache = llnl.util.lang.Singleton(_concretization_cache)
+
+
+class RemoteVersionsCache(object):
+    """Versions of packages found on the web, kept in the ``misc_cache``.
+
+    Entries are used for ``ttl`` seconds after the search that found
+    them, as long as the URLs the package is searched from, its
+    ``list_url`` and its ``list_depth`` stay the same.  A ``ttl`` of 0
+    disables the cache.
+    """
+
+    #: Directory of the misc_cache with the entries
+    prefix = 'remote_versions'
+
+    def __init__(self, file_cache, ttl):
+        self.file_cache = file_cache
+        self.ttl = ttl
+
+    def _key(self, pkg):
+        return '{0}/{1}.json'.format(self.prefix, pkg.name)
+
+    def fingerprint(self, pkg):
+        """Hash of what the remote versions of a package are searched
+        from."""
+        data = [sorted(set(pkg.all_urls)), pkg.list_url, pkg.list_depth]
+        return hashlib.sha1(sjson.dump(data).encode('utf-8')).hexdigest()
+
+    def get(self, pkg):
+        """Return the versions of a package found recently, as a dict of
+        versions to URLs, or None."""
+        key = self._key(pkg)
+        if self.ttl <= 0 or not self.file_cache.init_entry(key):
+            return None
+
+        with self.file_cache.read_transaction(key) as f:
+            entry = sjson.load(f)
+        if (entry.get('fingerprint') != self.fingerprint(pkg) or
+                time.time() - entry.get('time', 0) > self.ttl):
+            return None
+        return dict((Version(v), url)
+                    for v, url in entry['versions'].items())
+
+    def put(self, pkg, versions):
+        """Store the versions of a package found on the web."""
+        key = self._key(pkg)
+        self.file_cache.init_entry(key)
+        with self.file_cache.write_transaction(key) as (old, new):
+            sjson.dump({
+                'fingerprint': self.fingerprint(pkg),
+                'time': time.time(),
+                'versions': dict(
+                    (str(v), url) for v, url in versions.items()),
+            }, new)
+
+
+def _remote_versions_cache():
+    """Cache of the versions of packages found on the web."""
+    ttl = spack.config.get('config:remote_versions_ttl', 3600)
+    return RemoteVersionsCache(misc_cache, ttl)
+
+
+#: Spack's cache of the versions of packages found on the web
+remote_versions_cache = llnl.util.lang.Singleton(_remote_versions_cache)
+
+
+class ChecksumLedger(object):
+    """Archives whose checksum was verified, kept in the ``misc_cache``.
+
+    An archive is recorded with its size, modification time and inode
+    once its checksum matched an expected digest.  It is not read again to
+    check it against that digest as long as these stay the same, e.g. when
+    a package is staged again from an archive in the ``source_cache``.
+    Only the ``max_entries`` most recently used archives are kept.
+    """
+
+    #: Directory of the misc_cache with the entries
+    prefix = 'checksums'
+
+    def __init__(self, file_cache, max_entries=1000):
+        self.file_cache = file_cache
+        self.max_entries = max_entries
+
+        # archives of the resources of a package are checked in threads
+        self._lock = threading.Lock()
+
+    def _key(self, path):
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        return '{0}/{1}.json'.format(self.prefix, digest)
+
+    def _entry(self, path):
+        """Real path and stat of an archive, as they are recorded."""
+        path = os.path.realpath(path)
+        sinfo = os.stat(path)
+        return path, [sinfo.st_size, sinfo.st_mtime, sinfo.st_ino]
+
+    def _read(self, key):
+        with self.file_cache.read_transaction(key) as f:
+            return sjson.load(f)
+
+    def verified(self, path, digest):
+        """Whether an archive was verified against a digest, and has not
+        changed since."""
+        with self._lock:
+            path, stat = self._entry(path)
+            key = self._key(path)
+            if not self.file_cache.init_entry(key):
+                return False
+
+            entry = self._read(key)
+            if (entry.get('path') != path or entry.get('stat') != stat or
+                    digest not in entry.get('digests', [])):
+                return False
+
+            # Mark the entry as recently used
+            os.utime(self.file_cache.cache_path(key), None)
+            return True
+
+    def add(self, path, digest):
+        """Record that an archive matches a digest."""
+        with self._lock:
+            path, stat = self._entry(path)
+            key = self._key(path)
+            digests = []
+            if self.file_cache.init_entry(key):
+                entry = self._read(key)
+                if entry.get('path') == path and entry.get('stat') == stat:
+                    digests = entry.get('digests', [])
+
+            if digest not in digests:
+                digests.append(digest)
+            with self.file_cache.write_transaction(key) as (old, new):
+                sjson.dump({
+                    'path': path, 'stat': stat, 'digests': digests}, new)
+
+            self.evict()
+
+    def entries(self):
+        """Keys of the entries, most recently used first."""
+        cache_dir = self.file_cache.cache_path(self.prefix)
+        if not os.path.isdir(cache_dir):
+            return []
+
+        entries = []
+        for filename in os.listdir(cache_dir):
+            if filename.endswith('.json'):
+                path = os.path.join(cache_dir, filename)
+                entries.append((os.stat(path).st_mtime, filename))
+
+        return ['{0}/{1}'.format(self.prefix, filename)
+                for _, filename in sorted(entries, reverse=True)]
+
+    def evict(self):
+        """Remove the least recently used entries beyond ``max_entries``."""
+        for key in self.entries()[self.max_entries:]:
+            self.file_cache.remove(key)
+
+
+def _checksum_ledger():
+    """Archives whose checksum was verified, in the ``misc_cache``."""
+    return ChecksumLedger(misc_cache)
+
+
+#: Spack's ledger of archives whose checksum was verified
+checksum_ledger = llnl.util.lang.Singleton(_checksum_ledger)
+
+
+class PageCache(object):
+    """Web pages read by the spider, kept in the ``misc_cache``.
+
+    Pages are stored with their ETag and Last-Modified date, so that
+    they are only downloaded again if they changed on the server.  Only
+    the ``max_entries`` most recently used pages are kept.
+    """
+
+    #: Directory of the misc_cache with the entries
+    prefix = 'web'
+
+    def __init__(self, file_cache, max_entries=1000):
+        self.file_cache = file_cache
+        self.max_entries = max_entries
+
+        # pages are read and stored by the threads of the spider
+        self._lock = threading.Lock()
+
+    def _key(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return '{0}/{1}.json'.format(self.prefix, digest)
+
+    def get(self, url):
+        """Return the entry of a page, as a dict, or None."""
+        with self._lock:
+            key = self._key(url)
+            if not self.file_cache.init_entry(key):
+                return None
+
+            with self.file_cache.read_transaction(key) as f:
+                entry = sjson.load(f)
+
+            # Mark the entry as recently used
+            os.utime(self.file_cache.cache_path(key), None)
+            return entry
+
+    def put(self, url, entry):
+        """Store the entry of a page."""
+        with self._lock:
+            key = self._key(url)
+            self.file_cache.init_entry(key)
+            with self.file_cache.write_transaction(key) as (old, new):
+                sjson.dump(entry, new)
+
+            self.evict()
+
+    def entries(self):
+        """Keys of the entries, most recently used first."""
+        cache_dir = self.file_cache.cache_path(self.prefix)
+        if not os.path.isdir(cache_dir):
+            return []
+
+        entries = []
+        for filename in os.listdir(cache_dir):
+            if filename.endswith('.json'):
+                path = os.path.join(cache_dir, filename)
+                entries.append((os.stat(path).st_mtime, filename))
+
+        return ['{0}/{1}'.format(self.prefix, filename)
+                for _, filename in sorted(entries, reverse=True)]
+
+    def evict(self):
+        """Remove the least recently used entries beyond ``max_entries``."""
+        for key in self.entries()[self.max_entries:]:
+            self.file_cache.remove(key)
+
+
+def _page_cache():
+    """Web pages read by the spider, in the ``misc_cache``."""
+    return PageCache(misc_cache)
+
+
+#: Spack's cache of the web pages read by the spider
+page_cache = llnl.util.lang.Singleton(_page_cache)
+
+
 #: Spack's local cache for downloaded source archives
 fetch_cache = llnl.util.lang.Singleton(_fetch_cache)
 
+#: Spack's local mirrors of git repositories
+git_cache = llnl.util.lang.Singleton(_git_cache)
+
 mirror_cache = None
@@ -16,6 +16,7 @@ from llnl.util.tty.colify import colify
 from llnl.util.tty.color import colorize
 from llnl.util.filesystem import working_dir
 
+import spack.caches
 import spack.config
 import spack.paths
 import spack.spec
@@ -121,10 +122,11 @@ def parse_specs(args, **kwargs):
 
     try:
         specs = spack.spec.parse(args)
-        for spec in specs:
-            if concretize:
-                spec.concretize(tests=tests)  # implies normalize
-            elif normalize:
+        if concretize:
+            cache = spack.caches.concretization_cache
+            specs = [cache.concretized(spec, tests) for spec in specs]
+        elif normalize:
+            for spec in specs:
                 spec.normalize(tests=tests)
 
         return specs
@@ -59,6 +59,14 @@ def setup_parser(subparser):
                                             "building package(s)")
     create.add_argument('-y', '--spec-yaml', default=None,
                         help='Create buildcache entry for spec from yaml file')
+    create.add_argument('--compression', default=None,
+                        choices=['gzip', 'pgzip', 'xz', 'zstd'],
+                        help="compression of the tarballs (default is " +
+                             "config:build_cache_compression)")
+    create.add_argument('--blobs', action='store_const', const=True,
+                        default=None,
+                        help="store large files in the blob store of the " +
+                             "build cache, once for all packages")
     create.add_argument(
         'packages', nargs=argparse.REMAINDER,
         help="specs of packages to create buildcache for")
@@ -335,7 +343,8 @@ def createtarball(args):
         tty.msg('creating binary cache file for package %s ' % spec.format())
         bindist.build_tarball(spec, outdir, args.force, args.rel,
                               args.unsigned, args.allow_root, signkey,
-                              not args.no_rebuild_index)
+                              not args.no_rebuild_index, args.compression,
+                              args.blobs)
 
 
 def installtarball(args):
@@ -346,32 +355,68 @@ def installtarball(args):
     pkgs = set(args.packages)
     matches = match_downloaded_specs(pkgs, args.multiple, args.force)
 
-    for match in matches:
-        install_tarball(match, args)
+    install_tarballs(matches, args)
 
 
 def install_tarball(spec, args):
-    s = Spec(spec)
+    install_tarballs([spec], args)
+
+
+def install_tarballs(specs, args):
+    """Install the binary packages of specs and of their link and run
+    dependencies.
+
+    All the tarballs are downloaded concurrently, and those that are
+    downloaded are verified and extracted together while the others are
+    still downloading.
+    """
+    to_install = []
+    for spec in specs:
+        _add_tarball_specs(Spec(spec), to_install, args)
+    if not to_install:
+        return
+
+    downloads = bindist.download_tarballs(to_install)
+    try:
+        for batch in downloads:
+            for spec, tarball in batch:
+                if not tarball:
+                    tty.die('Download of binary cache file for spec %s '
+                            'failed.' % spec.format())
+                tty.msg('Installing buildcache for spec %s' % spec.format())
+
+            errors = bindist.extract_tarballs(
+                batch, args.allow_root, args.unsigned, args.force)
+            for (spec, _), error in zip(batch, errors):
+                if error is None:
+                    spack.hooks.post_install(spec)
+
+            for (spec, _), error in zip(batch, errors):
+                if error is not None:
+                    tty.error('Failed to install %s' % spec.format())
+                    raise error
+    finally:
+        # after an error, this drops the downloads that did not start
+        downloads.close()
+        spack.store.store.reindex()
+
+
+def _add_tarball_specs(s, to_install, args):
+    """Add s and its link and run dependencies to the specs to install,
+    dependencies first."""
     if s.external or s.virtual:
-        tty.warn("Skipping external or virtual package %s" % spec.format())
+        tty.warn("Skipping external or virtual package %s" % s.format())
         return
     for d in s.dependencies(deptype=('link', 'run')):
         tty.msg("Installing buildcache for dependency spec %s" % d)
-        install_tarball(d, args)
-    package = spack.repo.get(spec)
+        _add_tarball_specs(d, to_install, args)
+    if any(s.dag_hash() == other.dag_hash() for other in to_install):
+        return
+    package = spack.repo.get(s)
     if s.concrete and package.installed and not args.force:
-        tty.warn("Package for spec %s already installed." % spec.format())
+        tty.warn("Package for spec %s already installed." % s.format())
     else:
-        tarball = bindist.download_tarball(spec)
-        if tarball:
-            tty.msg('Installing buildcache for spec %s' % spec.format())
-            bindist.extract_tarball(spec, tarball, args.allow_root,
-                                    args.unsigned, args.force)
-            spack.hooks.post_install(spec)
-            spack.store.store.reindex()
-        else:
-            tty.die('Download of binary cache file for spec %s failed.' %
-                    spec.format())
+        to_install.append(s)
 
 
 def listspecs(args):
@@ -37,6 +37,9 @@ def setup_parser(subparser):
     subparser.add_argument(
         '-m', '--misc-cache', action='store_true',
         help="remove long-lived caches, like the virtual package index")
+    subparser.add_argument(
+        '-c', '--concretization-cache', action='store_true',
+        help="remove cached concretized specs")
     subparser.add_argument(
         '-p', '--python-cache', action='store_true',
         help="remove .pyc, .pyo files and __pycache__ folders")
@@ -53,7 +56,7 @@ def setup_parser(subparser):
 def clean(parser, args):
     # If nothing was set, activate the default
     if not any([args.specs, args.stage, args.downloads, args.misc_cache,
-                args.python_cache]):
+                args.concretization_cache, args.python_cache]):
         args.stage = True
 
     # Then do the cleaning falling through the cases
@@ -77,6 +80,10 @@ def clean(parser, args):
         tty.msg('Removing cached information on repositories')
         spack.caches.misc_cache.destroy()
 
+    if args.concretization_cache and not args.misc_cache:
+        tty.msg('Removing cached concretized specs')
+        spack.caches.concretization_cache.destroy()
+
     if args.python_cache:
         tty.msg('Removing python cache files')
         for directory in [lib_path, var_path]:
@@ -3,6 +3,9 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+from __future__ import print_function
+
+import gc
 import os
 import re
 from datetime import datetime
@@ -11,7 +14,10 @@ from glob import glob
 import llnl.util.tty as tty
 from llnl.util.filesystem import working_dir
 
+import spack.environment as ev
 import spack.paths
+import spack.util.spack_json as sjson
+from spack.util.debug import peak_rss
 from spack.util.executable import which
 
 description = "debugging commands for troubleshooting Spack"
@@ -24,6 +30,12 @@ def setup_parser(subparser):
     sp.add_parser('create-db-tarball',
                   help="create a tarball of Spack's installation metadata")
 
+    lockfile_memory = sp.add_parser(
+        'lockfile-memory',
+        help="report the memory used to read the specs in a spack.lock")
+    lockfile_memory.add_argument(
+        'lockfile', help="path to an environment's spack.lock file")
+
 
 def _debug_tarball_suffix():
     now = datetime.now()
@@ -67,6 +79,8 @@ def create_db_tarball(args):
     wd = os.path.dirname(str(spack.store.root))
     with working_dir(wd):
         files = [spack.store.db._index_path]
+        if os.path.exists(spack.store.db._journal_path):
+            files.append(spack.store.db._journal_path)
         files += glob('%s/*/*/*/.spack/spec.yaml' % base)
         files = [os.path.relpath(f) for f in files]
 
@@ -78,6 +92,24 @@ def create_db_tarball(args):
     tty.msg('Created %s' % tarball_name)
 
 
+def lockfile_memory(args):
+    with open(args.lockfile) as f:
+        data = sjson.load(f)
+    json_specs = data['concrete_specs']
+
+    gc.collect()
+    before = peak_rss()
+    specs_by_hash = ev.read_concrete_specs(json_specs)
+    gc.collect()
+    after = peak_rss()
+
+    print('read %d specs from %s' % (len(specs_by_hash), args.lockfile))
+    print('peak RSS before reading specs: %10.1f MiB' % before)
+    print('peak RSS after reading specs:  %10.1f MiB' % after)
+    print('difference:                    %10.1f MiB' % (after - before))
+
+
 def debug(parser, args):
-    action = {'create-db-tarball': create_db_tarball}
+    action = {'create-db-tarball': create_db_tarball,
+              'lockfile-memory': lockfile_memory}
     action[args.debug_command](args)
@@ -39,7 +39,8 @@ def inverted_dependencies():
        actual dependents.
     """
     dag = {}
-    for pkg in spack.repo.path.all_packages():
+    for name in spack.repo.path.all_package_names():
+        pkg = spack.repo.path.get_pkg_metadata(name)
         dag.setdefault(pkg.name, set())
         for dep in pkg.dependencies:
             deps = [dep]
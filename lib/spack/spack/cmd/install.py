@@ -36,6 +36,7 @@ def update_kwargs_from_args(args, kwargs):
         'restage': not args.dont_restage,
         'install_source': args.install_source,
         'make_jobs': args.jobs,
+        'concurrent_builds': args.concurrent_builds,
         'verbose': args.verbose,
         'fake': args.fake,
         'dirty': args.dirty,
@@ -62,6 +63,11 @@ alternatively one can decide to install only the package or only
 the dependencies"""
     )
     arguments.add_common_arguments(subparser, ['jobs', 'install_status'])
+    subparser.add_argument(
+        '-p', '--concurrent-builds', action='store', type=int,
+        dest='concurrent_builds',
+        help="number of packages to build at the same time. the make jobs "
+        "are split among them")
     subparser.add_argument(
         '--overwrite', action='store_true',
         help="reinstall an existing spec, even if it has dependents")
@@ -227,6 +233,10 @@ def install(parser, args, **kwargs):
         if args.jobs <= 0:
             tty.die("The -j option must be a positive integer!")
 
+    if args.concurrent_builds is not None:
+        if args.concurrent_builds <= 0:
+            tty.die("The -p option must be a positive integer!")
+
     if args.no_checksum:
         spack.config.set('config:checksum', False, scope='command_line')
 
@@ -11,6 +11,7 @@ import sys
 import llnl.util.tty as tty
 
 import spack
+import spack.caches
 import spack.cmd
 import spack.cmd.common.arguments as arguments
 import spack.spec
@@ -59,7 +60,7 @@ def spec(parser, args):
         # With -y, just print YAML to output.
         if args.yaml:
             if spec.name in spack.repo.path or spec.virtual:
-                spec.concretize()
+                spec = spack.caches.concretization_cache.concretized(spec)
 
             # use write because to_yaml already has a newline.
             sys.stdout.write(spec.to_yaml())
@@ -73,5 +74,5 @@ def spec(parser, args):
         kwargs['hashes'] = args.long or args.very_long
         print("Concretized")
         print("--------------------------------")
-        spec.concretize()
+        spec = spack.caches.concretization_cache.concretized(spec)
         print(spec.tree(**kwargs))
@@ -8,6 +8,7 @@ from __future__ import print_function
 from llnl.util.tty.colify import colify
 import llnl.util.tty as tty
 
+import spack.package
 import spack.repo
 import sys
 
@@ -17,15 +18,41 @@ level = "long"
 
 
 def setup_parser(subparser):
-    subparser.add_argument('package', metavar='PACKAGE',
-                           help='package to list versions for')
     subparser.add_argument('-s', '--safe-only', action='store_true',
                            help='only list safe versions of the package')
+    subparser.add_argument(
+        '-a', '--all', action='store_true',
+        help='list new remote versions of all the packages in the repository')
+    subparser.add_argument(
+        '-j', '--jobs', type=int,
+        help='number of packages to search remote versions for at once')
+    subparser.add_argument(
+        '--refresh', action='store_true',
+        help='with several packages, search remote versions again, even '
+        'if found recently')
+    subparser.add_argument('packages', metavar='PACKAGE', nargs='*',
+                           help='package to list versions for')
 
 
 def versions(parser, args):
-    pkg = spack.repo.get(args.package)
+    if args.all:
+        names = spack.repo.all_package_names()
+    elif args.packages:
+        names = args.packages
+    else:
+        tty.die('versions requires a package name or --all')
+
+    if len(names) == 1 and not args.all:
+        package_versions(spack.repo.get(names[0]), args)
+        return
+
+    if args.safe_only:
+        tty.die('--safe-only can only be used with one package')
+    new_remote_versions([spack.repo.get(name) for name in names], args)
+
 
+def package_versions(pkg, args):
+    """List the safe and remote versions of one package."""
     if sys.stdout.isatty():
         tty.msg('Safe versions (already checksummed):')
 
@@ -58,3 +85,25 @@ def versions(parser, args):
                     pkg.name))
     else:
         colify(sorted(remote_versions, reverse=True), indent=2)
+
+
+def new_remote_versions(pkgs, args):
+    """Print the remote versions of many packages that are newer than
+    their safe versions, one line per package."""
+    if sys.stdout.isatty():
+        tty.msg('Searching remote versions of {0} packages'.format(
+            len(pkgs)))
+    fetched = spack.package.fetch_remote_versions(
+        pkgs, args.jobs, args.refresh)
+
+    for pkg in pkgs:
+        # develop and other branches sort above numeric versions
+        released = [v for v in pkg.versions
+                    if not v.isdevelop() and v.isnumeric()]
+        latest = max(released) if released else None
+        new_versions = sorted(
+            (v for v in fetched[pkg.name] if latest is None or v > latest),
+            reverse=True)
+        if new_versions:
+            print('{0}: {1}'.format(
+                pkg.name, ' '.join(str(v) for v in new_versions)))
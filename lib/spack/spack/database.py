@@ -19,15 +19,28 @@ as the authoritative database of packages in Spack.  This module
 provides a cache and a sanity checking mechanism for what is in the
 filesystem.
 
+The database is stored in two files.  ``index.json`` is a snapshot of
+all the install records, and ``index.journal`` has one line for each
+write transaction since the snapshot was taken, with the records that
+the transaction added, changed or removed.  Writers only append to the
+journal, and readers only replay the lines they have not seen yet, so
+the cost of an operation depends on what changed rather than on the
+size of the database.  Once the journal grows as large as the database,
+it is compacted into a new snapshot.
+
 """
 import datetime
+import errno
+import json
 import time
 import os
 import sys
 import socket
 import contextlib
+import uuid
 from six import string_types
 from six import iteritems
+from ordereddict_backport import OrderedDict
 
 from ruamel.yaml.error import MarkedYAMLError, YAMLError
 
@@ -51,7 +64,10 @@ from spack.util.lock import Lock, WriteTransaction, ReadTransaction, LockError
 _db_dirname = '.spack-db'
 
 # DB version.  This is stuck in the DB file to track changes in format.
-_db_version = Version('0.9.3')
+_db_version = Version('0.9.4')
+
+# Oldest DB version that can be read without reindexing.
+_db_min_version = Version('0.9.3')
 
 # Timeout for spack database locks in seconds
 _db_lock_timeout = 120
@@ -59,6 +75,27 @@ _db_lock_timeout = 120
 # Types of dependencies tracked by the database
 _tracked_deps = ('link', 'run')
 
+# The journal is compacted into a new snapshot once it has more records
+# than this, or than the database itself, whichever is larger
+_journal_min_compaction_size = 1000
+
+
+def _file_id(path, contents=True):
+    """Identify a file by inode and, optionally, by size and mtime.
+
+    Returns None if the file does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return None
+
+    if contents:
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+    return (st.st_dev, st.st_ino)
+
 
 def _now():
     """Returns the time since the epoch"""
@@ -135,6 +172,113 @@ class InstallRecord(object):
         return InstallRecord(spec, **d)
 
 
+class RecordIndex(object):
+    """Secondary indexes on the install records of a database.
+
+    Records are indexed by DAG hash under their package name, version,
+    compiler and architecture, and under whether they are installed and
+    explicit.  ``candidates()`` uses the indexes to rule out records that
+    cannot match a query, so that ``Spec.satisfies()`` only needs to be
+    called on the others.
+
+    Versions, compilers and architectures are grouped by their string
+    form.  All records in a group satisfy the same constraints on that
+    attribute, so a constraint is tested once per group rather than once
+    per record.
+
+    Args:
+        data (dict): map from DAG hash to ``InstallRecord`` to index
+    """
+
+    #: Spec attributes with an index, and how to get their group
+    grouped_attrs = ('versions', 'compiler', 'architecture')
+
+    def __init__(self, data):
+        self.specs = {}
+        self.by_name = {}
+        self.by_attr = dict((attr, {}) for attr in self.grouped_attrs)
+        self.installed = set()
+        self.explicit = set()
+        for key, rec in data.items():
+            self.add(key, rec)
+
+    def _entries(self, spec):
+        yield self.by_name, spec.name
+        for attr in self.grouped_attrs:
+            yield self.by_attr[attr], str(getattr(spec, attr))
+
+    def add(self, key, rec):
+        """Index the record ``rec``, whose DAG hash is ``key``."""
+        self.specs[key] = rec.spec
+        for index, value in self._entries(rec.spec):
+            index.setdefault(value, set()).add(key)
+        if rec.installed:
+            self.installed.add(key)
+        if rec.explicit:
+            self.explicit.add(key)
+
+    def discard(self, key):
+        """Remove the record with DAG hash ``key`` from the indexes."""
+        spec = self.specs.pop(key, None)
+        if spec is None:
+            return
+        for index, value in self._entries(spec):
+            group = index[value]
+            group.discard(key)
+            if not group:
+                del index[value]
+        self.installed.discard(key)
+        self.explicit.discard(key)
+
+    def candidates(self, query_spec=any, installed=any, explicit=any):
+        """DAG hashes of the records that may match a query.
+
+        Arguments are as for ``Database.query()``.  Returns None if the
+        query can't rule out any record.
+        """
+        keys = None
+
+        def restrict(subset):
+            return subset if keys is None else keys & subset
+
+        for flag, subset in ((installed, self.installed),
+                             (explicit, self.explicit)):
+            if flag is any:
+                continue
+            keys = restrict(subset if flag else set(self.specs) - subset)
+
+        if not isinstance(query_spec, spack.spec.Spec):
+            return keys
+
+        if query_spec.name:
+            # Records of packages no longer in the repo match by name too
+            names = set([query_spec.name])
+            if spack.repo.path.is_virtual(query_spec.name):
+                providers = spack.repo.path.providers_for(query_spec.name)
+                names.update(p.name for p in providers)
+            keys = restrict(set().union(
+                *[self.by_name.get(n, ()) for n in names]))
+
+        for attr in self.grouped_attrs:
+            constraint = getattr(query_spec, attr)
+            if not constraint or str(constraint) == ':':
+                continue
+
+            # With few candidates left, leave them to Spec.satisfies()
+            index = self.by_attr[attr]
+            if keys is not None and len(keys) <= len(index):
+                break
+
+            matching = set()
+            for group in index.values():
+                value = getattr(self.specs[next(iter(group))], attr)
+                if not value or value.satisfies(constraint):
+                    matching |= group
+            keys = restrict(matching)
+
+        return keys
+
+
 class Database(object):
 
     """Per-process lock objects for each install prefix."""
@@ -174,6 +318,7 @@ class Database(object):
         # Set up layout of database files within the db dir
         self._old_yaml_index_path = os.path.join(self._db_dir, 'index.yaml')
         self._index_path = os.path.join(self._db_dir, 'index.json')
+        self._journal_path = os.path.join(self._db_dir, 'index.journal')
         self._lock_path = os.path.join(self._db_dir, 'lock')
 
         # This is for other classes to use to lock prefix directories.
@@ -201,6 +346,22 @@ class Database(object):
         # whether there was an error at the start of a read transaction
         self._error = None
 
+        # State of the snapshot and journal as of the last read. The
+        # journal belongs to the snapshot with the same generation.
+        self._generation = None
+        self._snapshot_id = None
+        self._journal_id = None
+        self._journal_offset = None
+        self._journal_records = 0
+
+        # Keys of the records changed by the current write transaction,
+        # and whether it must write a whole new snapshot.
+        self._dirty = OrderedDict()
+        self._compact = False
+
+        # Secondary indexes for queries, built when first needed
+        self._index = None
+
     def write_transaction(self):
         """Get a write lock context manager for use in a `with` block."""
         return WriteTransaction(self.lock, self._read, self._write)
@@ -285,7 +446,8 @@ class Database(object):
         database = {
             'database': {
                 'installs': installs,
-                'version': str(_db_version)
+                'version': str(_db_version),
+                'generation': self._generation
             }
         }
 
@@ -371,14 +533,19 @@ class Database(object):
         check('version' in db, "No 'version' in YAML DB.")
 
         installs = db['installs']
+        self._generation = db.get('generation')
 
         # TODO: better version checking semantics.
         version = Version(db['version'])
         if version > _db_version:
             raise InvalidDatabaseVersionError(_db_version, version)
-        elif version < _db_version:
+        elif version < _db_min_version:
             self.reindex(spack.store.layout)
             installs = dict((k, v.to_dict()) for k, v in self._data.items())
+        elif version < _db_version:
+            # Readable as is, but older Spacks must not find a journal
+            # they would ignore next to it: the next write rewrites it.
+            self._compact = True
 
         def invalid_record(hash_key, error):
             msg = ("Invalid record in Spack database: "
@@ -427,6 +594,88 @@ class Database(object):
             rec.spec._mark_concrete()
 
         self._data = data
+        self._index = None
+
+    def _read_journal(self):
+        """Replay the journal records written since the last read.
+
+        Lines that are not newline-terminated were not completely written
+        (e.g. the writer died), so they are left for later.
+
+        Does not do any locking.
+        """
+        try:
+            f = open(self._journal_path, 'rb')
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self._journal_id = self._journal_offset = None
+            return
+
+        with f:
+            if self._journal_id is None:
+                # A journal left behind by an older snapshot only has
+                # records that are already in the snapshot.
+                header = f.readline()
+                if not header.endswith(b'\n') or self._read_journal_line(
+                        header).get('generation') != self._generation:
+                    self._journal_offset = None
+                    return
+                st = os.fstat(f.fileno())
+                self._journal_id = (st.st_dev, st.st_ino)
+                self._journal_offset = f.tell()
+            else:
+                f.seek(self._journal_offset)
+
+            tail = f.read()
+
+        end = tail.rfind(b'\n') + 1
+        for line in tail[:end].splitlines():
+            for entry in self._read_journal_line(line)['records']:
+                self._replay(*entry)
+                self._journal_records += 1
+        self._journal_offset += end
+
+    def _read_journal_line(self, line):
+        try:
+            return sjson.load(line.decode('utf-8'))
+        except Exception as e:
+            raise CorruptDatabaseError(
+                "error parsing database journal:", str(e))
+
+    def _replay(self, action, hash_key, rec=None):
+        """Apply one journal record to the in-memory database."""
+        if action == 'remove':
+            self._data.pop(hash_key, None)
+        elif hash_key in self._data:
+            # Specs are immutable, only the record's state changes.
+            spec = self._data[hash_key].spec
+            self._data[hash_key] = InstallRecord.from_dict(spec, rec)
+        else:
+            installs = {hash_key: rec}
+            spec = self._read_spec_from_dict(hash_key, installs)
+            self._data[hash_key] = InstallRecord.from_dict(spec, rec)
+            self._assign_dependencies(hash_key, installs, self._data)
+            spec._mark_concrete()
+        self._update_index(hash_key)
+
+    def _changed(self, hash_key):
+        """Record that a transaction added, changed or removed a record."""
+        self._dirty[hash_key] = True
+        self._update_index(hash_key)
+
+    def _update_index(self, hash_key):
+        if self._index is not None:
+            self._index.discard(hash_key)
+            if hash_key in self._data:
+                self._index.add(hash_key, self._data[hash_key])
+
+    @property
+    def index(self):
+        """Secondary indexes on the records, built when first needed."""
+        if self._index is None:
+            self._index = RecordIndex(self._data)
+        return self._index
 
     def reindex(self, directory_layout):
         """Build database index from scratch based on a directory layout.
@@ -443,6 +692,7 @@ class Database(object):
             except CorruptDatabaseError as e:
                 self._error = e
                 self._data = {}
+                self._index = None
 
         transaction = WriteTransaction(
             self.lock, _read_suppress_error, self._write
@@ -456,6 +706,9 @@ class Database(object):
                 )
                 self._error = None
 
+            # Every record changes: write a new snapshot
+            self._compact = True
+
             # Read first the `spec.yaml` files in the prefixes. They should be
             # considered authoritative with respect to DB reindexing, as
             # entries in the DB may be corrupted in a way that still makes
@@ -466,6 +719,7 @@ class Database(object):
             try:
                 # Initialize data in the reconstructed DB
                 self._data = {}
+                self._index = None
 
                 # Start inspecting the installed prefixes
                 processed_specs = set()
@@ -537,6 +791,7 @@ class Database(object):
             except BaseException:
                 # If anything explodes, restore old data, skip write.
                 self._data = old_data
+                self._index = None
                 raise
 
     def _check_ref_counts(self):
@@ -564,23 +819,44 @@ class Database(object):
                     (key, found, expected, self._index_path))
 
     def _write(self, type, value, traceback):
-        """Write the in-memory database index to its file path.
+        """Write the changes made by a transaction to the database files.
 
         This is a helper function called by the WriteTransaction context
-        manager. If there is an exception while the write lock is active,
-        nothing will be written to the database file, but the in-memory
-        database *may* be left in an inconsistent state.  It will be consistent
-        after the start of the next transaction, when it read from disk again.
+        manager. Changed records are appended to the journal as a single
+        line, unless the journal is due for compaction, in which case a
+        new snapshot is written instead.
+
+        If there is an exception while the write lock is active, nothing
+        will be written to the database files, but the in-memory database
+        *may* be left in an inconsistent state.  It will be consistent
+        after the start of the next transaction, which reads it from disk
+        from scratch.
 
         This routine does no locking.
 
         """
+        dirty, self._dirty = self._dirty, OrderedDict()
+        compact, self._compact = self._compact, False
+
         # Do not write if exceptions were raised
         if type is not None:
+            self._snapshot_id = None
             return
 
-        temp_file = self._index_path + (
-            '.%s.%s.temp' % (socket.getfqdn(), os.getpid()))
+        journal_size = self._journal_records + len(dirty)
+        if compact or journal_size > max(
+                _journal_min_compaction_size, len(self._data)):
+            self._write_snapshot()
+        elif dirty:
+            self._write_journal(dirty)
+
+    def _temp_path(self, path):
+        return path + ('.%s.%s.temp' % (socket.getfqdn(), os.getpid()))
+
+    def _write_snapshot(self):
+        """Write all records to a new snapshot, with an empty journal."""
+        self._generation = uuid.uuid4().hex
+        temp_file = self._temp_path(self._index_path)
 
         # Write a temporary database file them move it into place
         try:
@@ -593,23 +869,76 @@ class Database(object):
                 os.remove(temp_file)
             raise
 
+        self._snapshot_id = _file_id(self._index_path)
+        self._journal_records = 0
+        self._new_journal()
+
+    def _new_journal(self):
+        """Start an empty journal for the current snapshot."""
+        header = json.dumps({'generation': self._generation}) + '\n'
+        temp_file = self._temp_path(self._journal_path)
+        try:
+            with open(temp_file, 'w') as f:
+                f.write(header)
+            os.rename(temp_file, self._journal_path)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+        self._journal_id = _file_id(self._journal_path, contents=False)
+        self._journal_offset = len(header)
+
+    def _write_journal(self, dirty):
+        """Append the records in ``dirty`` to the journal, as one line."""
+        records = []
+        for key in dirty:
+            if key in self._data:
+                records.append(('add', key, self._data[key].to_dict()))
+            else:
+                records.append(('remove', key))
+        line = json.dumps({'records': records}, separators=(',', ':'))
+
+        if self._journal_offset is None:
+            self._new_journal()
+
+        # Anything past the offset is a line some writer did not finish
+        with open(self._journal_path, 'r+b') as f:
+            f.seek(self._journal_offset)
+            f.truncate()
+            f.write((line + '\n').encode('utf-8'))
+            self._journal_offset = f.tell()
+        self._journal_records += len(records)
+
     def _read(self):
         """Re-read Database from the data in the set location.
 
+        If the snapshot and journal are the ones read last time, only the
+        new journal records are read. Otherwise, the whole database is.
+
         This does no locking, with one exception: it will automatically
         migrate an index.yaml to an index.json if possible. This requires
         taking a write lock.
 
         """
         if os.path.isfile(self._index_path):
-            # Read from JSON file if a JSON database exists
-            self._read_from_file(self._index_path, format='json')
+            snapshot_id = _file_id(self._index_path)
+            journal_id = _file_id(self._journal_path, contents=False)
+            if snapshot_id != self._snapshot_id or \
+                    journal_id != self._journal_id:
+                # Read from JSON file if a JSON database exists
+                self._read_from_file(self._index_path, format='json')
+                self._snapshot_id = snapshot_id
+                self._journal_id = self._journal_offset = None
+                self._journal_records = 0
+            self._read_journal()
 
         elif os.path.isfile(self._old_yaml_index_path):
             if os.access(self._db_dir, os.R_OK | os.W_OK):
                 # if we can write, then read AND write a JSON file.
                 self._read_from_file(self._old_yaml_index_path, format='yaml')
                 with WriteTransaction(self.lock):
+                    self._compact = True
                     self._write(None, None, None)
             else:
                 # Read chck for a YAML file if we can't find JSON.
@@ -619,6 +948,7 @@ class Database(object):
             # The file doesn't exist, try to traverse the directory.
             # reindex() takes its own write lock, so no lock here.
             with WriteTransaction(self.lock):
+                self._compact = True
                 self._write(None, None, None)
             self.reindex(spack.store.layout)
 
@@ -698,6 +1028,7 @@ class Database(object):
                 dkey = dep.spec.dag_hash()
                 new_spec._add_dependency(self._data[dkey].spec, dep.deptypes)
                 self._data[dkey].ref_count += 1
+                self._changed(dkey)
 
             # Mark concrete once everything is built, and preserve
             # the original hash of concrete specs.
@@ -709,6 +1040,7 @@ class Database(object):
             self._data[key].installed = True
 
         self._data[key].explicit = explicit
+        self._changed(key)
 
     @_autospec
     def add(self, spec, directory_layout, explicit=False):
@@ -750,8 +1082,11 @@ class Database(object):
 
         if rec.ref_count == 0 and not rec.installed:
             del self._data[key]
+            self._changed(key)
             for dep in spec.dependencies(_tracked_deps):
                 self._decrement_ref_count(dep)
+        else:
+            self._changed(key)
 
     def _remove(self, spec):
         """Non-locking version of remove(); does real work.
@@ -761,9 +1096,11 @@ class Database(object):
 
         if rec.ref_count > 0:
             rec.installed = False
+            self._changed(key)
             return rec.spec
 
         del self._data[key]
+        self._changed(key)
         for dep in rec.spec.dependencies(_tracked_deps):
             self._decrement_ref_count(dep)
 
@@ -787,6 +1124,21 @@ class Database(object):
         with self.write_transaction():
             return self._remove(spec)
 
+    @_autospec
+    def update_explicit(self, spec, explicit):
+        """Mark an installed spec as explicitly installed, or not.
+
+        Args:
+            spec (Spec): spec, or query matching a single spec, to update
+            explicit (bool): whether the spec was installed explicitly
+        """
+        with self.write_transaction():
+            key = self._get_matching_spec_key(spec)
+            rec = self._data[key]
+            if rec.explicit != explicit:
+                rec.explicit = explicit
+                self._changed(key)
+
     @_autospec
     def installed_relatives(self, spec, direction='children', transitive=True):
         """Return installed specs related to this one."""
@@ -910,21 +1262,20 @@ class Database(object):
                 else:
                     return []
 
-            # Abstract specs require more work -- currently we test
-            # against everything.
+            # Abstract specs require more work -- we test the records
+            # that the indexes could not rule out.
             results = []
             start_date = start_date or datetime.datetime.min
             end_date = end_date or datetime.datetime.max
 
-            for key, rec in self._data.items():
-                if hashes is not None and rec.spec.dag_hash() not in hashes:
-                    continue
-
-                if installed is not any and rec.installed != installed:
-                    continue
+            keys = self.index.candidates(query_spec, installed, explicit)
+            if keys is None:
+                keys = self._data.keys()
+            if hashes is not None:
+                keys = set(keys) & set(hashes)
 
-                if explicit is not any and rec.explicit != explicit:
-                    continue
+            for key in keys:
+                rec = self._data[key]
 
                 if known is not any and spack.repo.path.exists(
                         rec.spec.name) != known:
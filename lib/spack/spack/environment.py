@@ -3,6 +3,7 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import multiprocessing
 import os
 import re
 import sys
@@ -11,8 +12,12 @@ import shutil
 import ruamel.yaml
 
 import llnl.util.filesystem as fs
+import llnl.util.multiproc as mp
 import llnl.util.tty as tty
 
+import spack.architecture
+import spack.caches
+import spack.compilers
 import spack.error
 import spack.repo
 import spack.schema.env
@@ -587,18 +592,21 @@ class Environment(object):
                 self._add_concrete_spec(s, concrete, new=False)
 
         # concretize any new user specs that we haven't concretized yet
-        for uspec in self.user_specs:
-            if uspec not in old_concretized_user_specs:
-                tty.msg('Concretizing %s' % uspec)
-                concrete = uspec.concretized()
-                self._add_concrete_spec(uspec, concrete)
-
-                # Display concretized spec to the user
-                sys.stdout.write(concrete.tree(
-                    recurse_dependencies=True,
-                    status_fn=spack.spec.Spec.install_status,
-                    hashlen=7, hashes=True)
-                )
+        new_user_specs = [
+            s for s in self.user_specs if s not in old_concretized_user_specs]
+        for uspec in new_user_specs:
+            tty.msg('Concretizing %s' % uspec)
+        concrete_specs = concretize_specs(new_user_specs)
+
+        for uspec, concrete in zip(new_user_specs, concrete_specs):
+            self._add_concrete_spec(uspec, concrete)
+
+            # Display concretized spec to the user
+            sys.stdout.write(concrete.tree(
+                recurse_dependencies=True,
+                status_fn=spack.spec.Spec.install_status,
+                hashlen=7, hashes=True)
+            )
 
     def install(self, user_spec, concrete_spec=None, **install_args):
         """Install a single spec into an environment.
@@ -804,19 +812,8 @@ class Environment(object):
         self.concretized_user_specs = [Spec(r['spec']) for r in roots]
         self.concretized_order = [r['hash'] for r in roots]
 
-        json_specs_by_hash = d['concrete_specs']
         root_hashes = set(self.concretized_order)
-
-        specs_by_hash = {}
-        for dag_hash, node_dict in json_specs_by_hash.items():
-            specs_by_hash[dag_hash] = Spec.from_node_dict(node_dict)
-
-        for dag_hash, node_dict in json_specs_by_hash.items():
-            for dep_name, dep_hash, deptypes in (
-                    Spec.dependencies_from_node_dict(node_dict)):
-                specs_by_hash[dag_hash]._add_dependency(
-                    specs_by_hash[dep_hash], deptypes)
-
+        specs_by_hash = read_concrete_specs(d['concrete_specs'])
         self.specs_by_hash = dict(
             (x, y) for x, y in specs_by_hash.items() if x in root_hashes)
 
@@ -875,6 +872,87 @@ class Environment(object):
             activate(self._previous_active)
 
 
+def read_concrete_specs(json_specs_by_hash):
+    """Read the ``concrete_specs`` section of a lockfile, or other node
+    dicts keyed by DAG hash, like the nodes of a build cache index.
+
+    Returns:
+        (dict): all specs read, keyed by DAG hash, with their dependencies
+            connected
+    """
+    specs_by_hash = {}
+    for dag_hash, node_dict in json_specs_by_hash.items():
+        specs_by_hash[dag_hash] = Spec.from_node_dict(node_dict)
+
+    for dag_hash, node_dict in json_specs_by_hash.items():
+        for dep_name, dep_hash, deptypes in (
+                Spec.dependencies_from_node_dict(node_dict)):
+            specs_by_hash[dag_hash]._add_dependency(
+                specs_by_hash[dep_hash], deptypes)
+
+    return specs_by_hash
+
+
+def concretize_specs(abstract_specs):
+    """Concretize independent abstract specs.
+
+    When there are several specs and CPUs, the specs are concretized by
+    a pool of processes, and the concrete specs they return are read
+    back so that identical sub-DAGs are shared among them.  Repository
+    indexes, compilers and the platform are loaded in advance, so that
+    the processes inherit them instead of each loading them again.
+
+    Arguments:
+        abstract_specs (list of Spec): specs to concretize, not modified
+
+    Returns:
+        (list of Spec): concrete specs, in the same order
+    """
+    concretized = spack.caches.concretization_cache.concretized
+
+    nprocs = min(multiprocessing.cpu_count(), len(abstract_specs))
+    if nprocs <= 1:
+        return [concretized(s) for s in abstract_specs]
+
+    spack.repo.path.provider_index
+    spack.compilers.all_compiler_specs()
+    spack.architecture.sys_type()
+
+    batches = [list(range(i, len(abstract_specs), nprocs))
+               for i in range(nprocs)]
+
+    def concretize_batch(batch):
+        roots, nodes = [], {}
+        for i in batch:
+            concrete = concretized(abstract_specs[i])
+            roots.append(concrete.dag_hash())
+            for s in concrete.traverse():
+                dag_hash = s.dag_hash()
+                if dag_hash not in nodes:
+                    nodes[dag_hash] = s.to_node_dict(all_deps=True)
+        return roots, nodes
+
+    def concretize_batch_in_child(batch):
+        # Errors are reported by concretizing the batch in the parent
+        try:
+            return concretize_batch(batch)
+        except BaseException:
+            return None
+
+    results = mp.parmap(concretize_batch_in_child, batches,
+                        fallback=concretize_batch)
+
+    root_hashes, json_specs_by_hash = [None] * len(abstract_specs), {}
+    for batch, result in zip(batches, results):
+        roots, nodes = result or concretize_batch(batch)
+        for i, dag_hash in zip(batch, roots):
+            root_hashes[i] = dag_hash
+        json_specs_by_hash.update(nodes)
+
+    specs_by_hash = read_concrete_specs(json_specs_by_hash)
+    return [specs_by_hash[h] for h in root_hashes]
+
+
 def make_repo_path(root):
     """Make a RepoPath from the repo subdirectories in an environment."""
     path = spack.repo.RepoPath()
@@ -26,17 +26,23 @@ import sys
 import re
 import shutil
 import copy
+import hashlib
+import time
 from functools import wraps
 from six import string_types, with_metaclass
 
 import llnl.util.tty as tty
 from llnl.util.filesystem import working_dir, mkdirp
 
+import spack.caches
 import spack.config
 import spack.error
 import spack.util.crypto as crypto
+import spack.util.download
+import spack.util.http_fetch
 import spack.util.pattern as pattern
 from spack.util.executable import which
+from spack.util.lock import Lock, ReadTransaction, WriteTransaction
 from spack.util.string import comma_and, quote
 from spack.version import Version, ver
 from spack.util.compression import decompressor_for, extension
@@ -193,6 +199,10 @@ class URLFetchStrategy(FetchStrategy):
 
         self.extension = kwargs.get('extension', None)
 
+        # (path, mtime, checksum) of an archive whose checksum was computed
+        # while it was fetched
+        self._fetched_checksum = None
+
         if not self.url:
             raise ValueError("URLFetchStrategy requires a url for fetching.")
 
@@ -211,14 +221,98 @@ class URLFetchStrategy(FetchStrategy):
             tty.msg("Already downloaded %s" % self.archive_file)
             return
 
+        tty.msg("Fetching %s" % self.url)
+
+        if self._fetch_in_process():
+            content_type = self._fetch_with_http_client()
+        else:
+            content_type = self._fetch_with_curl()
+
+        # Check if we somehow got an HTML file rather than the archive we
+        # asked for.
+        if content_type and 'text/html' in content_type:
+            msg = ("The contents of {0} look like HTML. Either the URL "
+                   "you are trying to use does not exist or you have an "
+                   "internet gateway issue. You can remove the bad archive "
+                   "using 'spack clean <package>', then try again using "
+                   "the correct URL.")
+            tty.warn(msg.format(self.archive_file or "the archive"))
+
+        if not self.archive_file:
+            raise FailedDownloadError(self.url)
+
+    def _fetch_in_process(self):
+        """Whether to fetch with ``spack.util.http_fetch`` rather than
+        curl: for http(s) URLs without custom curl options, if
+        ``config:url_fetch_method`` is ``python``.  Pythons that cannot
+        verify certificates leave https URLs to curl, unless
+        ``config:verify_ssl`` is off."""
+        if self.url.startswith('https') and \
+                spack.config.get('config:verify_ssl') and \
+                not spack.util.http_fetch.can_verify_ssl():
+            return False
+        return (spack.config.get('config:url_fetch_method') == 'python' and
+                not self.extra_curl_options and
+                bool(self.stage.save_filename) and
+                spack.util.http_fetch.supports(self.url))
+
+    def _fetch_with_http_client(self):
+        """Download the archive over a pooled connection, computing its
+        checksum on the way. Returns the content type."""
+        save_file = self.stage.save_filename
+        hash_fun = None
+        if self.digest:
+            try:
+                hash_fun = crypto.hash_fun_for_digest(self.digest)
+            except ValueError:
+                pass
+
+        retries = spack.config.get('config:download_retries', 3)
+        for attempt in range(retries + 1):
+            if attempt:
+                delay = spack.util.download.backoff_delay(attempt)
+                tty.msg("Retrying %s in %gs" % (self.url, delay))
+                time.sleep(delay)
+            try:
+                content_type, checksum = spack.util.http_fetch.fetch(
+                    self.url, save_file, hash_fun)
+                break
+            except spack.util.http_fetch.SSLFetchError as e:
+                raise FailedDownloadError(
+                    self.url,
+                    "Unable to fetch due to an SSL error: %s. This is "
+                    "either an attack, or your cluster's SSL "
+                    "configuration is bad.  If you believe your SSL "
+                    "configuration is bad, you can try running spack -k, "
+                    "which will not check SSL certificates. "
+                    "Use this at your own risk." % e)
+            except spack.util.http_fetch.HTTPFetchError as e:
+                if e.transient and attempt < retries:
+                    tty.debug(e)
+                    continue
+                # keep partial files of transient errors for the next
+                # fetch to resume
+                partial_file = save_file + '.part'
+                if not e.transient and os.path.exists(partial_file):
+                    os.remove(partial_file)
+                if e.status == 404:
+                    raise FailedDownloadError(
+                        self.url, "URL %s was not found!" % self.url)
+                raise FailedDownloadError(self.url, str(e))
+
+        if checksum:
+            self._fetched_checksum = (
+                save_file, os.path.getmtime(save_file), checksum)
+        return content_type
+
+    def _fetch_with_curl(self):
+        """Download the archive with curl. Returns the content type."""
         save_file = None
         partial_file = None
         if self.stage.save_filename:
             save_file = self.stage.save_filename
             partial_file = self.stage.save_filename + '.part'
 
-        tty.msg("Fetching %s" % self.url)
-
         if partial_file:
             save_args = ['-C',
                          '-',  # continue partial downloads
@@ -245,10 +339,20 @@ class URLFetchStrategy(FetchStrategy):
 
         curl_args += self.extra_curl_options
 
-        # Run curl but grab the mime type from the http headers
+        # Run curl but grab the mime type from the http headers. Transient
+        # errors are retried, resuming the partial download.
         curl = self.curl
-        with working_dir(self.stage.path):
-            headers = curl(*curl_args, output=str, fail_on_error=False)
+        retries = spack.config.get('config:download_retries', 3)
+        for attempt in range(retries + 1):
+            if attempt:
+                delay = spack.util.download.backoff_delay(attempt)
+                tty.msg("Retrying %s in %gs" % (self.url, delay))
+                time.sleep(delay)
+            with working_dir(self.stage.path):
+                headers = curl(*curl_args, output=str, fail_on_error=False)
+            if (curl.returncode not in
+                    spack.util.download.transient_curl_errors):
+                break
 
         if curl.returncode != 0:
             # clean up archive on failure.
@@ -281,24 +385,15 @@ class URLFetchStrategy(FetchStrategy):
                     self.url,
                     "Curl failed with error %d" % curl.returncode)
 
-        # Check if we somehow got an HTML file rather than the archive we
-        # asked for.  We only look at the last content type, to handle
-        # redirects properly.
+        # We only look at the last content type, to handle redirects
+        # properly.
         content_types = re.findall(r'Content-Type:[^\r\n]+', headers,
                                    flags=re.IGNORECASE)
-        if content_types and 'text/html' in content_types[-1]:
-            msg = ("The contents of {0} look like HTML. Either the URL "
-                   "you are trying to use does not exist or you have an "
-                   "internet gateway issue. You can remove the bad archive "
-                   "using 'spack clean <package>', then try again using "
-                   "the correct URL.")
-            tty.warn(msg.format(self.archive_file or "the archive"))
 
         if save_file:
             os.rename(partial_file, save_file)
 
-        if not self.archive_file:
-            raise FailedDownloadError(self.url)
+        return content_types[-1] if content_types else None
 
     @property
     def archive_file(self):
@@ -364,6 +459,11 @@ class URLFetchStrategy(FetchStrategy):
 
         shutil.copyfile(self.archive_file, destination)
 
+        # A copy of a verified archive does not need to be checked again
+        ledger = spack.caches.checksum_ledger
+        if self.digest and ledger.verified(self.archive_file, self.digest):
+            ledger.add(destination, self.digest)
+
     @_needs_stage
     def check(self):
         """Check the downloaded archive against a checksum digest.
@@ -372,12 +472,28 @@ class URLFetchStrategy(FetchStrategy):
             raise NoDigestError(
                 "Attempt to check URLFetchStrategy with no digest.")
 
+        # Archives that were verified and did not change since are in
+        # the ledger, so they are not read again
+        ledger = spack.caches.checksum_ledger
+        if ledger.verified(self.archive_file, self.digest):
+            tty.debug('Checksum of %s was verified' % self.archive_file)
+            return
+
         checker = crypto.Checker(self.digest)
-        if not checker.check(self.archive_file):
+        fetched = self._fetched_checksum
+        if fetched and fetched[:2] == (self.archive_file,
+                                       os.path.getmtime(self.archive_file)):
+            # computed while fetching: don't read the archive again
+            checker.sum = fetched[2]
+            valid = checker.sum == checker.hexdigest
+        else:
+            valid = checker.check(self.archive_file)
+        if not valid:
             raise ChecksumError(
                 "%s checksum failed for %s" %
                 (checker.hash_name, self.archive_file),
                 "Expected %s but got %s" % (self.digest, checker.sum))
+        ledger.add(self.archive_file, self.digest)
 
     @_needs_stage
     def reset(self):
@@ -569,16 +685,21 @@ class GitFetchStrategy(VCSFetchStrategy):
 
         version('1.1', git='https://github.com/project/repo.git', tag='v1.1')
 
-    You can use these three optional attributes in addition to ``git``:
+    You can use these optional attributes in addition to ``git``:
 
         * ``branch``: Particular branch to build from (default is the
                       repository's default branch)
         * ``tag``: Particular tag to check out
         * ``commit``: Particular commit hash in the repo
+        * ``submodules``: Also check out submodules, recursively
+        * ``sparse_paths``: Only check out these files and directories
+
+    Repositories are mirrored in the ``git_cache`` if it is enabled, so
+    that fetching them again only downloads new objects.
     """
     enabled = True
     url_attr = 'git'
-    optional_attrs = ['tag', 'branch', 'commit', 'submodules']
+    optional_attrs = ['tag', 'branch', 'commit', 'submodules', 'sparse_paths']
 
     def __init__(self, **kwargs):
         # Discards the keywords in kwargs that may conflict with the next call
@@ -589,6 +710,8 @@ class GitFetchStrategy(VCSFetchStrategy):
 
         self._git = None
         self.submodules = kwargs.get('submodules', False)
+        if isinstance(self.sparse_paths, string_types):
+            self.sparse_paths = [self.sparse_paths]
 
     @property
     def git_version(self):
@@ -633,6 +756,20 @@ class GitFetchStrategy(VCSFetchStrategy):
 
         return '{0}{1}'.format(self.url, args)
 
+    def _quiet(self, *args):
+        """Arguments of a git command, with ``--quiet`` unless debugging."""
+        if spack.config.get('config:debug'):
+            return list(args)
+        return list(args) + ['--quiet']
+
+    def _clone_dir(self):
+        """Name of the directory the repository is cloned into, the one
+        ``git clone`` would choose."""
+        name = os.path.basename(self.url.rstrip('/'))
+        if name.endswith('.git'):
+            name = name[:-len('.git')]
+        return name or 'src'
+
     def fetch(self):
         if self.stage.source_path:
             tty.msg("Already fetched {0}".format(self.stage.source_path))
@@ -640,78 +777,217 @@ class GitFetchStrategy(VCSFetchStrategy):
 
         tty.msg("Cloning git repository: {0}".format(self._repo_info()))
 
-        git = self.git
-        if self.commit:
-            # Need to do a regular clone and check out everything if
-            # they asked for a particular commit.
-            with working_dir(self.stage.path):
-                if spack.config.get('config:debug'):
-                    git('clone', self.url)
-                else:
-                    git('clone', '--quiet', self.url)
+        mirror = None
+        if spack.config.get('config:git_cache', False):
+            revision = self.commit
+            if self.tag:
+                revision = 'refs/tags/' + self.tag
+            try:
+                mirror = self._update_mirror(self.url, revision)
+            except spack.error.SpackError as e:
+                tty.warn('Cannot update the git cache for {0}'.format(
+                    self.url), str(e))
 
-            with working_dir(self.stage.source_path):
-                if spack.config.get('config:debug'):
-                    git('checkout', self.commit)
-                else:
-                    git('checkout', '--quiet', self.commit)
+        with working_dir(self.stage.path):
+            if mirror:
+                lock = spack.caches.git_cache.lock(self.url)
+                with ReadTransaction(lock):
+                    self._clone_from_mirror(mirror)
+            elif self.commit:
+                self._clone_commit()
+            else:
+                self._clone_ref()
 
-        else:
-            # Can be more efficient if not checking out a specific commit.
-            args = ['clone']
-            if not spack.config.get('config:debug'):
-                args.append('--quiet')
+        with working_dir(self.stage.source_path):
+            # Init submodules if the user asked for them.
+            if self.submodules:
+                self._update_submodules(mirror is not None)
 
-            # If we want a particular branch ask for it.
-            if self.branch:
-                args.extend(['--branch', self.branch])
-            elif self.tag and self.git_version >= ver('1.8.5.2'):
-                args.extend(['--branch', self.tag])
+    def _update_mirror(self, url, revision=None):
+        """Create or update the mirror of a repository in the git cache,
+        and return its path.
 
-            # Try to be efficient if we're using a new enough git.
-            # This checks out only one branch's history
-            if self.git_version > ver('1.7.10'):
-                args.append('--single-branch')
+        The mirror is a bare repository with the branches and tags of the
+        remote one.  It is only updated if it does not have ``revision``
+        already, so that checking out a commit or a tag that was fetched
+        before does not need the network.
+        """
+        cache = spack.caches.git_cache
 
-            with working_dir(self.stage.path):
-                cloned = False
-                # Yet more efficiency, only download a 1-commit deep tree
-                if self.git_version >= ver('1.7.1'):
-                    try:
-                        git(*(args + ['--depth', '1', self.url]))
-                        cloned = True
-                    except spack.error.SpackError:
-                        # This will fail with the dumb HTTP transport
-                        # continue and try without depth, cleanup first
-                        pass
-
-                if not cloned:
-                    args.append(self.url)
-                    git(*args)
-
-                with working_dir(self.stage.source_path):
-                    # For tags, be conservative and check them out AFTER
-                    # cloning.  Later git versions can do this with clone
-                    # --branch, but older ones fail.
-                    if self.tag and self.git_version < ver('1.8.5.2'):
-                        # pull --tags returns a "special" error code of 1 in
-                        # older versions that we have to ignore.
-                        # see: https://github.com/git/git/commit/19d122b
-                        if spack.config.get('config:debug'):
-                            git('pull', '--tags', ignore_errors=1)
-                            git('checkout', self.tag)
-                        else:
-                            git('pull', '--quiet', '--tags', ignore_errors=1)
-                            git('checkout', '--quiet', self.tag)
+        git = self.git
+        path = cache.path(url)
+        with WriteTransaction(cache.lock(url)):
+            if not os.path.isdir(path):
+                tmp = path + '.tmp'
+                shutil.rmtree(tmp, ignore_errors=True)
+                git(*self._quiet('clone', '--bare') + [url, tmp])
+                os.rename(tmp, path)
+
+            elif not (revision and self._has_revision(path, revision)):
+                git(*self._quiet('--git-dir=' + path, 'fetch', '--prune') +
+                    [url, '+refs/heads/*:refs/heads/*',
+                     '+refs/tags/*:refs/tags/*'])
+
+        return path
+
+    def _has_revision(self, git_dir, revision):
+        """Whether a repository has a commit, tag or branch."""
+        git = self.git
+        git('--git-dir=' + git_dir, 'cat-file', '-e', revision + '^{commit}',
+            output=str, error=str, fail_on_error=False)
+        return git.returncode == 0
+
+    def _clone_from_mirror(self, mirror):
+        # Cloning from a local path hard links or copies the objects of
+        # the mirror, so the clone does not depend on the cache
+        args = self._quiet('clone', '--no-checkout')
+        if self.branch or self.tag:
+            args.extend(['--branch', self.branch or self.tag])
+        self.git(*(args + [mirror, self._clone_dir()]))
+
+        with working_dir(self._clone_dir()):
+            self.git('remote', 'set-url', 'origin', self.url)
+            self._checkout(self.commit or 'HEAD')
+
+    def _clone_commit(self):
+        # With a full commit hash, try to fetch only that commit.  Not
+        # all servers allow it, and older ones fail, so fall back on a
+        # regular clone and check out the commit.
+        git = self.git
+        name = self._clone_dir()
+        if (re.match('^[0-9a-f]{40}$', self.commit) and
+                self.git_version >= ver('2.5')):
+            mkdirp(name)
+            with working_dir(name):
+                git(*self._quiet('init'))
+                git('remote', 'add', 'origin', self.url)
+                try:
+                    git(*self._quiet('fetch', '--depth', '1') +
+                        ['origin', self.commit], error=str)
+                    self._checkout(self.commit)
+                    return
+                except spack.error.SpackError:
+                    tty.debug('Cannot fetch only commit {0} of {1}'.format(
+                        self.commit, self.url))
+            shutil.rmtree(name)
+
+        args = self._quiet('clone', '--no-checkout')
+        args.extend(self._filter_args())
+        git(*(args + [self.url, name]))
+        with working_dir(name):
+            self._checkout(self.commit)
+
+    def _clone_ref(self):
+        # Can be more efficient if not checking out a specific commit.
+        git = self.git
+        args = self._quiet('clone', '--no-checkout')
+        args.extend(self._filter_args())
+
+        # If we want a particular branch ask for it.
+        if self.branch:
+            args.extend(['--branch', self.branch])
+        elif self.tag and self.git_version >= ver('1.8.5.2'):
+            args.extend(['--branch', self.tag])
+
+        # Try to be efficient if we're using a new enough git.
+        # This checks out only one branch's history
+        if self.git_version > ver('1.7.10'):
+            args.append('--single-branch')
+
+        name = self._clone_dir()
+        cloned = False
+        # Yet more efficiency, only download a 1-commit deep tree
+        if self.git_version >= ver('1.7.1'):
+            try:
+                git(*(args + ['--depth', '1', self.url, name]))
+                cloned = True
+            except spack.error.SpackError:
+                # This will fail with the dumb HTTP transport
+                # continue and try without depth, cleanup first
+                shutil.rmtree(name, ignore_errors=True)
+
+        if not cloned:
+            git(*(args + [self.url, name]))
+
+        with working_dir(name):
+            # For tags, be conservative and check them out AFTER
+            # cloning.  Later git versions can do this with clone
+            # --branch, but older ones fail.
+            if self.tag and self.git_version < ver('1.8.5.2'):
+                # pull --tags returns a "special" error code of 1 in
+                # older versions that we have to ignore.
+                # see: https://github.com/git/git/commit/19d122b
+                git(*self._quiet('fetch', '--tags'), ignore_errors=1)
+                self._checkout(self.tag)
+            else:
+                self._checkout('HEAD')
+
+    def _filter_args(self):
+        """Arguments of ``git clone`` to download only the files checked
+        out by a sparse checkout, with git versions that can."""
+        if self.sparse_paths and self.git_version >= ver('2.19'):
+            return ['--filter=blob:none']
+        return []
+
+    def _checkout(self, revision):
+        """Check out a revision in a repository cloned with
+        ``--no-checkout``, only the ``sparse_paths`` if there are some."""
+        if self.sparse_paths:
+            self.git('config', 'core.sparseCheckout', 'true')
+            patterns = os.path.join('.git', 'info', 'sparse-checkout')
+            mkdirp(os.path.dirname(patterns))
+            with open(patterns, 'w') as f:
+                for path in self.sparse_paths:
+                    f.write('/{0}\n'.format(path.strip('/')))
+
+        self.git(*self._quiet('checkout') + [revision])
+
+    def _update_submodules(self, use_cache):
+        """Check out the submodules of the repository in the current
+        directory, recursively.
+
+        With the git cache, each submodule is cloned from a mirror of its
+        own repository, and then pointed back at its remote.
+        """
+        git = self.git
+        if not use_cache:
+            git(*self._quiet('submodule') + ['update', '--init',
+                                             '--recursive'])
+            return
 
-        with working_dir(self.stage.source_path):
-            # Init submodules if the user asked for them.
-            if self.submodules:
-                if spack.config.get('config:debug'):
-                    git('submodule', 'update', '--init', '--recursive')
-                else:
-                    git('submodule', '--quiet', 'update', '--init',
-                        '--recursive')
+        # submodule init records the URLs of the submodules, relative
+        # ones resolved, in .git/config
+        git(*self._quiet('submodule') + ['init'])
+        output = git('config', '--get-regexp', r'^submodule\..*\.url$',
+                     output=str, ignore_errors=1)
+        for line in output.splitlines():
+            key, url = line.split(None, 1)
+            name = key[len('submodule.'):-len('.url')]
+            path = git('config', '-f', '.gitmodules',
+                       'submodule.{0}.path'.format(name), output=str).strip()
+
+            # The commit recorded for the submodule is all we need
+            revision = git('rev-parse', 'HEAD:' + path, output=str).strip()
+            try:
+                mirror = self._update_mirror(url, revision)
+            except spack.error.SpackError as e:
+                tty.warn('Cannot update the git cache for {0}'.format(url),
+                         str(e))
+                git(*self._quiet('submodule') + [
+                    'update', '--recursive', '--', path])
+                continue
+
+            # Recent versions of git only clone submodules from local
+            # paths if they are explicitly allowed to
+            git('config', key, mirror)
+            with ReadTransaction(spack.caches.git_cache.lock(url)):
+                git(*['-c', 'protocol.file.allow=always'] +
+                    self._quiet('submodule') + ['update', '--', path])
+            git('config', key, url)
+
+            with working_dir(path):
+                git('remote', 'set-url', 'origin', url)
+                self._update_submodules(use_cache)
 
     def archive(self, destination):
         super(GitFetchStrategy, self).archive(destination, exclude='.git')
@@ -1119,6 +1395,36 @@ class FsCache(object):
         shutil.rmtree(self.root, ignore_errors=True)
 
 
+class GitCache(object):
+    """Bare mirrors of the git repositories Spack fetched, by URL.
+
+    ``GitFetchStrategy`` clones repositories from their mirror here,
+    which it updates with ``git fetch``, so that only the objects that
+    are new since the last fetch are downloaded.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._locks = {}
+
+    def path(self, url):
+        """Path of the mirror of a repository."""
+        name = os.path.basename(url.rstrip('/'))
+        if name.endswith('.git'):
+            name = name[:-len('.git')]
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.root, '{0}-{1}.git'.format(name, digest))
+
+    def lock(self, url):
+        """Lock of the mirror of a repository, held for writing while it
+        is updated, and for reading while it is cloned."""
+        path = self.path(url) + '.lock'
+        if path not in self._locks:
+            mkdirp(self.root)
+            self._locks[path] = Lock(path)
+        return self._locks[path]
+
+
 class FetchError(spack.error.SpackError):
     """Superclass fo fetcher errors."""
 
@@ -0,0 +1,517 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""DAG-aware scheduling of package installations.
+
+``PackageBase.do_install`` used to walk the dependencies of a spec in
+post-order and build them one after the other.  The ``PackageInstaller``
+in this module instead keeps track of which nodes of the DAG are ready to
+be built (i.e. all of their dependencies are installed) and builds up to
+``concurrent_builds`` of them at the same time, each in its own process.
+
+The total number of make jobs (``-j`` or ``config:build_jobs``) is a
+budget that is split among the builds running at any one time, so that
+running several builds concurrently does not oversubscribe the node.
+
+Each build goes through ``do_install``, which takes the usual prefix
+locks in the install database.  Several Spack processes working on the
+same install tree therefore cooperate: if another process is building a
+node, this one waits for the prefix lock and then finds it installed.
+
+When a build fails, the nodes that depend on it are skipped but the
+rest of the DAG keeps building.  Failures are reported once every node
+that could be built has been built.
+
+With ``config:concurrent_fetches`` set, fetching, checksumming, expanding
+and patching sources happen in separate processes ahead of the builds,
+in the order the builds will need them.  Builds then start from a stage
+that is already set up, so download and decompression time is hidden
+behind the compilation of other packages.
+
+Nodes that are installed from a binary cache are downloaded by a
+``DownloadManager`` as soon as the installation starts, up to
+``config:download_connections`` at a time.  They are extracted in the
+order their downloads finish (as long as their dependencies are
+installed), while the rest is still downloading.
+"""
+import multiprocessing
+import os
+import pickle
+import sys
+
+from six.moves import queue
+
+import llnl.util.tty as tty
+
+import spack.binary_distribution as binary_distribution
+import spack.config
+import spack.error
+import spack.paths
+from spack.util.download import DownloadManager
+from spack.util.string import plural
+
+
+class PackageInstaller(object):
+    """Installs the dependencies of a concrete spec in DAG order.
+
+    Args:
+        spec (Spec): concrete spec whose dependencies are installed. The
+            root itself is not installed by the installer.
+        concurrent_builds (int): maximum number of packages built at
+            the same time. With 1 (the default) builds happen in this
+            process, in the same order as a post-order traversal.
+        jobs (int): total number of make jobs shared by all the running
+            builds. Defaults to ``config:build_jobs`` or the number of
+            cpus.
+        concurrent_fetches (int): number of packages whose sources are
+            fetched, checked, expanded and patched ahead of their build.
+            Defaults to ``config:concurrent_fetches``; 0 disables it, so
+            each build stages its own sources.
+    """
+
+    def __init__(self, spec, concurrent_builds=None, jobs=None,
+                 concurrent_fetches=None):
+        if not spec.concrete:
+            raise ValueError(
+                "Can only install concrete specs: %s" % spec.name)
+
+        self.spec = spec
+        self.concurrent_builds = max(1, concurrent_builds or 1)
+        self.jobs = jobs or spack.config.get('config:build_jobs') or \
+            multiprocessing.cpu_count()
+        if concurrent_fetches is None:
+            concurrent_fetches = spack.config.get(
+                'config:concurrent_fetches', 0)
+        self.concurrent_fetches = max(0, concurrent_fetches)
+
+        #: nodes to be installed, in post-order, keyed by DAG hash
+        self.order = []
+        self.specs = {}
+        for dep in spec.traverse(order='post', root=False):
+            key = dep.dag_hash()
+            self.order.append(key)
+            self.specs[key] = dep
+
+        #: DAG hashes of the dependencies of each node that are not done
+        self.pending = dict(
+            (key, set(d.dag_hash() for d in self.specs[key].dependencies()))
+            for key in self.order)
+
+        #: DAG hashes of the dependents of each node, within the DAG
+        self.dependents = dict((key, set()) for key in self.order)
+        for key, deps in self.pending.items():
+            for dkey in deps:
+                self.dependents[dkey].add(key)
+
+        self.installed = set()
+        self.failed = {}
+        self.skipped = {}
+
+        #: whether staging ahead of the build succeeded, by DAG hash
+        self.staged = {}
+
+        # Child processes (staging or building) and the queue they report
+        # their results to.
+        self._results = None
+        self._running = {}  # (kind, DAG hash) -> (process, make jobs)
+        self._to_stage = []
+        self._stage_kwargs = {}
+
+        # DAG hashes of the nodes in a binary cache, and their downloads
+        self._binaries = None
+        self._downloads = None
+
+    def _ready(self):
+        """DAG hashes of the nodes that can be built, in post-order."""
+        done = self.installed | set(self.failed) | set(self.skipped)
+        return [key for key in self.order
+                if key not in done and not self.pending[key]]
+
+    def _mark_installed(self, key):
+        self.installed.add(key)
+        for dkey in self.dependents[key]:
+            self.pending[dkey].discard(key)
+
+    def _mark_failed(self, key, error):
+        spec = self.specs[key]
+        tty.error('Failed to install {0}: {1}'.format(
+            spec.cformat('$_$/'), error))
+        self.failed[key] = error
+
+        # Everything depending on a failed node can't be built
+        stack = list(self.dependents[key])
+        while stack:
+            dkey = stack.pop()
+            if dkey in self.skipped:
+                continue
+            tty.warn('Skipping {0}: dependency {1} failed'.format(
+                self.specs[dkey].cformat('$_$/'), spec.name))
+            self.skipped[dkey] = key
+            if dkey in self._to_stage:
+                self._to_stage.remove(dkey)
+            stack.extend(self.dependents[dkey])
+
+    def install(self, **kwargs):
+        """Install all the dependencies of ``self.spec``.
+
+        Keyword arguments are passed through to ``do_install`` for each
+        node, except for ``make_jobs`` which is computed from the job
+        budget when several builds run concurrently.
+
+        Raises:
+            InstallError: if any node failed to install. If a single node
+                failed, the original error is re-raised instead.
+        """
+        kwargs = dict(kwargs)
+        kwargs.update(install_deps=False, explicit=False)
+
+        # Nodes already in the store don't need to be scheduled at all
+        for key in self.order:
+            spec = self.specs[key]
+            if not spec.external and spec.package.installed:
+                self._mark_installed(key)
+
+        self._results = multiprocessing.Queue()
+        try:
+            self._start_downloads(kwargs)
+            self._start_staging(kwargs)
+            if self.concurrent_builds == 1:
+                self._install_serial(kwargs)
+            else:
+                self._install_concurrent(kwargs)
+        except BaseException:
+            # Binaries that were not downloaded yet won't be installed
+            if self._downloads is not None:
+                self._downloads.terminate()
+            raise
+        finally:
+            # Sources may still be staging for nodes that were skipped
+            del self._to_stage[:]
+            while self._running:
+                self._collect()
+            if self._downloads is not None:
+                if self.failed:
+                    # the rest are binaries of skipped nodes
+                    self._downloads.terminate()
+                self._downloads.close()
+                self._poll_downloads()
+
+        if not self.failed:
+            return
+
+        if len(self.failed) == 1 and not self.skipped:
+            error = next(iter(self.failed.values()))
+            if isinstance(error, BaseException):
+                raise error
+
+        failed = [self.specs[k].name for k in self.order if k in self.failed]
+        raise InstallError(
+            'Failed to install {0}: {1}'.format(
+                plural(len(failed), 'dependency', 'dependencies'),
+                ', '.join(failed)),
+            '{0} skipped because of failed dependencies'.format(
+                plural(len(self.skipped), 'package')))
+
+    def _start_staging(self, kwargs):
+        """Queue up the nodes whose sources can be staged ahead of time.
+
+        That is everything that will be built from source, including the
+        root, which ``do_install`` builds once its dependencies are done.
+        """
+        if not self.concurrent_fetches or kwargs.get('fake'):
+            return
+        self._stage_kwargs = kwargs
+
+        # Nodes installed from a binary cache don't need their sources
+        binaries = self._binary_keys(kwargs)
+
+        done = self.installed | set(self.failed) | set(self.skipped)
+        self._to_stage = [
+            key for key in self.order + [self.spec.dag_hash()]
+            if key not in done and key not in binaries and
+            not self._spec(key).external]
+        self._stage_next(kwargs)
+
+    def _binary_keys(self, kwargs):
+        """DAG hashes of the nodes available in a binary cache."""
+        if self._binaries is None:
+            self._binaries = set()
+            if kwargs.get('use_cache', True):
+                self._binaries = set(
+                    s.dag_hash() for s in binary_distribution.get_specs())
+        return self._binaries
+
+    def _start_downloads(self, kwargs):
+        """Start downloading the nodes installed from a binary cache.
+
+        That includes the root, if it is in a binary cache and not
+        installed yet.  Tarballs are saved where ``do_install`` looks
+        for them, so it finds them already downloaded.
+        """
+        if kwargs.get('fake') or not self._binary_keys(kwargs):
+            return
+
+        done = self.installed | set(self.failed) | set(self.skipped)
+        root = self.spec.dag_hash()
+        for key in self.order + [root]:
+            if key in done or key not in self._binary_keys(kwargs):
+                continue
+            if key == root and self.spec.package.installed:
+                continue
+
+            urls, path = binary_distribution.tarball_download_info(
+                self._spec(key))
+            if os.path.exists(path):
+                continue
+
+            if self._downloads is None:
+                self._downloads = DownloadManager()
+            self._downloads.add(key, urls, path)
+
+    def _poll_downloads(self, timeout=0):
+        """Record the downloads that finished.
+
+        Waits for at most ``timeout`` seconds for one to finish, or
+        until one finishes if ``timeout`` is None.
+        """
+        if self._downloads is None:
+            return
+        for key, _, error in self._downloads.wait(timeout):
+            # A failed download is not fatal here: the build tries again,
+            # and reports the error in context.
+            if error is not None:
+                tty.debug('Downloading {0} failed: {1}'.format(
+                    self._spec(key).name, error))
+
+    def _is_downloading(self, key):
+        return self._downloads is not None and key in self._downloads.pending
+
+    def _stage_next(self, kwargs):
+        """Keep up to ``concurrent_fetches`` nodes staging."""
+        staging = [k for kind, k in self._running if kind == 'stage']
+        while self._to_stage and len(staging) < self.concurrent_fetches:
+            key = self._to_stage.pop(0)
+
+            # The root was already restaged by its own do_install
+            restage = kwargs.get('restage', False) and key in self.specs
+            self._start('stage', key, _stage_in_child, (
+                self._spec(key), restage, kwargs.get('skip_patch', False)))
+            staging.append(key)
+
+    def _spec(self, key):
+        return self.specs.get(key) or self.spec
+
+    def _start(self, kind, key, target, args, jobs=0):
+        process = multiprocessing.Process(
+            target=target, args=args + (self._results,))
+        process.start()
+        self._running[(kind, key)] = (process, jobs)
+
+    def _collect(self, timeout=1):
+        """Wait for a child to report back, and act on its result.
+
+        Returns the number of results that were handled.
+        """
+        try:
+            self._finish(*self._results.get(timeout=timeout))
+            return 1
+        except queue.Empty:
+            pass
+
+        # A child that died without reporting (e.g. it was killed) still
+        # needs to be accounted for. Anything a dead child reported is
+        # already in the queue, so drain it first.
+        handled = 0
+        try:
+            while True:
+                self._finish(*self._results.get_nowait())
+                handled += 1
+        except queue.Empty:
+            pass
+
+        for (kind, key), (process, _) in list(self._running.items()):
+            if not process.is_alive():
+                self._finish(kind, key, InstallError(
+                    'Child process exited with code {0}'.format(
+                        process.exitcode)))
+                handled += 1
+        return handled
+
+    def _finish(self, kind, key, error):
+        process, _ = self._running.pop((kind, key))
+        process.join()
+
+        if kind == 'stage':
+            # Failing to stage early is not fatal: the build stages again,
+            # and reports the error in context if it fails once more.
+            self.staged[key] = error is None
+            if error is not None:
+                tty.debug('Staging {0} ahead of its build failed: {1}'.format(
+                    self._spec(key).name, error))
+            self._stage_next(self._stage_kwargs)
+        elif error is None:
+            self._mark_installed(key)
+        else:
+            self._mark_failed(key, error)
+
+    def _build_kwargs(self, key, kwargs):
+        """Arguments to ``do_install`` for one node.
+
+        A node staged ahead of time must not be restaged by its build.
+        """
+        if self.staged.get(key):
+            return dict(kwargs, restage=False)
+        return kwargs
+
+    def _is_staging(self, key):
+        """Wait for the sources of a node if they are being staged.
+
+        Nodes still in the staging queue are taken out of it; their
+        build will stage them.
+        """
+        if key in self._to_stage:
+            self._to_stage.remove(key)
+        return ('stage', key) in self._running
+
+    def _install_serial(self, kwargs):
+        """Build one node at a time, in this process.
+
+        Binary packages still downloading are installed last among the
+        nodes that are ready.
+        """
+        ready = self._ready()
+        while ready:
+            self._poll_downloads()
+            available = [k for k in ready if not self._is_downloading(k)]
+            if not available:
+                self._poll_downloads(timeout=None)
+                continue
+
+            key = available[0]
+            while self._is_staging(key):
+                self._collect()
+
+            try:
+                self.specs[key].package.do_install(
+                    **self._build_kwargs(key, kwargs))
+                self._mark_installed(key)
+            except (spack.error.SpackError, OSError) as e:
+                self._mark_failed(key, e)
+
+            # Pick up whatever finished staging during the build
+            while self._collect(timeout=0):
+                pass
+            ready = self._ready()
+
+    def _install_concurrent(self, kwargs):
+        """Build up to ``concurrent_builds`` nodes at a time.
+
+        Each build runs in a child process, which reports back through a
+        queue.  Externals are only registered in the DB, so they are
+        handled here without forking.
+        """
+        def building():
+            return [k for kind, k in self._running if kind == 'build']
+
+        def free_jobs():
+            return self.jobs - sum(
+                j for (kind, _), (_, j) in self._running.items()
+                if kind == 'build')
+
+        while True:
+            self._poll_downloads()
+            ready = [k for k in self._ready()
+                     if k not in building() and not self._is_staging(k) and
+                     not self._is_downloading(k)]
+
+            for key in [k for k in ready if self.specs[k].external]:
+                try:
+                    self.specs[key].package.do_install(**kwargs)
+                    self._mark_installed(key)
+                except spack.error.SpackError as e:
+                    self._mark_failed(key, e)
+                ready.remove(key)
+
+            # Split what is left of the job budget among the builds that
+            # can start now
+            while ready and len(building()) < self.concurrent_builds:
+                slots = min(
+                    len(ready), self.concurrent_builds - len(building()))
+                jobs = free_jobs() // slots
+                if jobs < 1 and building():
+                    break
+
+                key = ready.pop(0)
+                jobs = max(1, jobs)
+                build_kwargs = dict(
+                    self._build_kwargs(key, kwargs), make_jobs=jobs)
+                self._start('build', key, _install_in_child,
+                            (self.specs[key], build_kwargs), jobs)
+                tty.debug('Started build of {0} with {1}'.format(
+                    self.specs[key].name, plural(jobs, 'job')))
+
+            if not self._running:
+                if not self._ready():
+                    break
+                # What is ready is still downloading
+                self._poll_downloads(timeout=None)
+                continue
+
+            self._collect()
+
+
+def _stage_in_child(spec, restage, skip_patch, results):
+    """Body of the child processes that stage sources ahead of builds."""
+    error = None
+    try:
+        pkg = spec.package
+        managed = pkg.stage.path.startswith(spack.paths.stage_path)
+        if restage and managed:
+            pkg.stage.destroy()
+
+        # Hold the stage lock while staging, and keep the stage around
+        # for the build.
+        pkg.stage.keep = True
+        with pkg.stage:
+            if skip_patch:
+                pkg.do_stage()
+            else:
+                pkg.do_patch()
+    except BaseException as e:
+        error = e
+
+    _report(results, 'stage', spec, error)
+
+
+def _install_in_child(spec, kwargs, results):
+    """Body of the child processes started by ``_install_concurrent``."""
+    error = None
+    try:
+        spec.package.do_install(**kwargs)
+    except BaseException as e:
+        error = e
+
+    _report(results, 'build', spec, error)
+
+
+def _report(results, kind, spec, error):
+    """Send the outcome of a child process to the installer."""
+    # Exceptions go through a pipe, so make sure what we send can be
+    # pickled. Queue.put() would otherwise fail silently in its thread.
+    if error is not None:
+        try:
+            pickle.dumps(error)
+        except Exception:
+            error = InstallError('{0}: {1}'.format(
+                type(error).__name__, str(error)))
+
+    results.put((kind, spec.dag_hash(), error))
+    results.close()
+    results.join_thread()
+    sys.stdout.flush()
+
+
+class InstallError(spack.error.SpackError):
+    """Raised when some of the dependencies of a spec failed to install."""
@@ -17,6 +17,7 @@ import functools
 import glob
 import hashlib
 import inspect
+import multiprocessing.pool
 import os
 import re
 import shutil
@@ -30,6 +31,7 @@ from ordereddict_backport import OrderedDict
 
 import llnl.util.tty as tty
 
+import spack.caches
 import spack.config
 import spack.paths
 import spack.store
@@ -39,6 +41,7 @@ import spack.directory_layout
 import spack.error
 import spack.fetch_strategy as fs
 import spack.hooks
+import spack.installer
 import spack.mirror
 import spack.mixins
 import spack.repo
@@ -1302,11 +1305,9 @@ class PackageBase(with_metaclass(PackageMeta, PackageViewMixin, object)):
 
     def _update_explicit_entry_in_db(self, rec, explicit):
         if explicit and not rec.explicit:
-            with spack.store.db.write_transaction():
-                rec = spack.store.db.get_record(self.spec)
-                rec.explicit = True
-                message = '{s.name}@{s.version} : marking the package explicit'
-                tty.msg(message.format(s=self))
+            spack.store.db.update_explicit(self.spec, True)
+            message = '{s.name}@{s.version} : marking the package explicit'
+            tty.msg(message.format(s=self))
 
     def try_install_from_binary_cache(self, explicit):
         tty.msg('Searching for binary cache of %s' % self.name)
@@ -1364,6 +1365,12 @@ class PackageBase(with_metaclass(PackageMeta, PackageViewMixin, object)):
                 all packages, or a list of package names to run tests for some
             dirty (bool): Don't clean the build environment before installing.
             force (bool): Install again, even if already installed.
+            concurrent_builds (int): Number of dependencies that can be
+                built at the same time. Default is ``config:concurrent_builds``
+                or 1
+            concurrent_fetches (int): Number of packages whose sources are
+                staged ahead of their build. Default is
+                ``config:concurrent_fetches``, 0 stages sources in each build
         """
         if not self.spec.concrete:
             raise ValueError("Can only install concrete packages: %s."
@@ -1396,23 +1403,26 @@ class PackageBase(with_metaclass(PackageMeta, PackageViewMixin, object)):
 
         self._do_install_pop_kwargs(kwargs)
 
-        # First, install dependencies recursively.
+        # First, install dependencies, as many at a time as allowed.
+        concurrent_builds = kwargs.pop('concurrent_builds', None) or \
+            spack.config.get('config:concurrent_builds')
+        concurrent_fetches = kwargs.pop('concurrent_fetches', None)
         if install_deps:
             tty.debug('Installing {0} dependencies'.format(self.name))
-            for dep in self.spec.traverse(order='post', root=False):
-                dep.package.do_install(
-                    install_deps=False,
-                    explicit=False,
-                    keep_prefix=keep_prefix,
-                    keep_stage=keep_stage,
-                    install_source=install_source,
-                    fake=fake,
-                    skip_patch=skip_patch,
-                    verbose=verbose,
-                    make_jobs=make_jobs,
-                    tests=tests,
-                    dirty=dirty,
-                    **kwargs)
+            installer = spack.installer.PackageInstaller(
+                self.spec, concurrent_builds=concurrent_builds,
+                jobs=make_jobs, concurrent_fetches=concurrent_fetches)
+            installer.install(
+                keep_prefix=keep_prefix,
+                keep_stage=keep_stage,
+                install_source=install_source,
+                fake=fake,
+                skip_patch=skip_patch,
+                verbose=verbose,
+                make_jobs=make_jobs,
+                tests=tests,
+                dirty=dirty,
+                **kwargs)
 
         tty.msg(colorize('@*{Installing} @*g{%s}' % self.name))
 
@@ -2128,10 +2138,19 @@ class PackageBase(with_metaclass(PackageMeta, PackageViewMixin, object)):
                 urls.append(args['url'])
         return urls
 
-    def fetch_remote_versions(self):
+    def fetch_remote_versions(self, session=None, cached=False):
         """Find remote versions of this package.
 
         Uses ``list_url`` and any other URLs listed in the package file.
+        The versions found, if any, are kept in
+        ``spack.caches.remote_versions_cache`` for
+        ``config:remote_versions_ttl`` seconds.
+
+        Args:
+            session (spack.util.web.SpiderSession): pages shared with the
+                searches for other packages
+            cached (bool): reuse the versions found recently, if any,
+                rather than searching again
 
         Returns:
             dict: a dictionary mapping versions to URLs
@@ -2139,13 +2158,27 @@ class PackageBase(with_metaclass(PackageMeta, PackageViewMixin, object)):
         if not self.all_urls:
             return {}
 
+        cache = spack.caches.remote_versions_cache
+        if cached:
+            versions = cache.get(self)
+            if versions is not None:
+                tty.debug('Using versions of {0} found recently'.format(
+                    self.name))
+                return versions
+
         try:
-            return spack.util.web.find_versions_of_archive(
-                self.all_urls, self.list_url, self.list_depth)
+            versions = spack.util.web.find_versions_of_archive(
+                self.all_urls, self.list_url, self.list_depth, session)
         except spack.util.web.NoNetworkConnectionError as e:
             tty.die("Package.fetch_versions couldn't connect to:", e.url,
                     e.message)
 
+        # searches that found nothing, e.g. without a network, are not
+        # kept, so that they are done again next time
+        if versions:
+            cache.put(self, versions)
+        return versions
+
     @property
     def rpath(self):
         """Get the rpath this package links with, as a list of paths."""
@@ -2226,6 +2259,50 @@ class Package(PackageBase):
     run_after('install')(PackageBase.sanity_check_prefix)
 
 
+def fetch_remote_versions(pkgs, jobs=None, refresh=False):
+    """Find the remote versions of many packages at the same time.
+
+    Up to ``jobs`` packages (by default ``config:download_connections``)
+    are searched at once.  Their pages are fetched by a shared pool of
+    ``config:download_connections`` threads, and pages that several of
+    them list versions from, e.g. the same ``list_url``, are fetched
+    once.  Unless
+    ``refresh`` is True, packages whose versions were found in the last
+    ``config:remote_versions_ttl`` seconds are not searched again.
+
+    Args:
+        pkgs (list): packages to search versions for
+        jobs (int): number of packages searched at the same time
+        refresh (bool): search again, even for packages whose versions
+            were found recently
+
+    Returns:
+        dict: the versions of each package, as returned by
+            ``PackageBase.fetch_remote_versions()``, by package name
+    """
+    pkgs = list(pkgs)
+    if not pkgs:
+        return {}
+    session = spack.util.web.SpiderSession()
+
+    def fetch(pkg):
+        try:
+            return pkg.name, pkg.fetch_remote_versions(
+                session, cached=not refresh)
+        except Exception as e:
+            tty.debug('Cannot find versions of {0}: {1}'.format(pkg.name, e))
+            return pkg.name, {}
+
+    jobs = jobs or spack.config.get('config:download_connections', 8)
+    pool = multiprocessing.pool.ThreadPool(max(1, min(jobs, len(pkgs))))
+    try:
+        return dict(pool.map(fetch, pkgs))
+    finally:
+        pool.close()
+        pool.join()
+        session.close()
+
+
 def install_dependency_symlinks(pkg, spec, prefix):
     """Execute a dummy install and flatten dependencies"""
     flatten_dependencies(spec, prefix)
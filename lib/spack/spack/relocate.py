@@ -4,22 +4,54 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 
+import mmap
 import os
 import platform
 import re
+import shutil
+import struct
+import tempfile
 import spack.repo
 import spack.cmd
+import spack.util.elf as elf
 import llnl.util.lang
-import llnl.util.filesystem as fs
 from spack.util.executable import Executable, ProcessError
 import llnl.util.tty as tty
 
+#: First bytes of Mach-O files, both thin and fat
+macho_magics = (b'\xfe\xed\xfa\xce', b'\xce\xfa\xed\xfe',
+                b'\xfe\xed\xfa\xcf', b'\xcf\xfa\xed\xfe',
+                b'\xca\xfe\xba\xbe')
+
+#: MIME subtypes of ELF files, by object file type
+elf_mime_subtypes = {
+    elf.ET_REL: 'x-object',
+    elf.ET_EXEC: 'x-executable',
+    elf.ET_DYN: 'x-sharedlib',
+    elf.ET_CORE: 'x-coredump',
+}
+
+#: First bytes of documents that look like text but must not be changed
+binary_document_magics = ((b'%PDF', 'pdf'), (b'%!PS', 'postscript'))
+
+#: Bytes allowed in text files: printable ASCII, common control
+#: characters, and anything with the high bit set (UTF-8, ISO-8859)
+_text_characters = bytes(bytearray(
+    [7, 8, 9, 10, 11, 12, 13, 27] + list(range(0x20, 0x7f)) +
+    list(range(0x80, 0x100))))
+
+#: Size of the chunks in which text files are read and written when
+#: relocating them
+text_relocation_chunk_size = 1024 * 1024
+
 
 class InstallRootStringException(spack.error.SpackError):
     """
     Raised when the relocated binary still has the install root string.
     """
     def __init__(self, file_path, root_path):
+        self.file_path = file_path
+        self.root_path = root_path
         super(InstallRootStringException, self).__init__(
             "\n %s \ncontains string\n %s \n"
             "after replacing it in rpaths.\n"
@@ -50,18 +82,13 @@ def get_patchelf():
 
 def get_existing_elf_rpaths(path_name):
     """
-    Return the RPATHS returned by patchelf --print-rpath path_name
-    as a list of strings.
+    Return the RPATHS of the ELF file path_name as a list of strings.
     """
     if platform.system() == 'Linux':
-        patchelf = Executable(get_patchelf())
         try:
-            output = patchelf('--print-rpath', '%s' %
-                              path_name, output=str, error=str)
-            return output.rstrip('\n').split(':')
-        except ProcessError as e:
-            tty.debug('patchelf --print-rpath produced an error on %s' %
-                      path_name, e)
+            return elf.get_rpaths(path_name)
+        except (elf.ElfParsingError, IOError, OSError) as e:
+            tty.debug('could not read the RPATH of %s' % path_name, e)
             return []
     else:
         tty.die('relocation not supported for this platform')
@@ -242,21 +269,57 @@ def modify_macho_object(cur_path, rpaths, deps, idpath,
     return
 
 
+def find_strings_with(path_name, substring):
+    """
+    Yield the NUL-delimited strings of a file that contain substring.
+
+    The file is scanned through mmap, so only the pages around matches
+    are read into memory.
+    """
+    if not isinstance(substring, bytes):
+        substring = substring.encode('utf-8')
+
+    with open(path_name, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            index = data.find(substring)
+            while index >= 0:
+                start = data.rfind(b'\0', 0, index) + 1
+                end = data.find(b'\0', index)
+                if end < 0:
+                    end = len(data)
+                yield data[start:end]
+                index = data.find(substring, end)
+        finally:
+            data.close()
+
+
 def strings_contains_installroot(path_name, root_dir):
     """
     Check if the file contain the install root string.
     """
-    strings = Executable('strings')
-    output = strings('%s' % path_name,
-                     output=str, err=str)
-    return (root_dir in output)
+    for string in find_strings_with(path_name, root_dir):
+        return True
+    return False
 
 
 def modify_elf_object(path_name, new_rpaths):
     """
     Replace orig_rpath with new_rpath in RPATH of elf object path_name
+
+    The RPATH is rewritten in place when the new one is not longer than
+    the old one; otherwise patchelf is used.
     """
     if platform.system() == 'Linux':
+        try:
+            if elf.set_rpaths(path_name, new_rpaths):
+                return
+        except elf.ElfParsingError as e:
+            tty.debug('could not parse %s, using patchelf' % path_name, e)
+
         new_joined = ':'.join(new_rpaths)
         patchelf = Executable(get_patchelf())
         try:
@@ -340,16 +403,12 @@ def relocate_binary(path_names, old_dir, new_dir, allow_root):
         tty.die("Relocation not implemented for %s" % platform.system())
 
 
-def make_link_relative(cur_path_names, orig_path_names):
+def get_relative_link_source(orig_path):
     """
-    Change absolute links to be relative.
+    Return the source of the absolute link orig_path, relative to the
+    directory of the link.
     """
-    for cur_path, orig_path in zip(cur_path_names, orig_path_names):
-        old_src = os.readlink(orig_path)
-        new_src = os.path.relpath(old_src, orig_path)
-
-        os.unlink(cur_path)
-        os.symlink(new_src, cur_path)
+    return os.path.relpath(os.readlink(orig_path), os.path.dirname(orig_path))
 
 
 def make_binary_relative(cur_path_names, orig_path_names, old_dir, allow_root):
@@ -367,7 +426,7 @@ def make_binary_relative(cur_path_names, orig_path_names, old_dir, allow_root):
                                 rpaths, deps, idpath,
                                 new_rpaths, new_deps, new_idpath)
             if (not allow_root and
-                not file_is_relocatable(cur_path, old_dir)):
+                not file_is_relocatable(cur_path)):
                 raise InstallRootStringException(cur_path, old_dir)
     elif platform.system() == 'Linux':
         for cur_path, orig_path in zip(cur_path_names, orig_path_names):
@@ -377,7 +436,7 @@ def make_binary_relative(cur_path_names, orig_path_names, old_dir, allow_root):
                                                  orig_rpaths)
                 modify_elf_object(cur_path, new_rpaths)
             if (not allow_root and
-                    not file_is_relocatable(cur_path, old_dir)):
+                    not file_is_relocatable(cur_path)):
                 raise InstallRootStringException(cur_path, old_dir)
     else:
         tty.die("Prelocation not implemented for %s" % platform.system())
@@ -403,22 +462,13 @@ def make_binary_placeholder(cur_path_names, allow_root):
         tty.die("Placeholder not implemented for %s" % platform.system())
 
 
-def make_link_placeholder(cur_path_names, cur_dir, old_dir):
+def get_placeholder_link_source(orig_path):
     """
-    Replace old install path with placeholder in absolute links.
-
-    Links in ``cur_path_names`` must link to absolute paths.
+    Return the source of the absolute link orig_path, with the install
+    root replaced by its placeholder.
     """
-    for cur_path in cur_path_names:
-        placeholder = set_placeholder(spack.store.layout.root)
-        placeholder_prefix = old_dir.replace(spack.store.layout.root,
-                                             placeholder)
-        cur_src = os.readlink(cur_path)
-        rel_src = os.path.relpath(cur_src, cur_dir)
-        new_src = os.path.join(placeholder_prefix, rel_src)
-
-        os.unlink(cur_path)
-        os.symlink(new_src, cur_path)
+    root = spack.store.layout.root
+    return os.readlink(orig_path).replace(root, set_placeholder(root), 1)
 
 
 def relocate_links(path_names, old_dir, new_dir):
@@ -438,11 +488,95 @@ def relocate_links(path_names, old_dir, new_dir):
         os.symlink(new_src, path_name)
 
 
-def relocate_text(path_names, old_dir, new_dir):
+def relocate_text(path_names, old_dir, new_dir,
+                  old_spack_prefix=None, new_spack_prefix=None):
     """
-    Replace old path with new path in text file path_name
+    Replace old path with new path in text files.
+
+    The placeholder of the old path (see ``set_placeholder()``) and, if
+    both Spack prefixes are given, the sbang shebang line of the old Spack
+    prefix are replaced too, in a single pass over each file.
     """
-    fs.filter_file('%s' % old_dir, '%s' % new_dir, *path_names, backup=False)
+    replacements = [(set_placeholder(old_dir), new_dir), (old_dir, new_dir)]
+    if old_spack_prefix and new_spack_prefix:
+        sbang = '#!/bin/bash %s/bin/sbang'
+        replacements.append((sbang % old_spack_prefix,
+                             sbang % new_spack_prefix))
+
+    for path_name in path_names:
+        replace_prefixes(path_name, replacements)
+
+
+def replace_prefixes(path_name, replacements):
+    """Replace strings in a file, without reading all of it in memory.
+
+    The file is only rewritten if it contains one of the strings.  When
+    several strings match at the same position, the longest one is
+    replaced.
+
+    Arguments:
+        path_name (str): path to the file
+        replacements (list): ``(old, new)`` pairs of strings
+
+    Returns:
+        (bool): True if the file was modified, False otherwise
+    """
+    table = dict((old.encode('utf-8'), new.encode('utf-8'))
+                 for old, new in replacements if old != new)
+    if not table:
+        return False
+
+    olds = sorted(table, key=len, reverse=True)
+    regex = re.compile(b'|'.join(re.escape(old) for old in olds))
+
+    with open(path_name, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if not regex.search(data):
+                return False
+        finally:
+            data.close()
+
+    tty.debug('Relocating text in %s' % path_name)
+
+    # A match that starts before the last (longest - 1) bytes of the
+    # buffer is entirely in the buffer, so it can be replaced right away
+    keep = len(olds[0]) - 1
+    dirname, basename = os.path.split(path_name)
+    fd, tmp_name = tempfile.mkstemp(prefix='.%s.' % basename,
+                                    dir=dirname or '.')
+    try:
+        with open(path_name, 'rb') as f:
+            with os.fdopen(fd, 'wb') as out:
+                buf = b''
+                while True:
+                    chunk = f.read(text_relocation_chunk_size)
+                    buf += chunk
+                    limit = len(buf) - keep if chunk else len(buf)
+
+                    pos = 0
+                    for match in regex.finditer(buf):
+                        if match.start() >= limit:
+                            break
+                        out.write(buf[pos:match.start()])
+                        out.write(table[match.group()])
+                        pos = match.end()
+
+                    if pos < limit:
+                        out.write(buf[pos:limit])
+                        pos = limit
+                    buf = buf[pos:]
+                    if not chunk:
+                        break
+        shutil.copymode(path_name, tmp_name)
+        os.rename(tmp_name, path_name)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+
+    return True
 
 
 def substitute_rpath(orig_rpath, topdir, new_root_path):
@@ -514,29 +648,28 @@ def file_is_relocatable(file):
     if not os.path.isabs(file):
         raise ValueError('{0} is not an absolute path'.format(file))
 
-    strings = Executable('strings')
-    patchelf = Executable(get_patchelf())
-
-    # Remove the RPATHS from the strings in the executable
-    set_of_strings = set(strings(file, output=str).split())
-
     m_type, m_subtype = mime_type(file)
     if m_type == 'application':
         tty.debug('{0},{1}'.format(m_type, m_subtype))
 
+    # The install root may appear in the RPATHs, which get relocated
+    relocated_strings = set()
     if platform.system().lower() == 'linux':
         if m_subtype == 'x-executable' or m_subtype == 'x-sharedlib':
-            rpaths = patchelf('--print-rpath', file, output=str).strip()
-            set_of_strings.discard(rpaths.strip())
+            try:
+                rpath = elf.read_elf(file).rpath
+                if rpath:
+                    relocated_strings.add(rpath)
+            except elf.ElfParsingError as e:
+                tty.debug('could not read the RPATH of %s' % file, e)
     if platform.system().lower() == 'darwin':
         if m_subtype == 'x-mach-binary':
             rpaths, deps, idpath  = macho_get_paths(file)
-            set_of_strings.discard(set(rpaths))
-            set_of_strings.discard(set(deps))
-            if idpath is not None:
-                set_of_strings.discard(idpath)
+            relocated_strings.update(
+                p.encode('utf-8') for p in rpaths + deps + [idpath] if p)
 
-    if any(spack.store.layout.root in x for x in set_of_strings):
+    strings = find_strings_with(file, spack.store.layout.root)
+    if any(x not in relocated_strings for x in strings):
         # One binary has the root folder not in the RPATH,
         # meaning that this spec is not relocatable
         msg = 'Found "{0}" in {1} strings'
@@ -570,13 +703,60 @@ def is_binary(file):
 def mime_type(file):
     """Returns the mime type and subtype of a file.
 
+    Only the types that matter for relocation are detected, from the
+    first bytes of the file: ELF, Mach-O and ``ar`` binaries, and text.
+    Other files are ``application/octet-stream``.
+
     Args:
         file: file to be analyzed
 
     Returns:
         Tuple containing the MIME type and subtype
     """
-    file_cmd = Executable('file')
-    output = file_cmd('-b', '-h', '--mime-type', file, output=str, error=str)
-    tty.debug('[MIME_TYPE] {0} -> {1}'.format(file, output.strip()))
-    return tuple(output.strip().split('/'))
+    result = _mime_type(file)
+    tty.debug('[MIME_TYPE] {0} -> {1}'.format(file, '/'.join(result)))
+    return result
+
+
+def _is_java_class(head):
+    # Java classes share their magic number with fat Mach-O files, but
+    # have a class file version where the latter have their (small)
+    # number of architectures
+    return (head.startswith(b'\xca\xfe\xba\xbe') and len(head) >= 8 and
+            struct.unpack_from('>I', head, 4)[0] > 30)
+
+
+def _mime_type(file):
+    if os.path.islink(file):
+        return ('inode', 'symlink')
+    if os.path.isdir(file):
+        return ('inode', 'directory')
+
+    with open(file, 'rb') as f:
+        head = f.read(4096)
+
+    if not head:
+        return ('inode', 'x-empty')
+
+    if head.startswith(elf.ELF_MAGIC):
+        try:
+            elf_type = elf.parse_header(head).elf_type
+            return ('application', elf_mime_subtypes.get(
+                elf_type, 'octet-stream'))
+        except elf.ElfParsingError:
+            return ('application', 'octet-stream')
+
+    if head.startswith(b'!<arch>\n'):
+        return ('application', 'x-archive')
+
+    if head[:4] in macho_magics and not _is_java_class(head):
+        return ('application', 'x-mach-binary')
+
+    for magic, subtype in binary_document_magics:
+        if head.startswith(magic):
+            return ('application', subtype)
+
+    if not head.translate(None, _text_characters):
+        return ('text', 'x-script' if head.startswith(b'#!') else 'plain')
+
+    return ('application', 'octet-stream')
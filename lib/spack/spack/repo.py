@@ -5,6 +5,8 @@
 
 import abc
 import collections
+import copy
+import multiprocessing
 import os
 import stat
 import shutil
@@ -12,9 +14,10 @@ import errno
 import sys
 import inspect
 import re
+import time
 import traceback
 from contextlib import contextmanager
-from six import string_types, add_metaclass
+from six import string_types, add_metaclass, StringIO
 
 try:
     from collections.abc import Mapping
@@ -26,6 +29,7 @@ from types import ModuleType
 import ruamel.yaml as yaml
 
 import llnl.util.lang
+import llnl.util.multiproc as mp
 import llnl.util.tty as tty
 from llnl.util.filesystem import mkdirp, install
 
@@ -36,6 +40,7 @@ import spack.patch
 import spack.spec
 import spack.util.spack_json as sjson
 import spack.util.imp as simp
+import spack.variant
 from spack.provider_index import ProviderIndex
 from spack.util.path import canonicalize_path
 from spack.util.naming import NamespaceTrie, valid_module_name
@@ -57,6 +62,10 @@ package_file_name  = 'package.py'  # Filename for packages in a repository.
 #: Guaranteed unused default value for some functions.
 NOT_PROVIDED = object()
 
+#: Minimum number of packages each process reindexes when indexes are
+#: rebuilt in parallel.  Smaller updates are done in-process.
+index_batch_size = 64
+
 #: Code in ``_package_prepend`` is prepended to imported packages.
 #:
 #: Spack packages were originally expected to call `from spack import *`
@@ -223,14 +232,152 @@ class TagIndex(Mapping):
         package = path.get(pkg_name)
 
         # Remove the package from the list of packages, if present
-        for pkg_list in self._tag_dict.values():
-            if pkg_name in pkg_list:
-                pkg_list.remove(pkg_name)
+        self.remove_package(package.name)
 
         # Add it again under the appropriate tags
         for tag in getattr(package, 'tags', []):
             self._tag_dict[tag].append(package.name)
 
+    def remove_package(self, pkg_name):
+        """Remove a package from all the tags it is listed under."""
+        for pkg_list in self._tag_dict.values():
+            if pkg_name in pkg_list:
+                pkg_list.remove(pkg_name)
+
+    def merge(self, other):
+        """Merge another TagIndex into this one."""
+        for tag, pkg_list in other.items():
+            self._tag_dict[tag].extend(pkg_list)
+
+
+def _json_value(value):
+    """Convert a directive argument into something JSON can represent.
+
+    Callables, e.g. the validators of variants, are represented by their
+    qualified name, so that the metadata is the same in every process.
+    """
+    if value is None or isinstance(value, (bool, int, float) + string_types):
+        return value
+    if isinstance(value, spack.variant.DisjointSetsOfValues):
+        return [_json_value(s) for s in value.sets]
+    if isinstance(value, (set, frozenset)):
+        return sorted((_json_value(v) for v in value), key=str)
+    if isinstance(value, (list, tuple)):
+        return [_json_value(v) for v in value]
+    if callable(value):
+        return '{0}.{1}'.format(
+            getattr(value, '__module__', None),
+            getattr(value, '__name__', type(value).__name__))
+    return str(value)
+
+
+def _package_metadata(pkg_cls):
+    """Extract the directive metadata of a package class as a JSON dict."""
+    variants = {}
+    for name, variant in pkg_cls.variants.items():
+        variants[name] = {
+            'default': _json_value(variant.default),
+            'description': variant.description,
+            'values': _json_value(variant.values),
+            'multi': variant.multi,
+        }
+
+    dependencies = {}
+    for name, conditions in pkg_cls.dependencies.items():
+        dependencies[name] = dict(
+            (str(when), {'spec': str(dep.spec), 'type': sorted(dep.type)})
+            for when, dep in conditions.items())
+
+    return {
+        'description': pkg_cls.__doc__,
+        'homepage': getattr(pkg_cls, 'homepage', None),
+        'tags': list(getattr(pkg_cls, 'tags', [])),
+        'versions': dict(
+            (str(v), dict((k, _json_value(x)) for k, x in kwargs.items()))
+            for v, kwargs in pkg_cls.versions.items()),
+        'variants': variants,
+        'dependencies': dependencies,
+        'provided': dict(
+            (str(vspec), sorted(str(w) for w in whens))
+            for vspec, whens in pkg_cls.provided.items()),
+        'conflicts': dict(
+            (spec, [[str(w), msg] for w, msg in whens])
+            for spec, whens in pkg_cls.conflicts.items()),
+        'patches': dict(
+            (str(when), [p.sha256 for p in patches])
+            for when, patches in pkg_cls.patches.items()),
+        'extendees': dict(
+            (name, str(spec)) for name, (spec, _) in
+            pkg_cls.extendees.items()),
+    }
+
+
+class PackageMetadata(object):
+    """Directive metadata of a package, read without importing it.
+
+    Attributes mirror the package class: ``versions``, ``variants``,
+    ``dependencies``, ``provided``, ``conflicts``, ``patches`` and
+    ``extendees`` are dictionaries keyed like their class counterparts,
+    but specs (including ``when`` conditions) are kept as strings.
+    Commands that only *describe* packages can use this instead of
+    ``spack.repo.get()``; anything that builds must load the real class.
+    """
+
+    def __init__(self, fullname, data):
+        self.fullname = fullname
+        self.namespace, _, self.name = fullname.rpartition('.')
+        self.__doc__ = data['description']
+        for key, value in data.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return 'PackageMetadata(%r)' % self.fullname
+
+
+class MetadataIndex(Mapping):
+    """Maps package names to their directive metadata."""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self._metadata = {}
+
+    def to_json(self, stream):
+        sjson.dump({'metadata': self._metadata}, stream)
+
+    @staticmethod
+    def from_json(stream, namespace):
+        d = sjson.load(stream)
+        if 'metadata' not in d:
+            raise IndexError('invalid metadata index; try `spack clean -m`')
+
+        r = MetadataIndex(namespace)
+        r._metadata = d['metadata']
+        return r
+
+    def __getitem__(self, pkg_name):
+        return PackageMetadata(
+            '%s.%s' % (self.namespace, pkg_name), self._metadata[pkg_name])
+
+    def __iter__(self):
+        return iter(self._metadata)
+
+    def __len__(self):
+        return len(self._metadata)
+
+    def update_package(self, pkg_fullname):
+        """Updates a package in the metadata index.
+
+        Args:
+            pkg_fullname (str): namespaced name of the package to index
+
+        """
+        pkg_cls = path.get_pkg_class(pkg_fullname)
+        self._metadata[pkg_cls.name] = _package_metadata(pkg_cls)
+
+    def merge(self, other):
+        """Merge another MetadataIndex into this one."""
+        self._metadata.update(other._metadata)
+
 
 @add_metaclass(abc.ABCMeta)
 class Indexer(object):
@@ -271,6 +418,17 @@ class Indexer(object):
     def write(self, stream):
         """Write the index to a file object."""
 
+    @abc.abstractmethod
+    def merge(self, other, pkg_fullnames):
+        """Replace what the index knows about some packages.
+
+        Arguments:
+            other (object): an index of the same kind, built only from
+                the packages in ``pkg_fullnames``
+            pkg_fullnames (list of str): namespaced names of the packages
+                that were reindexed
+        """
+
 
 class TagIndexer(Indexer):
     """Lifecycle methods for a TagIndex on a Repo."""
@@ -286,6 +444,11 @@ class TagIndexer(Indexer):
     def write(self, stream):
         self.index.to_json(stream)
 
+    def merge(self, other, pkg_fullnames):
+        for pkg_fullname in pkg_fullnames:
+            self.index.remove_package(pkg_fullname.rpartition('.')[2])
+        self.index.merge(other)
+
 
 class ProviderIndexer(Indexer):
     """Lifecycle methods for virtual package providers."""
@@ -302,6 +465,11 @@ class ProviderIndexer(Indexer):
     def write(self, stream):
         self.index.to_json(stream)
 
+    def merge(self, other, pkg_fullnames):
+        for pkg_fullname in pkg_fullnames:
+            self.index.remove_provider(pkg_fullname)
+        self.index.merge(other)
+
 
 class PatchIndexer(Indexer):
     """Lifecycle methods for patch cache."""
@@ -324,6 +492,32 @@ class PatchIndexer(Indexer):
     def update(self, pkg_fullname):
         self.index.update_package(pkg_fullname)
 
+    def merge(self, other, pkg_fullnames):
+        for pkg_fullname in pkg_fullnames:
+            self.index.remove_package(pkg_fullname)
+        self.index.update(other)
+
+
+class MetadataIndexer(Indexer):
+    """Lifecycle methods for the package metadata cache."""
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def _create(self):
+        return MetadataIndex(self.namespace)
+
+    def read(self, stream):
+        self.index = MetadataIndex.from_json(stream, self.namespace)
+
+    def update(self, pkg_fullname):
+        self.index.update_package(pkg_fullname)
+
+    def write(self, stream):
+        self.index.to_json(stream)
+
+    def merge(self, other, pkg_fullnames):
+        self.index.merge(other)
+
 
 class RepoIndex(object):
     """Container class that manages a set of Indexers for a Repo.
@@ -348,6 +542,9 @@ class RepoIndex(object):
         self.indexers = {}
         self.indexes = {}
 
+        #: Seconds spent reindexing packages, by index name
+        self.timings = {}
+
     def add_indexer(self, name, indexer):
         """Add an indexer to the repo index.
 
@@ -367,37 +564,142 @@ class RepoIndex(object):
             raise KeyError('no such index: %s' % name)
 
         if name not in self.indexes:
-            self._build_all_indexes()
+            self._build_indexes(name)
 
         return self.indexes[name]
 
-    def _build_all_indexes(self):
-        """Build all the indexes at once.
+    def _build_indexes(self, name):
+        """Read an index, after updating all the indexes that need it.
 
-        We regenerate *all* indexes whenever *any* index needs an update,
-        because the main bottleneck here is loading all the packages.  It
-        can take tens of seconds to regenerate sequentially, and we'd
-        rather only pay that cost once rather than on several
+        We regenerate *all* stale indexes whenever *any* index needs an
+        update, because the main bottleneck here is loading all the
+        packages.  It can take tens of seconds to regenerate sequentially,
+        and we'd rather only pay that cost once rather than on several
         invocations.
 
+        Only packages modified since an index was written are reindexed.
+        Each of them is loaded once for all indexes, and when there are
+        many of them (e.g., after updating a repository) they are loaded
+        in parallel, by several processes.
+
+        Indexes that are up to date are only read when they are first
+        used, since some are large: the metadata index of the builtin
+        repository takes most of a second to load.
+
+        """
+        misc_cache = spack.caches.misc_cache
+
+        # Compute which packages need to be updated in each index
+        needs_update = {}
+        for index_name in self.indexers:
+            if index_name in self.indexes:
+                continue
+            index_mtime = misc_cache.mtime(self._cache_filename(index_name))
+            pkg_names = set(x for x, sinfo in self.checker.items()
+                            if sinfo.st_mtime > index_mtime)
+            if pkg_names:
+                needs_update[index_name] = pkg_names
+
+        partial_indexes = self._index_packages(needs_update)
+
+        for index_name in set(needs_update) | set([name]):
+            start = time.time()
+            self.indexes[index_name] = self._build_index(
+                index_name, self.indexers[index_name],
+                needs_update.get(index_name), partial_indexes[index_name])
+            seconds = time.time() - start
+            self.timings[index_name] = \
+                self.timings.get(index_name, 0.0) + seconds
+
+            if index_name in needs_update:
+                tty.debug('Reindexed {0} packages for the {1} index of {2} '
+                          'in {3:.2f}s'.format(
+                              len(needs_update[index_name]), index_name,
+                              self.namespace, self.timings[index_name]))
+
+    def _cache_filename(self, name):
+        """Filename of the cache for an index (we assume they're all json)."""
+        return '{0}/{1}-index.json'.format(name, self.namespace)
+
+    def _index_packages(self, needs_update):
+        """Build partial indexes for packages that changed.
+
+        Arguments:
+            needs_update (dict): names of the packages to reindex, by
+                index name
+
+        Returns:
+            (dict): list of ``(partial index, package fullnames)`` tuples
+                for each index name
         """
-        for name, indexer in self.indexers.items():
-            self.indexes[name] = self._build_index(name, indexer)
+        partial_indexes = dict((name, []) for name in self.indexers)
+        if not needs_update:
+            return partial_indexes
 
-    def _build_index(self, name, indexer):
-        """Determine which packages need an update, and update indexes."""
+        pkg_names = sorted(set().union(*needs_update.values()))
 
-        # Filename of the provider index cache (we assume they're all json)
-        cache_filename = '{0}/{1}-index.json'.format(name, self.namespace)
+        nprocs = min(multiprocessing.cpu_count(),
+                     len(pkg_names) // index_batch_size)
+        if nprocs > 1:
+            batches = [pkg_names[i::nprocs] for i in range(nprocs)]
+        else:
+            batches = [pkg_names]
+
+        def index_batch(batch, serialize=False):
+            result = {}
+            for name in needs_update:
+                indexer = self.indexers[name]
+                start = time.time()
+                fullnames = ['%s.%s' % (self.namespace, pkg_name)
+                             for pkg_name in batch
+                             if pkg_name in needs_update[name]]
+
+                partial = copy.copy(indexer)
+                partial.create()
+                for pkg_fullname in fullnames:
+                    partial.update(pkg_fullname)
+
+                index = partial.index
+                if serialize:
+                    stream = StringIO()
+                    partial.write(stream)
+                    index = stream.getvalue()
+
+                result[name] = (index, fullnames, time.time() - start)
+            return result
+
+        def index_batch_in_child(batch):
+            # Errors are reported by reindexing the batch in the parent
+            try:
+                return index_batch(batch, serialize=True)
+            except BaseException:
+                return None
 
-        # Compute which packages needs to be updated in the cache
-        misc_cache = spack.caches.misc_cache
-        index_mtime = misc_cache.mtime(cache_filename)
+        if len(batches) > 1:
+            results = mp.parmap(index_batch_in_child, batches,
+                                fallback=index_batch)
+        else:
+            results = [index_batch(pkg_names)]
 
-        needs_update = [
-            x for x, sinfo in self.checker.items()
-            if sinfo.st_mtime > index_mtime
-        ]
+        for batch, result in zip(batches, results):
+            if result is None:
+                result = index_batch(batch)
+
+            for name, (index, fullnames, seconds) in result.items():
+                if isinstance(index, string_types):
+                    partial = copy.copy(self.indexers[name])
+                    partial.read(StringIO(index))
+                    index = partial.index
+
+                partial_indexes[name].append((index, fullnames))
+                self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+        return partial_indexes
+
+    def _build_index(self, name, indexer, needs_update, partial_indexes):
+        """Update an index with partial indexes of changed packages."""
+        cache_filename = self._cache_filename(name)
+        misc_cache = spack.caches.misc_cache
 
         index_existed = misc_cache.init_entry(cache_filename)
         if index_existed and not needs_update:
@@ -410,9 +712,8 @@ class RepoIndex(object):
             with misc_cache.write_transaction(cache_filename) as (old, new):
                 indexer.read(old) if old else indexer.create()
 
-                for pkg_name in needs_update:
-                    namespaced_name = '%s.%s' % (self.namespace, pkg_name)
-                    indexer.update(namespaced_name)
+                for index, fullnames in partial_indexes:
+                    indexer.merge(index, fullnames)
 
                 indexer.write(new)
 
@@ -646,6 +947,10 @@ class RepoPath(object):
         """Find a class for the spec's package and return the class object."""
         return self.repo_for_pkg(pkg_name).get_pkg_class(pkg_name)
 
+    def get_pkg_metadata(self, pkg_name):
+        """Find the cached directive metadata for a package by name."""
+        return self.repo_for_pkg(pkg_name).get_pkg_metadata(pkg_name)
+
     @_autospec
     def dump_provenance(self, spec, path):
         """Dump provenance information for a spec to a particular path.
@@ -944,6 +1249,8 @@ class Repo(object):
             self._repo_index.add_indexer('providers', ProviderIndexer())
             self._repo_index.add_indexer('tags', TagIndexer())
             self._repo_index.add_indexer('patches', PatchIndexer())
+            self._repo_index.add_indexer(
+                'metadata', MetadataIndexer(self.namespace))
         return self._repo_index
 
     @property
@@ -961,6 +1268,11 @@ class Repo(object):
         """Index of patches and packages they're defined on."""
         return self.index['patches']
 
+    @property
+    def metadata_index(self):
+        """Index of package directive metadata, by package name."""
+        return self.index['metadata']
+
     @_autospec
     def providers_for(self, vpkg_spec):
         providers = self.provider_index.providers_for(vpkg_spec)
@@ -972,6 +1284,17 @@ class Repo(object):
     def extensions_for(self, extendee_spec):
         return [p for p in self.all_packages() if p.extends(extendee_spec)]
 
+    def get_pkg_metadata(self, pkg_name):
+        """Get the metadata of a package without importing its module.
+
+        Raises UnknownPackageError if the package is not in this repo.
+        """
+        namespace, _, name = pkg_name.rpartition('.')
+        if not self.exists(name) or (
+                namespace and namespace != self.namespace):
+            raise UnknownPackageError(pkg_name)
+        return self.metadata_index[name]
+
     def _check_namespace(self, spec):
         """Check that the spec's namespace is the same as this repository's."""
         if spec.namespace and spec.namespace != self.namespace:
@@ -40,6 +40,8 @@ properties = {
             },
             'source_cache': {'type': 'string'},
             'misc_cache': {'type': 'string'},
+            'git_cache': {'type': 'boolean'},
+            'concretization_cache': {'type': 'integer', 'minimum': 0},
             'verify_ssl': {'type': 'boolean'},
             'debug': {'type': 'boolean'},
             'checksum': {'type': 'boolean'},
@@ -47,6 +49,18 @@ properties = {
             'dirty': {'type': 'boolean'},
             'build_language': {'type': 'string'},
             'build_jobs': {'type': 'integer', 'minimum': 1},
+            'concurrent_builds': {'type': 'integer', 'minimum': 1},
+            'concurrent_fetches': {'type': 'integer', 'minimum': 0},
+            'download_connections': {'type': 'integer', 'minimum': 1},
+            'download_retries': {'type': 'integer', 'minimum': 0},
+            'remote_versions_ttl': {'type': 'integer', 'minimum': 0},
+            'url_fetch_method': {
+                'type': 'string',
+                'enum': ['python', 'curl']},
+            'build_cache_compression': {
+                'type': 'string',
+                'enum': ['gzip', 'pgzip', 'xz', 'zstd']},
+            'build_cache_blobs': {'type': 'boolean'},
             'ccache': {'type': 'boolean'},
             'db_lock_timeout': {'type': 'integer', 'minimum': 1},
             'package_lock_timeout': {
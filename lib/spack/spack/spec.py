@@ -84,11 +84,13 @@ import hashlib
 import itertools
 import os
 import re
+import weakref
 
 from operator import attrgetter
 from six import StringIO
 from six import string_types
 from six import iteritems
+from six.moves import intern
 
 from llnl.util.filesystem import find_headers, find_libraries, is_exe
 from llnl.util.lang import key_ordering, HashableMap, ObjectWrapper, dedupe
@@ -186,6 +188,22 @@ _any_version = VersionList([':'])
 #: Max integer helps avoid passing too large a value to cyaml.
 maxint = 2 ** (ctypes.sizeof(ctypes.c_int) * 8 - 1) - 1
 
+#: Architectures and compilers shared by concrete specs read from files,
+#: keyed by their serialized form
+_shared_arch_specs = weakref.WeakValueDictionary()
+_shared_compiler_specs = weakref.WeakValueDictionary()
+
+
+def _intern_str(string):
+    """Intern ``string`` so that equal names in a large DAG share memory.
+
+    Only native strings can be interned in Python 2; anything else is
+    returned as is.
+    """
+    if type(string) is str:
+        return intern(string)
+    return string
+
 
 def colorize_spec(spec):
     """Returns a spec colorized according to the colors specified in
@@ -215,6 +233,8 @@ class ArchSpec(object):
         RHEL6), and a target (e.g. x86_64).
     """
 
+    __slots__ = ('_platform', '_platform_os', '_target', '__weakref__')
+
     # TODO: Formalize the specifications for architectures and then use
     # the appropriate parser here to read these specifications.
     def __init__(self, *args):
@@ -414,6 +434,8 @@ class CompilerSpec(object):
        versions that a package should be built with.  CompilerSpecs have a
        name and a version list. """
 
+    __slots__ = ('name', 'versions', '__weakref__')
+
     def __init__(self, *args):
         nargs = len(args)
         if nargs == 1:
@@ -529,6 +551,8 @@ class DependencySpec(object):
     - deptypes: list of strings, representing dependency relationships.
     """
 
+    __slots__ = ('parent', 'spec', 'deptypes')
+
     def __init__(self, parent, spec, deptypes):
         self.parent = parent
         self.spec = spec
@@ -563,6 +587,8 @@ _valid_compiler_flags = [
 
 class FlagMap(HashableMap):
 
+    __slots__ = ('spec',)
+
     def __init__(self, spec):
         super(FlagMap, self).__init__()
         self.spec = spec
@@ -623,6 +649,8 @@ class DependencyMap(HashableMap):
     """Each spec has a DependencyMap containing specs for its dependencies.
        The DependencyMap is keyed by name. """
 
+    __slots__ = ()
+
     def __str__(self):
         return "{deps: %s}" % ', '.join(str(d) for d in sorted(self.values()))
 
@@ -1278,18 +1306,28 @@ class Spec(object):
         """Return a hash of the entire spec DAG, including connectivity."""
         if self._hash:
             return self._hash[:length]
-        else:
-            yaml_text = syaml.dump(
-                self.to_node_dict(), default_flow_style=True, width=maxint)
-            sha = hashlib.sha1(yaml_text.encode('utf-8'))
+        return self._dag_hash({})[:length]
+
+    def _dag_hash(self, memo):
+        """Compute the DAG hash, reusing the hashes of dependencies already
+        computed during this traversal.
 
-            b32_hash = base64.b32encode(sha.digest()).lower()
-            if sys.version_info[0] >= 3:
-                b32_hash = b32_hash.decode('utf-8')
+        Concrete specs keep their hash for good. Abstract specs can still
+        change, so their hashes only live in ``memo`` (keyed by ``id()``),
+        which saves rehashing shared subtrees once per path in the DAG.
+        """
+        if self._hash:
+            return self._hash
 
+        key = id(self)
+        if key not in memo:
+            node = self.to_node_dict(
+                hash_function=lambda s: s._dag_hash(memo))
+            b32_hash = _node_hash(node)
             if self.concrete:
                 self._hash = b32_hash
-            return b32_hash[:length]
+            memo[key] = b32_hash
+        return memo[key]
 
     def dag_hash_bit_prefix(self, bits):
         """Get the first <bits> bits of the DAG hash as an integer type."""
@@ -1300,17 +1338,9 @@ class Spec(object):
             raise SpecError("Spec is not concrete: " + str(self))
 
         if not self._full_hash:
-            yaml_text = syaml.dump(
+            self._full_hash = _node_hash(
                 self.to_node_dict(hash_function=lambda s: s.full_hash()),
-                default_flow_style=True, width=maxint)
-            package_hash = self.package.content_hash()
-            sha = hashlib.sha1(yaml_text.encode('utf-8') + package_hash)
-
-            b32_hash = base64.b32encode(sha.digest()).lower()
-            if sys.version_info[0] >= 3:
-                b32_hash = b32_hash.decode('utf-8')
-
-            self._full_hash = b32_hash
+                self.package.content_hash())
 
         return self._full_hash[:length]
 
@@ -1399,22 +1429,39 @@ class Spec(object):
         node = node[name]
 
         spec = Spec(name, full_hash=node.get('full_hash', None))
-        spec.namespace = node.get('namespace', None)
+        spec.name = _intern_str(spec.name)
+        spec.namespace = _intern_str(node.get('namespace', None))
         spec._hash = node.get('hash', None)
 
         if 'version' in node or 'versions' in node:
             spec.versions = VersionList.from_dict(node)
 
+        # Concrete specs read from a file don't change anymore, so equal
+        # architectures and compilers are shared among them.
+        # _mark_concrete(False) gives specs their own copies again.
+        concrete = node.get('concrete', True)
+
         if 'arch' in node:
-            spec.architecture = ArchSpec.from_dict(node)
+            if concrete:
+                spec.architecture = _shared_spec(
+                    _shared_arch_specs, node['arch'], ArchSpec.from_dict,
+                    node)
+            else:
+                spec.architecture = ArchSpec.from_dict(node)
 
         if 'compiler' in node:
-            spec.compiler = CompilerSpec.from_dict(node)
+            if concrete:
+                spec.compiler = _shared_spec(
+                    _shared_compiler_specs, node['compiler'],
+                    CompilerSpec.from_dict, node)
+            else:
+                spec.compiler = CompilerSpec.from_dict(node)
         else:
             spec.compiler = None
 
         if 'parameters' in node:
             for name, value in node['parameters'].items():
+                name = _intern_str(name)
                 if name in _valid_compiler_flags:
                     spec.compiler_flags[name] = value
                 else:
@@ -1422,6 +1469,7 @@ class Spec(object):
                         name, value)
         elif 'variants' in node:
             for name, value in node['variants'].items():
+                name = _intern_str(name)
                 spec.variants[name] = MultiValuedVariant.from_node_dict(
                     name, value
                 )
@@ -1445,7 +1493,7 @@ class Spec(object):
             spec.external_module = None
 
         # specs read in are concrete unless marked abstract
-        spec._concrete = node.get('concrete', True)
+        spec._concrete = concrete
 
         if 'patches' in node:
             patches = node['patches']
@@ -1861,7 +1909,6 @@ class Spec(object):
                 if spec._dup(replacement, deps=False, cleardeps=False):
                     changed = True
 
-                spec._dependencies.owner = spec
                 self_index.update(spec)
                 done = False
                 break
@@ -2004,6 +2051,16 @@ class Spec(object):
                 continue
             s._normal = value
             s._concrete = value
+            if not value:
+                # the spec may be modified again: drop cached hashes, and
+                # stop sharing subobjects with other concrete specs
+                s._hash = None
+                s._full_hash = None
+                s._cmp_key_cache = None
+                if s.architecture:
+                    s.architecture = s.architecture.copy()
+                if s.compiler:
+                    s.compiler = s.compiler.copy()
 
     def concretized(self):
         """This is a non-destructive version of concretize().  First clones,
@@ -3732,6 +3789,33 @@ def base32_prefix_bits(hash_string, bits):
     return prefix_bits(hash_bytes, bits)
 
 
+def _shared_spec(shared, data, from_dict, node):
+    """Return the spec in ``shared`` for the serialized ``data``, or read
+    it from ``node`` with ``from_dict`` and add it there."""
+    if isinstance(data, dict):
+        key = tuple((k, str(v)) for k, v in sorted(data.items()))
+    else:
+        key = str(data)
+
+    spec = shared.get(key)
+    if spec is None:
+        spec = from_dict(node)
+        shared[key] = spec
+    return spec
+
+
+def _node_hash(node_dict, extra=b''):
+    """Return the base32 hash of a node dict from ``Spec.to_node_dict()``,
+    followed by optional ``extra`` bytes."""
+    yaml_text = syaml.dump_flow(node_dict)
+    sha = hashlib.sha1(yaml_text.encode('utf-8') + extra)
+
+    b32_hash = base64.b32encode(sha.digest()).lower()
+    if sys.version_info[0] >= 3:
+        b32_hash = b32_hash.decode('utf-8')
+    return b32_hash
+
+
 class SpecParseError(SpecError):
     """Wrapper for ParseError for when we're parsing specs."""
     def __init__(self, parse_error):
@@ -10,6 +10,7 @@ import errno
 import hashlib
 import tempfile
 import getpass
+import multiprocessing.pool
 from six import string_types
 from six import iteritems
 from six.moves.urllib.parse import urljoin
@@ -554,7 +555,7 @@ class ResourceStage(Stage):
 
 
 @pattern.composite(method_list=[
-    'fetch', 'create', 'created', 'check', 'expand_archive', 'restage',
+    'fetch', 'create', 'created', 'expand_archive', 'restage',
     'destroy', 'cache_local'])
 class StageComposite:
     """Composite for Stage type objects. The first item in this composite is
@@ -574,6 +575,21 @@ class StageComposite:
             item.keep = getattr(self, 'keep', False)
             item.__exit__(exc_type, exc_val, exc_tb)
 
+    def check(self):
+        """Check the archives of all the stages.  The archives of the
+        resources are hashed at the same time as the one of the package."""
+        if len(self) < 2:
+            for item in self:
+                item.check()
+            return
+
+        pool = multiprocessing.pool.ThreadPool(
+            min(len(self), multiprocessing.cpu_count()))
+        try:
+            pool.map(lambda item: item.check(), list(self))
+        finally:
+            pool.terminate()
+
     #
     # Below functions act only on the *first* stage in the composite.
     #
@@ -6,6 +6,8 @@
 import os
 import os.path
 
+import spack.cmd.debug
+import spack.environment as ev
 from spack.main import SpackCommand
 from spack.util.executable import which
 
@@ -38,3 +40,21 @@ def test_create_db_tarball(tmpdir, database):
 
             spec_suffix = '%s/.spack/spec.yaml' % spec.dag_hash()
             assert spec_suffix in contents
+
+
+def test_lockfile_memory(
+        mutable_mock_env_path, config, mutable_mock_packages, monkeypatch):
+    # the test module for `spack resource` shadows the resource module here
+    rss = iter([10.0, 12.5])
+    monkeypatch.setattr(spack.cmd.debug, 'peak_rss', lambda: next(rss))
+
+    e = ev.create('test')
+    e.add('mpileaks')
+    e.concretize()
+    e.write()
+
+    out = debug('lockfile-memory', e.lock_path)
+    nspecs = len(list(list(e.specs_by_hash.values())[0].traverse()))
+
+    assert 'read %d specs' % nspecs in out
+    assert 'difference:                           2.5 MiB' in out
@@ -4,12 +4,14 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import os
+import sys
 from six import StringIO
 
 import pytest
 
 import llnl.util.filesystem as fs
 
+import spack.caches
 import spack.modules
 import spack.environment as ev
 from spack.cmd.env import _env_create
@@ -92,6 +94,53 @@ def test_concretize():
     assert any(x.name == 'mpileaks' for x in env_specs)
 
 
+def test_concretize_in_parallel(monkeypatch):
+    e = ev.create('test')
+    for spec in ('mpileaks', 'callpath', 'dyninst', 'libelf@0.8.12'):
+        e.add(spec)
+
+    e.concretize()
+    serial = dict((str(s), c) for s, c in e.concretized_specs())
+
+    monkeypatch.setattr(ev.multiprocessing, 'cpu_count', lambda: 2)
+    e.concretize(force=True)
+    parallel = dict((str(s), c) for s, c in e.concretized_specs())
+
+    assert set(parallel) == set(['mpileaks', 'callpath', 'dyninst',
+                                 'libelf@0.8.12'])
+    for name, concrete in parallel.items():
+        assert concrete.concrete
+        assert concrete.dag_hash() == serial[name].dag_hash()
+
+    # identical sub-DAGs coming from different processes are shared
+    def dependency(spec, name):
+        return spec.dependencies_dict()[name].spec
+    assert dependency(parallel['mpileaks'], 'callpath') is parallel['callpath']
+    assert dependency(parallel['callpath'], 'dyninst') is parallel['dyninst']
+
+    e.write()
+    for s, c in ev.read('test').concretized_specs():
+        assert c.dag_hash() == parallel[str(s)].dag_hash()
+
+
+def test_concretize_in_parallel_exit_in_child(monkeypatch):
+    cache = spack.caches.concretization_cache
+    concretized = cache.concretized
+    parent = os.getpid()
+
+    # children that exit leave their batches to the parent
+    def exit_in_child(spec):
+        if os.getpid() != parent:
+            sys.exit(1)
+        return concretized(spec)
+
+    monkeypatch.setattr(cache, 'concretized', exit_in_child)
+    monkeypatch.setattr(ev.multiprocessing, 'cpu_count', lambda: 2)
+    specs = ev.concretize_specs([Spec('mpileaks'), Spec('libelf')])
+    assert [s.name for s in specs] == ['mpileaks', 'libelf']
+    assert all(s.concrete for s in specs)
+
+
 def test_env_install_all(install_mockery, mock_fetch):
     e = ev.create('test')
     e.add('cmake-client')
@@ -5,7 +5,10 @@
 
 import pytest
 
+import spack.caches
+import spack.repo
 from spack.main import SpackCommand
+from spack.util.file_cache import FileCache
 
 versions = SpackCommand('versions')
 
@@ -49,3 +52,48 @@ def test_no_versions_no_url():
     """Test a package without versions or a ``url`` attribute."""
 
     versions('opengl')
+
+
+def test_new_remote_versions(
+        mock_http_server, mock_packages, config, tmpdir, monkeypatch):
+    """Search the remote versions of several packages at once."""
+    cache = FileCache(str(tmpdir.join('cache')))
+    monkeypatch.setattr(spack.caches, 'misc_cache', cache)
+    monkeypatch.setattr(spack.caches, 'remote_versions_cache',
+                        spack.caches.RemoteVersionsCache(cache, 3600))
+
+    # The packages list their versions from the same page, and only
+    # versions newer than the ones in the package are listed, ignoring
+    # develop versions
+    downloads = mock_http_server.url + '/downloads/'
+    for name, version in (('a', '1.0'), ('b', '1.0'),
+                          ('develop-test', '0.2.15')):
+        monkeypatch.setattr(type(spack.repo.get(name)), 'url',
+                            downloads + name + '-' + version + '.tar.gz')
+    mock_http_server.files['/downloads/'] = b'''<html>
+        <a href="a-0.9.tar.gz">a-0.9</a> <a href="a-1.0.tar.gz">a-1.0</a>
+        <a href="a-2.0.tar.gz">a-2.0</a> <a href="a-2.1.tar.gz">a-2.1</a>
+        <a href="a-3.0.tar.gz">a-3.0</a>
+        <a href="b-1.0.tar.gz">b-1.0</a>
+        <a href="develop-test-0.2.15.tar.gz">develop-test-0.2.15</a>
+        <a href="develop-test-0.3.0.tar.gz">develop-test-0.3.0</a>
+        </html>'''
+    pkgs = ('a', 'b', 'develop-test')
+    expected = 'a: 3.0 2.1\ndevelop-test: 0.3.0\n'
+
+    assert versions(*pkgs) == expected
+    assert [path for path, _ in mock_http_server.requests].count(
+        '/downloads/') == 1
+
+    # Versions found recently are not searched again
+    del mock_http_server.requests[:]
+    assert versions(*pkgs) == expected
+    assert not mock_http_server.requests
+
+    assert versions('--refresh', *pkgs) == expected
+    assert mock_http_server.not_modified == ['/downloads/']
+
+    # A single package is always searched again, to find new releases
+    del mock_http_server.requests[:]
+    assert '3.0' in versions('a')
+    assert mock_http_server.requests
@@ -7,7 +7,11 @@ import pytest
 import llnl.util.lang
 
 import spack.architecture
+import spack.caches
+import spack.config
+import spack.package_prefs
 import spack.repo
+import spack.util.file_cache
 
 from spack.concretize import find_spec
 from spack.spec import Spec, CompilerSpec
@@ -520,3 +524,51 @@ class TestConcretize(object):
         t.concretize()
 
         assert s.dag_hash() == t.dag_hash()
+
+
+@pytest.fixture()
+def concretization_cache(tmpdir):
+    file_cache = spack.util.file_cache.FileCache(str(tmpdir))
+    return spack.caches.ConcretizationCache(file_cache, 2)
+
+
+@pytest.mark.usefixtures('mutable_config', 'mock_packages')
+class TestConcretizationCache(object):
+    def test_concretization_cache_hit(self, concretization_cache,
+                                      monkeypatch):
+        abstract = Spec('mpileaks ^mpich')
+        concrete = concretization_cache.concretized(abstract)
+        assert not abstract.concrete
+
+        def _concretize(self, tests=False):
+            raise AssertionError('the spec should come from the cache')
+        monkeypatch.setattr(Spec, 'concretize', _concretize)
+
+        cached = concretization_cache.concretized(Spec('mpileaks ^mpich'))
+        assert cached.concrete
+        assert cached.dag_hash() == concrete.dag_hash()
+
+    def test_concretization_cache_fingerprint(self, concretization_cache):
+        abstract = Spec('mpileaks')
+        concretization_cache.concretized(abstract)
+        assert concretization_cache.get(abstract) is not None
+        assert concretization_cache.get(abstract, tests=True) is None
+
+        providers = {'all': {'providers': {'mpi': ['zmpi']}}}
+        spack.config.set('packages', providers)
+        spack.package_prefs.PackagePrefs.clear_caches()
+        assert concretization_cache.get(abstract) is None
+
+        concrete = concretization_cache.concretized(abstract)
+        assert 'zmpi' in concrete
+
+    def test_concretization_cache_eviction(self, concretization_cache):
+        for spec in ('libelf', 'libdwarf', 'callpath'):
+            concretization_cache.concretized(Spec(spec))
+
+        assert len(concretization_cache.entries()) == 2
+        assert concretization_cache.get(Spec('libelf')) is None
+        assert concretization_cache.get(Spec('callpath')) is not None
+
+        concretization_cache.destroy()
+        assert not concretization_cache.entries()
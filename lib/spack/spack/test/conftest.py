@@ -5,16 +5,19 @@
 
 import collections
 import copy
+import hashlib
 import inspect
 import os
 import os.path
 import shutil
 import re
+import threading
 
 import ordereddict_backport
 import py
 import pytest
 import ruamel.yaml as yaml
+from six.moves import BaseHTTPServer, socketserver
 
 from llnl.util.filesystem import remove_linked_tree
 
@@ -23,12 +26,15 @@ import spack.config
 import spack.caches
 import spack.database
 import spack.directory_layout
+import spack.fetch_strategy
 import spack.environment as ev
 import spack.paths
 import spack.platforms.test
 import spack.repo
 import spack.stage
 import spack.util.executable
+import spack.util.file_cache
+import spack.util.http_fetch
 from spack.util.pattern import Bunch
 from spack.dependency import Dependency
 from spack.package import PackageBase
@@ -197,6 +203,34 @@ def mock_fetch_cache(monkeypatch):
     monkeypatch.setattr(spack.caches, 'fetch_cache', MockCache())
 
 
+@pytest.fixture(autouse=True)
+def mock_checksum_ledger(monkeypatch, tmpdir_factory):
+    """Keeps the ledger of verified archives in a temporary directory
+    shared by the tests."""
+    root = tmpdir_factory.getbasetemp().join('misc-cache')
+    ledger = spack.caches.ChecksumLedger(
+        spack.util.file_cache.FileCache(str(root)))
+    monkeypatch.setattr(spack.caches, 'checksum_ledger', ledger)
+
+
+@pytest.fixture(autouse=True)
+def mock_page_cache(monkeypatch, tmpdir_factory):
+    """Keeps the web pages read by the spider in a temporary directory
+    shared by the tests."""
+    root = tmpdir_factory.getbasetemp().join('misc-cache')
+    cache = spack.caches.PageCache(spack.util.file_cache.FileCache(str(root)))
+    monkeypatch.setattr(spack.caches, 'page_cache', cache)
+
+
+@pytest.fixture(autouse=True)
+def mock_git_cache(monkeypatch, tmpdir_factory):
+    """Keeps the mirrors of git repositories in a temporary directory
+    shared by the tests."""
+    root = tmpdir_factory.getbasetemp().join('git-cache')
+    monkeypatch.setattr(
+        spack.caches, 'git_cache', spack.fetch_strategy.GitCache(str(root)))
+
+
 # FIXME: The lines below should better be added to a fixture with
 # FIXME: session-scope. Anyhow doing it is not easy, as it seems
 # FIXME: there's some weird interaction with compilers during concretization.
@@ -706,6 +740,97 @@ def mock_svn_repository(tmpdir_factory):
     yield t
 
 
+@pytest.fixture()
+def mock_http_server(monkeypatch):
+    """Serves files over HTTP/1.1 from a thread, with persistent
+    connections and Range requests.
+
+    Files are added to ``files`` by path, as bytes, or as a ``(status,
+    headers)`` tuple for other responses.  Files have an ETag, and those
+    ending in ``.html`` or ``/`` are served as HTML.  ``requests`` records
+    the path and the Range header of each request, ``not_modified`` the
+    paths of conditional requests answered with 304, and ``connections``
+    the clients of each connection.
+    """
+    for var in ('http_proxy', 'HTTP_PROXY', 'https_proxy', 'HTTPS_PROXY'):
+        monkeypatch.delenv(var, raising=False)
+
+    files = {}
+    requests = []
+    not_modified = []
+    connections = []
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+            connections.append(self.client_address)
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            requested_range = self.headers.get('Range')
+            requests.append((self.path, requested_range))
+            entry = files.get(self.path, (404, {}))
+            if isinstance(entry, tuple):
+                status, headers = entry
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            etag = '"%s"' % hashlib.sha1(entry).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                not_modified.append(self.path)
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            start = 0
+            match = re.match(r'bytes=(\d+)-$', requested_range or '')
+            if match:
+                start = int(match.group(1))
+                if start >= len(entry):
+                    self.send_response(416)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes %d-%d/%d' % (
+                    start, len(entry) - 1, len(entry)))
+            else:
+                self.send_response(200)
+            if self.path.endswith(('.html', '/')):
+                self.send_header('Content-Type', 'text/html')
+            else:
+                self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(entry) - start))
+            self.end_headers()
+            self.wfile.write(entry[start:])
+
+    class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield Bunch(url='http://127.0.0.1:%d' % server.server_address[1],
+                files=files, requests=requests, not_modified=not_modified,
+                connections=connections)
+
+    spack.util.http_fetch.pool.clear()
+    server.shutdown()
+    server.server_close()
+
+
 @pytest.fixture()
 def mutable_mock_env_path(tmpdir_factory):
     """Fixture for mocking the internal spack environments directory."""
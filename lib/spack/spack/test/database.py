@@ -15,7 +15,9 @@ import pytest
 
 from llnl.util.tty.colify import colify
 
+import spack.database
 import spack.repo
+import spack.spec
 import spack.store
 from spack.test.conftest import MockPackageMultiRepo
 from spack.util.executable import Executable
@@ -450,3 +452,148 @@ def test_regression_issue_8036(mutable_database, usr_folder_exists):
     # Now install the external package and check again the `installed` property
     s.package.do_install(fake=True)
     assert s.package.installed
+
+
+def _db_snapshot(database):
+    """Return a fresh Database reading the same files as ``database``."""
+    return spack.database.Database(database.root)
+
+
+def test_write_appends_to_journal(mutable_database):
+    snapshot_id = spack.database._file_id(mutable_database._index_path)
+    with open(mutable_database._journal_path) as f:
+        journal_lines = len(f.readlines())
+
+    _mock_remove('mpileaks ^zmpi')
+
+    # The snapshot is left alone, and the transaction is one journal line
+    assert spack.database._file_id(
+        mutable_database._index_path) == snapshot_id
+    with open(mutable_database._journal_path) as f:
+        assert len(f.readlines()) == journal_lines + 1
+
+    # A database reading from scratch sees the change
+    other = _db_snapshot(mutable_database)
+    with other.read_transaction():
+        assert not other.query('mpileaks ^zmpi')
+        assert sorted(other.query(installed=any)) == sorted(
+            mutable_database.query(installed=any))
+        other._check_ref_counts()
+
+
+def test_read_replays_journal_tail(mutable_database):
+    other = _db_snapshot(mutable_database)
+    with other.read_transaction():
+        assert len(other.query('mpileaks')) == 3
+        offset = other._journal_offset
+
+    _mock_remove('mpileaks ^zmpi')
+
+    # Only the new journal line is read by the other instance
+    with other.read_transaction():
+        assert other._journal_offset > offset
+        assert len(other.query('mpileaks')) == 2
+        other._check_ref_counts()
+
+
+def test_journal_compaction(mutable_database, monkeypatch):
+    monkeypatch.setattr(spack.database, '_journal_min_compaction_size', 0)
+    generation = mutable_database._generation
+
+    _mock_remove('mpileaks ^zmpi')
+
+    # The change went into a new snapshot, with an empty journal
+    assert mutable_database._generation != generation
+    with open(mutable_database._journal_path) as f:
+        assert len(f.readlines()) == 1
+
+    other = _db_snapshot(mutable_database)
+    with other.read_transaction():
+        assert not other.query('mpileaks ^zmpi')
+        other._check_ref_counts()
+
+
+def test_unfinished_journal_line_is_ignored(mutable_database):
+    with open(mutable_database._journal_path, 'a') as f:
+        f.write('{"records": [["remove", ')
+
+    other = _db_snapshot(mutable_database)
+    with other.read_transaction():
+        assert len(other.query('mpileaks')) == 3
+
+    # The next write replaces the unfinished line
+    _mock_remove('mpileaks ^zmpi')
+    with other.read_transaction():
+        assert len(other.query('mpileaks')) == 2
+
+
+def test_stale_journal_is_ignored(mutable_database, tmpdir):
+    with mutable_database.write_transaction():
+        mutable_database._compact = True
+
+    # A journal from an older snapshot has nothing new for this one
+    stale = str(tmpdir.join('journal'))
+    with open(stale, 'w') as f:
+        f.write('{"generation": "stale"}\n')
+        f.write('{"records": [["remove", "nonexistent"]]}\n')
+    os.rename(stale, mutable_database._journal_path)
+
+    other = _db_snapshot(mutable_database)
+    with other.read_transaction():
+        assert len(other.query('mpileaks')) == 3
+        assert other._journal_offset is None
+
+    # Writing starts a new journal for the current snapshot
+    _mock_remove('mpileaks ^zmpi')
+    with other.read_transaction():
+        assert len(other.query('mpileaks')) == 2
+    with open(mutable_database._journal_path) as f:
+        assert 'stale' not in f.readline()
+
+
+@pytest.mark.parametrize('query', [
+    'mpileaks', 'mpileaks ^mpich', 'mpi', 'mpich@3.0.4', 'libelf@0.8.12:',
+    '%gcc', '%clang@3.3', 'arch=test-debian6-x86_64', 'os=debian6',
+    'externaltool', 'not-a-package'
+])
+def test_query_index_matches_full_scan(database, query):
+    """Queries through the indexes find what a scan of all records does."""
+    query_spec = spack.spec.Spec(query)
+    with database.read_transaction():
+        expected = sorted(
+            rec.spec for rec in database._data.values()
+            if rec.installed and rec.spec.satisfies(query_spec))
+        assert database.query(query) == expected
+
+        # Candidates can't miss any match
+        candidates = database.index.candidates(query_spec, installed=True)
+        if candidates is not None:
+            assert set(s.dag_hash() for s in expected) <= candidates
+
+
+def test_query_index_follows_changes(mutable_database):
+    with mutable_database.read_transaction():
+        assert len(mutable_database.index.by_name['mpileaks']) == 3
+
+    _mock_remove('mpileaks ^zmpi')
+    with mutable_database.read_transaction():
+        assert len(mutable_database.index.by_name['mpileaks']) == 2
+        assert mutable_database.query('zmpi', installed=True)
+        assert mutable_database.query('zmpi', explicit=False)
+
+    _mock_remove('zmpi')
+    with mutable_database.read_transaction():
+        assert not mutable_database.query('zmpi')
+        index = mutable_database.index
+        zmpi = index.by_name.get('zmpi', set())
+        assert not zmpi & index.installed
+
+    # Another instance applies the same changes from the journal
+    other = _db_snapshot(mutable_database)
+    with other.read_transaction():
+        before = len(other.index.by_name['mpileaks'])
+
+    _mock_install('mpileaks ^zmpi')
+    with other.read_transaction():
+        assert len(other.index.by_name['mpileaks']) == before + 1
+        assert len(other.query('mpileaks ^zmpi')) == 1
@@ -4,16 +4,18 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import os
+import shutil
 
 import pytest
 
 from llnl.util.filesystem import working_dir, touch
 
+import spack.caches
 import spack.repo
 import spack.config
 from spack.spec import Spec
 from spack.version import ver
-from spack.fetch_strategy import GitFetchStrategy
+from spack.fetch_strategy import GitFetchStrategy, GitCache
 from spack.util.executable import which
 
 
@@ -51,8 +53,10 @@ def git_version(request):
 
 @pytest.mark.parametrize("type_of_test", ['master', 'branch', 'tag', 'commit'])
 @pytest.mark.parametrize("secure", [True, False])
+@pytest.mark.parametrize("use_git_cache", [True, False])
 def test_fetch(type_of_test,
                secure,
+               use_git_cache,
                mock_git_repository,
                config,
                mutable_mock_packages,
@@ -78,7 +82,8 @@ def test_fetch(type_of_test,
 
     # Enter the stage directory and check some properties
     with pkg.stage:
-        with spack.config.override('config:verify_ssl', secure):
+        settings = {'verify_ssl': secure, 'git_cache': use_git_cache}
+        with spack.config.override('config', settings):
             pkg.do_stage()
 
         with working_dir(pkg.stage.source_path):
@@ -101,3 +106,112 @@ def test_fetch(type_of_test,
             assert os.path.isfile(file_path)
 
             assert h('HEAD') == h(t.revision)
+
+
+def fetch_head(args):
+    """Stage the git-test package with some version arguments, and return
+    the checked out commit and files."""
+    spec = Spec('git-test')
+    spec.concretize()
+    pkg = spack.repo.get(spec)
+    pkg.versions[ver('git')] = args
+
+    with pkg.stage:
+        pkg.do_stage()
+        with working_dir(pkg.stage.source_path):
+            git = which('git', required=True)
+            head = git('rev-parse', 'HEAD', output=str).strip()
+            files = []
+            for root, dirs, names in os.walk('.'):
+                if '.git' in dirs:
+                    dirs.remove('.git')
+                files.extend(os.path.relpath(os.path.join(root, name))
+                             for name in names if name != '.git')
+    return head, sorted(files)
+
+
+@pytest.fixture()
+def git_cache(config, tmpdir, monkeypatch):
+    """Mirror git repositories in a git cache of their own."""
+    cache = GitCache(str(tmpdir.join('git-cache')))
+    monkeypatch.setattr(spack.caches, 'git_cache', cache)
+    with spack.config.override('config:git_cache', True):
+        yield cache
+
+
+def test_git_cache(mock_git_repository, git_cache, mutable_mock_packages,
+                   tmpdir):
+    """Repositories are fetched again from their mirror in the git cache."""
+    cache = git_cache
+    remote = str(tmpdir.join('remote'))
+    shutil.copytree(mock_git_repository.path, remote)
+    commit = mock_git_repository.checks['commit'].revision
+    tag = mock_git_repository.checks['tag'].revision
+    git = which('git', required=True)
+
+    assert fetch_head({'git': remote, 'commit': commit})[0] == commit
+    assert os.path.isdir(cache.path(remote))
+
+    # New commits on a branch are fetched into the mirror
+    with working_dir(remote):
+        git('checkout', 'test-branch')
+        touch('new_file')
+        git('add', 'new_file')
+        git('commit', '-m', 'new commit')
+        new_commit = git('rev-parse', 'HEAD', output=str).strip()
+        git('checkout', 'master')
+
+    head, files = fetch_head({'git': remote, 'branch': 'test-branch'})
+    assert head == new_commit
+    assert 'new_file' in files
+
+    # Commits and tags in the mirror do not need the remote any more
+    shutil.rmtree(remote)
+    assert fetch_head({'git': remote, 'commit': commit})[0] == commit
+    head, files = fetch_head({'git': remote, 'tag': tag})
+    assert 'tag_file' in files
+
+
+@pytest.mark.parametrize("use_git_cache", [True, False])
+@pytest.mark.parametrize("type_of_test", ['branch', 'commit'])
+def test_sparse_paths(type_of_test, use_git_cache, mock_git_repository,
+                      config, mutable_mock_packages):
+    t = mock_git_repository.checks[type_of_test]
+    args = dict(t.args, sparse_paths=[t.file])
+
+    with spack.config.override('config:git_cache', use_git_cache):
+        head, files = fetch_head(args)
+    with working_dir(mock_git_repository.path):
+        assert head == mock_git_repository.hash(t.revision)
+    assert files == [t.file]
+
+
+def test_git_cache_submodules(git_cache, mutable_mock_packages, tmpdir):
+    """Submodules are cloned from their own mirror in the git cache."""
+    cache = git_cache
+    git = which('git', required=True)
+
+    sub = tmpdir.join('sub')
+    top = tmpdir.join('top')
+    for repo in (sub, top):
+        repo.ensure(dir=True)
+        with repo.as_cwd():
+            git('init')
+            git('config', 'user.name', 'Spack')
+            git('config', 'user.email', 'spack@spack.io')
+            if repo == sub:
+                touch('sub_file')
+                git('add', 'sub_file')
+            else:
+                git('-c', 'protocol.file.allow=always',
+                    'submodule', 'add', str(sub), 'lib')
+            git('commit', '-m', 'first commit')
+
+    head, files = fetch_head({'git': str(top), 'submodules': True})
+    assert 'lib/sub_file' in files
+    assert os.path.isdir(cache.path(str(sub)))
+
+    # Fetching again does not need the remote of the submodule any more
+    shutil.rmtree(str(sub))
+    head, files = fetch_head({'git': str(top), 'submodules': True})
+    assert 'lib/sub_file' in files
@@ -0,0 +1,162 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import os
+
+import pytest
+
+import spack.binary_distribution as bindist
+import spack.caches
+import spack.config
+import spack.installer
+import spack.package
+import spack.stage
+from spack.spec import Spec
+from spack.util.file_cache import FileCache
+
+
+@pytest.fixture()
+def failing_install(monkeypatch):
+    """Makes do_install fail for the package names added to the yielded
+    set."""
+    failing = set()
+    do_install = spack.package.PackageBase.do_install
+
+    def _do_install(self, **kwargs):
+        if self.name in failing:
+            raise spack.package.InstallError('mock failure: ' + self.name)
+        return do_install(self, **kwargs)
+
+    monkeypatch.setattr(spack.package.PackageBase, 'do_install', _do_install)
+    yield failing
+
+
+@pytest.mark.parametrize('concurrent_builds', [1, 2])
+def test_installer_installs_dependencies(
+        install_mockery, mock_fetch, concurrent_builds):
+    spec = Spec('dt-diamond').concretized()
+    installer = spack.installer.PackageInstaller(
+        spec, concurrent_builds=concurrent_builds, jobs=4)
+    installer.install(fake=True)
+
+    for dep in spec.traverse(root=False):
+        assert dep.package.installed
+    assert not spec.package.installed
+
+
+def test_installer_serial_order(install_mockery, mock_fetch, monkeypatch):
+    spec = Spec('dt-diamond').concretized()
+    installed = []
+
+    def _do_install(self, **kwargs):
+        installed.append(self.name)
+
+    monkeypatch.setattr(spack.package.PackageBase, 'do_install', _do_install)
+    spack.installer.PackageInstaller(spec).install()
+
+    assert installed == [
+        s.name for s in spec.traverse(order='post', root=False)]
+
+
+@pytest.mark.parametrize('concurrent_builds', [1, 2])
+def test_installer_keeps_going(
+        install_mockery, mock_fetch, failing_install, concurrent_builds):
+    spec = Spec('dt-diamond').concretized()
+    failing_install.add('dt-diamond-left')
+
+    installer = spack.installer.PackageInstaller(
+        spec, concurrent_builds=concurrent_builds)
+    with pytest.raises(spack.package.InstallError):
+        installer.install(fake=True)
+
+    # The sibling of the failed package is still installed
+    assert spec['dt-diamond-right'].package.installed
+    assert spec['dt-diamond-bottom'].package.installed
+    assert not spec['dt-diamond-left'].package.installed
+
+
+@pytest.mark.parametrize('concurrent_builds', [1, 2])
+def test_installer_skips_dependents_of_failures(
+        install_mockery, mock_fetch, failing_install, concurrent_builds):
+    spec = Spec('dt-diamond').concretized()
+    failing_install.add('dt-diamond-bottom')
+
+    installer = spack.installer.PackageInstaller(
+        spec, concurrent_builds=concurrent_builds)
+    with pytest.raises(spack.installer.InstallError):
+        installer.install(fake=True)
+
+    assert len(installer.failed) == 1
+    assert set(installer.specs[k].name for k in installer.skipped) == set(
+        ['dt-diamond-left', 'dt-diamond-right'])
+
+
+def test_do_install_concurrent_builds(install_mockery, mock_fetch):
+    spec = Spec('dt-diamond').concretized()
+    spec.package.do_install(fake=True, concurrent_builds=2)
+
+    for s in spec.traverse():
+        assert s.package.installed
+
+
+@pytest.mark.parametrize('concurrent_builds', [1, 2])
+def test_installer_stages_ahead(
+        install_mockery, mock_fetch, concurrent_builds):
+    spec = Spec('dependent-install').concretized()
+    installer = spack.installer.PackageInstaller(
+        spec, concurrent_builds=concurrent_builds, concurrent_fetches=2)
+    installer.install()
+
+    # Every node was staged ahead, including the root
+    assert len(installer.staged) == 2
+    assert all(installer.staged.values())
+    assert spec.package.stage.source_path
+
+    # The root builds from its stage, and removes it
+    spec.package.do_install(install_deps=False)
+    for s in spec.traverse():
+        assert s.package.installed
+
+
+def test_installer_does_not_stage_fake_installs(install_mockery, mock_fetch):
+    spec = Spec('dt-diamond').concretized()
+    installer = spack.installer.PackageInstaller(spec, concurrent_fetches=2)
+    installer.install(fake=True)
+
+    assert not installer.staged
+
+
+def test_installer_downloads_binaries_ahead(
+        install_mockery, mock_fetch, tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        FileCache(str(tmpdir.join('cache'))))
+    monkeypatch.setattr(bindist, '_cached_specs', None)
+
+    spec = Spec('dependent-install').concretized()
+    dep = spec['dependency-install']
+    dep.package.do_install()
+    mirror_path = str(tmpdir.join('mirror'))
+    bindist.build_tarball(dep, mirror_path, unsigned=True,
+                          regenerate_index=True)
+    dep.package.do_uninstall()
+
+    installed = []
+
+    def _do_install(self, **kwargs):
+        _, path = bindist.tarball_download_info(self.spec)
+        installed.append((self.name, os.path.exists(path)))
+    monkeypatch.setattr(spack.package.PackageBase, 'do_install', _do_install)
+
+    mirror_url = 'file://' + mirror_path
+    try:
+        spack.config.set('mirrors', {'test': mirror_url})
+        installer = spack.installer.PackageInstaller(spec)
+        installer.install()
+
+        # The binary package was downloaded before its install started
+        assert installed == [('dependency-install', True)]
+        spack.stage.Stage(mirror_url, name='build_cache').destroy()
+    finally:
+        spack.config.set('mirrors', {})
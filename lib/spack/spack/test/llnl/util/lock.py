@@ -1055,3 +1055,24 @@ def test_lock_in_current_directory(tmpdir):
                 pass
             with lk.WriteTransaction(lock):
                 pass
+
+
+def test_transaction_release_fn_holds_lock(lock_path):
+    lock = lk.Lock(lock_path)
+    held = []
+
+    def exit_fn(t, v, tb):
+        held.append((lock._reads, lock._writes, lock._file is not None))
+
+    with lk.WriteTransaction(lock, release_fn=exit_fn):
+        pass
+    with lk.ReadTransaction(lock, release_fn=exit_fn):
+        pass
+    assert held == [(0, 1, True), (1, 0, True)]
+
+    # A write nested in a read is finished before it is downgraded
+    del held[:]
+    with lk.ReadTransaction(lock):
+        with lk.WriteTransaction(lock, release_fn=exit_fn):
+            pass
+        assert held == [(1, 0, True)]
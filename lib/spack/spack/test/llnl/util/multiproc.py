@@ -0,0 +1,36 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import os
+import sys
+
+from llnl.util.multiproc import parmap
+
+
+def test_parmap():
+    assert parmap(lambda x: x * 2, [1, 2, 3]) == [2, 4, 6]
+
+
+def test_parmap_redoes_exited_children():
+    """Elements whose child exits without a result are mapped again in
+    the parent, instead of leaving it blocked on the child's pipe."""
+    parent = os.getpid()
+
+    def exit_in_child(x):
+        if x % 2 and os.getpid() != parent:
+            sys.exit(1)
+        return x, os.getpid() == parent
+
+    assert parmap(exit_in_child, [0, 1, 2, 3]) == [
+        (0, False), (1, True), (2, False), (3, True)]
+
+
+def test_parmap_fallback():
+    def fail(x):
+        if x == 'killed':
+            os._exit(0)
+        raise ValueError(x)
+
+    assert parmap(fail, ['killed', 'raised'], fallback=len) == [6, 6]
@@ -6,23 +6,35 @@
 """
 This test checks the binary packaging infrastructure
 """
+import gzip
+import hashlib
+import io
 import os
 import stat
+import tarfile
 import sys
 import shutil
 import pytest
 import argparse
+from contextlib import closing
 
+import llnl.util.tty as tty
 from llnl.util.filesystem import mkdirp
 
+import spack.caches
+import spack.relocate
 import spack.repo
 import spack.store
+import spack.util.spack_json as sjson
+import spack.util.spack_yaml as syaml
 import spack.binary_distribution as bindist
 import spack.cmd.buildcache as buildcache
 from spack.spec import Spec
 from spack.paths import mock_gpg_keys_path
 from spack.fetch_strategy import URLFetchStrategy, FetchStrategyComposite
-from spack.util.executable import ProcessError
+from spack.util.executable import ProcessError, which
+from spack.util.file_cache import FileCache
+from spack.util.web import read_from_url
 from spack.relocate import needs_binary_relocation, needs_text_relocation
 from spack.relocate import strings_contains_installroot
 from spack.relocate import get_patchelf, relocate_text, relocate_links
@@ -235,6 +247,398 @@ echo $PATH"""
     bindist._cached_specs = None
 
 
+@pytest.mark.parametrize('rel', [False, True])
+def test_build_tarball_in_one_pass(
+        install_mockery, mock_fetch, tmpdir, rel):
+    spec = Spec('trivial-install-test-package').concretized()
+    spec.package.do_install()
+
+    with open(os.path.join(spec.prefix, 'dummy.txt'), 'w') as f:
+        f.write(spec.prefix)
+    os.symlink(os.path.join(spec.prefix, 'dummy.txt'),
+               os.path.join(spec.prefix, 'link_to_dummy.txt'))
+
+    mirror_path = str(tmpdir.join('mirror'))
+    bindist.build_tarball(spec, mirror_path, rel=rel, unsigned=True)
+
+    spackfile_path = os.path.join(
+        bindist.build_cache_directory(mirror_path),
+        bindist.tarball_path_name(spec, '.spack'))
+    tarfile_name = bindist.tarball_name(spec, '.tar.gz')
+    specfile_name = bindist.tarball_name(spec, '.spec.yaml')
+    with closing(tarfile.open(spackfile_path)) as spackfile:
+        assert spackfile.getnames() == [tarfile_name, specfile_name]
+        tarball = spackfile.extractfile(tarfile_name).read()
+        spec_dict = syaml.load(
+            spackfile.extractfile(specfile_name).read().decode('utf-8'))
+
+    checksum = spec_dict['binary_cache_checksum']['hash']
+    assert checksum == hashlib.sha256(tarball).hexdigest()
+
+    root = os.path.basename(spec.prefix)
+    with closing(tarfile.open(fileobj=io.BytesIO(tarball))) as tar:
+        names = tar.getnames()
+        assert names[0] == root
+        assert os.path.join(root, 'dummy.txt') in names
+        assert tar.extractfile(os.path.join(root, 'dummy.txt')).read() == \
+            spec.prefix.encode('utf-8')
+
+        link = tar.getmember(os.path.join(root, 'link_to_dummy.txt'))
+        placeholder = spack.relocate.set_placeholder(spack.store.layout.root)
+        if rel:
+            assert link.linkname == 'dummy.txt'
+        else:
+            assert link.linkname.startswith(placeholder)
+
+        buildinfo = syaml.load(tar.extractfile(os.path.join(
+            root, '.spack', 'binary_distribution')).read().decode('utf-8'))
+        assert buildinfo['relative_rpaths'] == rel
+        assert buildinfo['relocate_textfiles'] == ['dummy.txt']
+        assert buildinfo['relocate_links'] == ['link_to_dummy.txt']
+
+    # The prefix itself is left untouched
+    assert os.readlink(os.path.join(spec.prefix, 'link_to_dummy.txt')) == \
+        os.path.join(spec.prefix, 'dummy.txt')
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'pgzip', 'xz', 'zstd'])
+def test_build_tarball_compression(
+        install_mockery, mock_fetch, tmpdir, compression):
+    fmt = bindist.compression_format(compression)
+    compressor = bindist.tarball_compressions[fmt][1]
+    if compressor and not which(compressor[0]):
+        pytest.skip('needs %s' % compressor[0])
+
+    spec = Spec('trivial-install-test-package').concretized()
+    spec.package.do_install()
+    with open(os.path.join(spec.prefix, 'dummy.txt'), 'w') as f:
+        f.write(spec.prefix)
+
+    mirror_path = str(tmpdir.join('mirror'))
+    bindist.build_tarball(spec, mirror_path, unsigned=True,
+                          compression=compression)
+    spackfile_path = os.path.join(
+        bindist.build_cache_directory(mirror_path),
+        bindist.tarball_path_name(spec, '.spack'))
+
+    with closing(tarfile.open(spackfile_path)) as spackfile:
+        assert spackfile.getnames()[0] == bindist.tarball_name(
+            spec, bindist.tarball_compressions[fmt][0])
+        spec_dict = syaml.load(spackfile.extractfile(
+            bindist.tarball_name(spec, '.spec.yaml')).read().decode('utf-8'))
+    assert spec_dict['buildinfo']['compression'] == fmt
+
+    # The reader picks the matching decompressor
+    spec.package.do_uninstall(force=True)
+    bindist.extract_tarball(spec, spackfile_path, unsigned=True)
+    with open(os.path.join(spec.prefix, 'dummy.txt')) as f:
+        assert f.read() == spec.prefix
+
+
+def test_build_tarball_blobs(
+        install_mockery, mock_fetch, tmpdir, monkeypatch):
+    monkeypatch.setattr(bindist, 'local_blob_directory',
+                        lambda: str(tmpdir.join('local-blobs')))
+
+    spec = Spec('trivial-install-test-package').concretized()
+    spec.package.do_install()
+    data = b'\0spack' * 4000
+    mkdirp(os.path.join(spec.prefix, 'share'))
+    for name in ('data1', 'data2'):
+        with open(os.path.join(spec.prefix, 'share', name), 'wb') as f:
+            f.write(data)
+    os.chmod(os.path.join(spec.prefix, 'share', 'data2'), 0o755)
+    with open(os.path.join(spec.prefix, 'small.txt'), 'w') as f:
+        f.write('small')
+
+    mirror_path = str(tmpdir.join('mirror'))
+    bindist.build_tarball(spec, mirror_path, unsigned=True, blobs=True)
+
+    # Identical files are stored once, outside of the tarball
+    digest = hashlib.sha256(data).hexdigest()
+    blob_dir = os.path.join(
+        bindist.build_cache_directory(mirror_path), 'blobs', 'sha256')
+    blob_path = os.path.join(blob_dir, digest[:2], digest)
+    assert os.listdir(blob_dir) == [digest[:2]]
+    assert os.listdir(os.path.dirname(blob_path)) == [digest]
+
+    spackfile_path = os.path.join(
+        bindist.build_cache_directory(mirror_path),
+        bindist.tarball_path_name(spec, '.spack'))
+    # The tarball has another name, which older versions of Spack don't
+    # find, rather than installing the package without its blobs
+    with closing(tarfile.open(spackfile_path)) as spackfile:
+        assert bindist.tarball_name(spec, '.tar.gz') not in \
+            spackfile.getnames()
+        tarball = spackfile.extractfile(
+            bindist.tarball_name(spec, '.blobs.tar.gz')).read()
+    root = os.path.basename(spec.prefix)
+    with closing(tarfile.open(fileobj=io.BytesIO(tarball))) as tar:
+        names = tar.getnames()
+        assert os.path.join(root, 'small.txt') in names
+        assert os.path.join(root, 'share', 'data1') not in names
+        manifest = sjson.load(
+            tar.extractfile('blob_manifest.json').read().decode('utf-8'))
+    assert sorted(manifest) == ['share/data1', 'share/data2']
+    assert manifest['share/data1']['sha256'] == digest
+
+    # Blobs already in the store are not written again
+    os.utime(blob_path, (0, 0))
+    bindist.build_tarball(spec, mirror_path, force=True, unsigned=True,
+                          blobs=True)
+    assert os.stat(blob_path).st_mtime == 0
+
+    # Missing blobs are downloaded from the mirror when extracting
+    spec.package.do_uninstall(force=True)
+    try:
+        spack.config.set('mirrors', {'test': 'file://' + mirror_path})
+        bindist.extract_tarball(spec, spackfile_path, unsigned=True)
+    finally:
+        spack.config.set('mirrors', {})
+    for name in ('data1', 'data2'):
+        with open(os.path.join(spec.prefix, 'share', name), 'rb') as f:
+            assert f.read() == data
+    assert os.stat(os.path.join(spec.prefix, 'share', 'data2')).st_mode & \
+        0o777 == 0o755
+    local_blob = os.path.join(bindist.local_blob_directory(),
+                              digest[:2], digest)
+    assert os.path.exists(local_blob)
+
+    # Blobs that don't match their checksum are rejected
+    with closing(gzip.GzipFile(local_blob, 'wb')) as f:
+        f.write(b'corrupted')
+    workdir = str(tmpdir.join('workdir'))
+    mkdirp(os.path.join(workdir, 'share'))
+    with pytest.raises(bindist.NoChecksumException):
+        bindist.restore_blobs(workdir, manifest)
+    assert not os.path.exists(local_blob)
+
+
+def _repack_spackfile(spackfile_path, dest, asc=None, checksum=None):
+    """Copy a .spack file, adding a signature for its spec file or
+    changing the checksum recorded in it."""
+    with closing(tarfile.open(spackfile_path)) as src:
+        with closing(tarfile.open(dest, 'w')) as dst:
+            for member in src.getmembers():
+                data = src.extractfile(member).read()
+                if checksum and member.name.endswith('.spec.yaml'):
+                    spec_dict = syaml.load(data.decode('utf-8'))
+                    spec_dict['binary_cache_checksum']['hash'] = checksum
+                    data = syaml.dump(spec_dict).encode('utf-8')
+                if asc and member.name.endswith('.spec.yaml'):
+                    info = tarfile.TarInfo(member.name + '.asc')
+                    info.size = len(asc)
+                    dst.addfile(info, io.BytesIO(asc))
+                member.size = len(data)
+                dst.addfile(member, io.BytesIO(data))
+
+
+def test_extract_tarballs(install_mockery, mock_fetch, tmpdir, monkeypatch):
+    specs = [Spec(name).concretized()
+             for name in ('trivial-install-test-package', 'b', 'c')]
+    mirror_path = str(tmpdir.join('mirror'))
+    spackfiles = []
+    for spec in specs:
+        spec.package.do_install(fake=True)
+        bindist.build_tarball(spec, mirror_path, unsigned=True)
+        spackfiles.append(os.path.join(
+            bindist.build_cache_directory(mirror_path),
+            bindist.tarball_path_name(spec, '.spack')))
+        spec.package.do_uninstall(force=True)
+
+    # All the signatures are verified before anything is extracted
+    verified = []
+
+    def verify(signature, path):
+        verified.append(os.path.basename(path))
+        if os.path.basename(path).startswith(
+                bindist.tarball_name(specs[1], '')):
+            raise ProcessError('BAD signature')
+    monkeypatch.setattr(spack.util.gpg.Gpg, 'verify', staticmethod(verify))
+
+    signed = [str(tmpdir.join('signed%d.spack' % i)) for i in range(2)]
+    for spackfile, dest in zip(spackfiles, signed):
+        _repack_spackfile(spackfile, dest, asc=b'signature')
+    errors = bindist.extract_tarballs(
+        zip(specs, signed + spackfiles[2:]))
+
+    assert sorted(verified) == sorted(
+        bindist.tarball_name(spec, '.spec.yaml') for spec in specs[:2])
+    assert errors[0] is None
+    assert isinstance(errors[1], bindist.NoVerifyException)
+    assert isinstance(errors[2], bindist.NoVerifyException)
+    assert [os.path.exists(spec.prefix) for spec in specs] == \
+        [True, False, False]
+
+    # Packages are extracted in separate processes, which report errors
+    monkeypatch.setattr(bindist.multiprocessing, 'cpu_count', lambda: 2)
+    bad_checksum = str(tmpdir.join('bad-checksum.spack'))
+    _repack_spackfile(spackfiles[2], bad_checksum, checksum='0' * 64)
+    errors = bindist.extract_tarballs(
+        [(specs[0], spackfiles[0]), (specs[1], spackfiles[1]),
+         (specs[2], bad_checksum)], unsigned=True)
+
+    assert isinstance(errors[0], bindist.NoOverwriteException)
+    assert errors[1] is None
+    assert isinstance(errors[2], bindist.NoChecksumException)
+    assert [os.path.exists(spec.prefix) for spec in specs] == \
+        [True, True, False]
+
+
+def test_build_cache_index(install_mockery, mock_fetch, tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        FileCache(str(tmpdir.join('cache'))))
+    monkeypatch.setattr(bindist, '_cached_specs', None)
+
+    spec = Spec('trivial-install-test-package').concretized()
+    spec.package.do_install()
+    mirror_path = str(tmpdir.join('mirror'))
+    bindist.build_tarball(spec, mirror_path, unsigned=True,
+                          regenerate_index=True)
+
+    build_cache_dir = bindist.build_cache_directory(mirror_path)
+    with open(os.path.join(build_cache_dir, 'index.json')) as f:
+        contents = f.read()
+    with open(os.path.join(build_cache_dir, 'index.json.hash')) as f:
+        assert f.read() == hashlib.sha256(
+            contents.encode('utf-8')).hexdigest()
+
+    index = syaml.load(contents)['buildcache']
+    entry = index['specs'][spec.dag_hash()]
+    assert entry['spec_yaml'] == bindist.tarball_name(spec, '.spec.yaml')
+    assert entry['full_hash'] == spec.full_hash()
+    assert spec.dag_hash() in index['nodes']
+
+    urls = []
+
+    def _read_from_url(url, *args):
+        urls.append(os.path.basename(url))
+        return read_from_url(url, *args)
+    monkeypatch.setattr(bindist, 'read_from_url', _read_from_url)
+
+    mirror_url = 'file://' + mirror_path
+    try:
+        spack.config.set('mirrors', {'test': mirror_url})
+        specs = bindist.get_specs()
+        assert [s.dag_hash() for s in specs] == [spec.dag_hash()]
+        assert specs[0].concrete
+        assert urls == ['index.json.hash', 'index.json']
+
+        # The index is downloaded again only when it changes
+        del urls[:]
+        assert bindist.read_index(mirror_url) == specs
+        assert urls == ['index.json.hash']
+
+        # Mirrors without a valid index are searched for spec.yaml files
+        with open(os.path.join(build_cache_dir, 'index.json.hash'), 'w') as f:
+            f.write('0' * 64)
+        assert bindist.read_index(mirror_url) is None
+        monkeypatch.setattr(bindist, '_cached_specs', None)
+        assert bindist.get_specs() == specs
+        spack.stage.Stage(mirror_url, name='build_cache').destroy()
+    finally:
+        spack.config.set('mirrors', {})
+
+
+def test_stale_local_build_cache_index(
+        install_mockery, mock_fetch, tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        FileCache(str(tmpdir.join('cache'))))
+    monkeypatch.setattr(bindist, '_cached_specs', None)
+
+    specs = [Spec(name).concretized() for name in
+             ('trivial-install-test-package', 'libdwarf')]
+    for spec in specs:
+        spec.package.do_install()
+    mirror_path = str(tmpdir.join('mirror'))
+    bindist.build_tarball(specs[0], mirror_path, unsigned=True,
+                          regenerate_index=True)
+    bindist.build_tarball(specs[1], mirror_path, unsigned=True)
+
+    # spec.yaml files added without rebuilding the index are not missed
+    build_cache_dir = bindist.build_cache_directory(mirror_path)
+    index_path = os.path.join(build_cache_dir, 'index.json')
+    mtime = os.path.getmtime(index_path)
+    os.utime(index_path, (mtime - 10, mtime - 10))
+
+    mirror_url = 'file://' + mirror_path
+    try:
+        spack.config.set('mirrors', {'test': mirror_url})
+        assert len(bindist.read_index(mirror_url)) == 1
+        assert sorted(s.dag_hash() for s in bindist.get_specs()) == \
+            sorted(s.dag_hash() for s in specs)
+        spack.stage.Stage(mirror_url, name='build_cache').destroy()
+    finally:
+        spack.config.set('mirrors', {})
+
+
+def test_needs_rebuild_missing_spec_yaml_over_http(
+        mock_packages, mock_http_server, tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        FileCache(str(tmpdir.join('cache'))))
+    spec = Spec('trivial-install-test-package').concretized()
+
+    assert not bindist.needs_rebuild(spec, mock_http_server.url)
+    assert bindist.needs_rebuild(spec, mock_http_server.url,
+                                 rebuild_on_errors=True)
+    assert mock_http_server.requests[0][0] == '/build_cache/' + \
+        bindist.tarball_name(spec, '.spec.yaml')
+
+
+def test_check_specs_against_index(
+        install_mockery, mock_fetch, tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        FileCache(str(tmpdir.join('cache'))))
+
+    spec = Spec('trivial-install-test-package').concretized()
+    spec.package.do_install()
+    mirror_path = str(tmpdir.join('mirror'))
+    bindist.build_tarball(spec, mirror_path, unsigned=True,
+                          regenerate_index=True)
+    missing = Spec('dependent-install').concretized()
+
+    urls = []
+
+    def _read_from_url(url, *args):
+        urls.append(os.path.basename(url))
+        return read_from_url(url, *args)
+    monkeypatch.setattr(bindist, 'read_from_url', _read_from_url)
+
+    # All the specs are checked against the index, read once, and the
+    # spec.yaml files of those missing from the index are read to confirm
+    mirrors = {'test': 'file://' + mirror_path}
+    missing_yaml = bindist.tarball_name(missing, '.spec.yaml')
+    output_file = str(tmpdir.join('rebuilds.json'))
+    assert bindist.check_specs_against_mirrors(
+        mirrors, [spec, missing], output_file) == 0
+    assert urls == ['index.json.hash', 'index.json', missing_yaml]
+
+    # Specs that cannot be found are only rebuilt with rebuild_on_errors,
+    # as without an index
+    assert bindist.check_specs_against_mirrors(
+        mirrors, [spec, missing], output_file, rebuild_on_errors=True) == 1
+    with open(output_file) as f:
+        rebuilds = sjson.load(f)
+    assert rebuilds[mirrors['test']]['rebuildSpecs'] == [{
+        'short_spec': missing.short_spec, 'hash': missing.dag_hash()}]
+
+    # Full hashes that changed since the spec was built are rebuilt too
+    monkeypatch.setattr(Spec, 'full_hash', lambda self, length=None: 'x')
+    assert bindist.specs_needing_rebuild(
+        [spec, missing], mirrors['test']) == [spec]
+    assert bindist.specs_needing_rebuild(
+        [spec, missing], mirrors['test'], True) == [spec, missing]
+
+    # Without an index, each spec.yaml is read
+    os.remove(os.path.join(
+        bindist.build_cache_directory(mirror_path), 'index.json.hash'))
+    del urls[:]
+    assert bindist.specs_needing_rebuild(
+        [spec, missing], mirrors['test']) == [spec]
+    assert urls[1:] == [bindist.tarball_name(s, '.spec.yaml')
+                        for s in (spec, missing)]
+
+
 def test_relocate_text(tmpdir):
     with tmpdir.as_cwd():
         # Validate the text path replacement
@@ -252,6 +656,39 @@ def test_relocate_text(tmpdir):
         assert(strings_contains_installroot(filename, old_dir) is False)
 
 
+@pytest.mark.parametrize('chunk_size', [3, 1024])
+def test_relocate_text_prefixes(tmpdir, monkeypatch, chunk_size):
+    monkeypatch.setattr(
+        spack.relocate, 'text_relocation_chunk_size', chunk_size)
+    old_dir = '/home/spack/opt/spack'
+    new_dir = '/opt/rh/devtoolset'
+    placeholder = spack.relocate.set_placeholder(old_dir)
+
+    script = tmpdir.join('script.sh')
+    script.write('#!/bin/bash /home/spack/bin/sbang\n'
+                 '#!%s/bin/perl\n'
+                 'PATH=%s/bin:%s/lib:/usr/bin' % (old_dir, old_dir,
+                                                  placeholder))
+    script.chmod(0o750)
+    unchanged = tmpdir.join('unchanged.txt')
+    unchanged.write('/usr/lib:/home/spack/opt/spac\n')
+    unchanged_stat = os.stat(str(unchanged))
+
+    relocate_text([str(script), str(unchanged)], old_dir, new_dir,
+                  '/home/spack', '/opt/spack')
+
+    assert script.read() == (
+        '#!/bin/bash /opt/spack/bin/sbang\n'
+        '#!%s/bin/perl\n'
+        'PATH=%s/bin:%s/lib:/usr/bin' % (new_dir, new_dir, new_dir))
+    assert stat.S_IMODE(os.stat(str(script)).st_mode) == 0o750
+
+    # Files without any of the prefixes are not rewritten
+    assert os.stat(str(unchanged)).st_ino == unchanged_stat.st_ino
+    assert os.stat(str(unchanged)).st_mtime == unchanged_stat.st_mtime
+    assert unchanged.read() == '/usr/lib:/home/spack/opt/spac\n'
+
+
 def test_relocate_links(tmpdir):
     with tmpdir.as_cwd():
         old_dir = '/home/spack/opt/spack'
@@ -264,6 +701,95 @@ def test_relocate_links(tmpdir):
         assert os.path.realpath(filename) == os.path.join(new_dir, filename)
 
 
+@pytest.fixture()
+def parallel_relocation(monkeypatch):
+    """Relocates files in parallel in batches of 4, and records the
+    batches."""
+    batches = []
+    parmap = bindist.mp.parmap
+
+    def _parmap(f, elements, **kwargs):
+        batches.extend(elements)
+        return parmap(f, elements, **kwargs)
+
+    monkeypatch.setattr(bindist, 'relocation_batch_size', 4)
+    monkeypatch.setattr(bindist.multiprocessing, 'cpu_count', lambda: 3)
+    monkeypatch.setattr(bindist.mp, 'parmap', _parmap)
+    yield batches
+
+
+def test_relocate_files_in_parallel(tmpdir, parallel_relocation):
+    old_dir = '/home/spack/opt/spack'
+    new_dir = '/opt/rh/devtoolset'
+    filenames = []
+    for i in range(10):
+        filename = str(tmpdir.join('file%d.txt' % i))
+        with open(filename, 'w') as f:
+            f.write('%s/file%d\n' % (old_dir, i))
+        filenames.append(filename)
+
+    bindist.relocate_files(relocate_text, [filenames], old_dir, new_dir)
+
+    assert len(parallel_relocation) == 2
+    for i, filename in enumerate(filenames):
+        with open(filename) as f:
+            assert f.read() == '%s/file%d\n' % (new_dir, i)
+
+
+def test_relocate_files_reports_install_root(parallel_relocation):
+    relocated = []
+
+    def relocate_or_fail(path_names, root):
+        for path_name in path_names:
+            if path_name.startswith('bad'):
+                raise spack.relocate.InstallRootStringException(
+                    path_name, root)
+
+    paths = ['good%d' % i for i in range(7)] + ['bad1', 'bad2', 'good7']
+    with pytest.raises(spack.relocate.InstallRootStringException) as e:
+        bindist.relocate_files(relocate_or_fail, [paths], '/root')
+    assert e.value.file_path == 'bad1'
+    assert e.value.root_path == '/root'
+    assert len(parallel_relocation) == 2
+
+    # Other errors are raised from the parent process
+    def fail(path_names):
+        relocated.extend(path_names)
+        if 'good5' in path_names:
+            raise ValueError('cannot relocate')
+
+    with pytest.raises(ValueError):
+        bindist.relocate_files(fail, [paths])
+    assert relocated == ['good5', 'bad1', 'good7']
+
+
+def test_relocate_files_exit_in_child(parallel_relocation):
+    relocated = []
+    parent = os.getpid()
+
+    # tty.die() in a child is raised again from the parent
+    def die(path_names):
+        relocated.extend(path_names)
+        if 'file5' in path_names:
+            tty.die('cannot relocate')
+
+    paths = ['file%d' % i for i in range(10)]
+    with pytest.raises(SystemExit):
+        bindist.relocate_files(die, [paths])
+    assert relocated == ['file5', 'file7', 'file9']
+
+    # Batches of children that exit without a result are relocated in
+    # the parent
+    def exit_in_child(path_names):
+        if os.getpid() != parent:
+            os._exit(1)
+        relocated.extend(path_names)
+
+    del relocated[:]
+    bindist.relocate_files(exit_in_child, [paths])
+    assert sorted(relocated) == sorted(paths)
+
+
 def test_needs_relocation():
 
     assert needs_binary_relocation('application', 'x-sharedlib')
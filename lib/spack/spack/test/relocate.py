@@ -6,6 +6,7 @@
 import os.path
 import platform
 import shutil
+import sys
 
 import pytest
 
@@ -14,6 +15,7 @@ import spack.paths
 import spack.relocate
 import spack.store
 import spack.tengine
+import spack.util.elf
 import spack.util.executable
 
 
@@ -60,9 +62,7 @@ def source_file(tmpdir, is_relocatable):
     return src
 
 
-@pytest.mark.requires_executables(
-    '/usr/bin/gcc', 'patchelf', 'strings', 'file'
-)
+@pytest.mark.requires_executables('/usr/bin/gcc')
 def test_file_is_relocatable(source_file, is_relocatable):
     compiler = spack.util.executable.Executable('/usr/bin/gcc')
     executable = str(source_file).replace('.c', '.x')
@@ -93,3 +93,98 @@ def test_file_is_relocatable_errors(tmpdir):
         with pytest.raises(ValueError) as exc_info:
             spack.relocate.file_is_relocatable('delete.me')
         assert 'is not an absolute path' in str(exc_info.value)
+
+
+@pytest.fixture()
+def rpath_executable(tmpdir):
+    """Returns a function that compiles an executable with an RPATH."""
+    def _compile(rpath, new_dtags=False):
+        src = tmpdir.join('main.c')
+        src.write('int main() { return 0; }\n')
+        executable = str(tmpdir.join('main.x'))
+
+        compiler = spack.util.executable.Executable('/usr/bin/gcc')
+        compiler_env = {
+            'PATH': '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:'
+                    '/bin'
+        }
+        compiler(str(src), '-o', executable, '-Wl,-rpath,' + rpath,
+                 '-Wl,--%s-new-dtags' % ('enable' if new_dtags else 'disable'),
+                 env=compiler_env)
+        return executable
+    return _compile
+
+
+@pytest.mark.skipif(
+    platform.system().lower() != 'linux', reason='ELF is Linux specific'
+)
+@pytest.mark.requires_executables('/usr/bin/gcc')
+@pytest.mark.parametrize('new_dtags', [True, False])
+def test_elf_rpaths(rpath_executable, new_dtags):
+    executable = rpath_executable('/old/prefix/lib:/usr/lib', new_dtags)
+    assert spack.util.elf.get_rpaths(executable) == [
+        '/old/prefix/lib', '/usr/lib']
+
+    # The new RPATH fits in the old one, and is forced to be a DT_RPATH
+    assert spack.util.elf.set_rpaths(executable, ['/new/lib'])
+    assert spack.util.elf.get_rpaths(executable) == ['/new/lib']
+    assert spack.util.elf.read_elf(executable).rpath_tag == \
+        spack.util.elf.DT_RPATH
+    spack.util.executable.Executable(executable)()
+
+    # A longer RPATH is left to patchelf
+    assert not spack.util.elf.set_rpaths(executable, ['/a/longer/rpath/lib'])
+    assert spack.util.elf.get_rpaths(executable) == ['/new/lib']
+
+
+@pytest.mark.skipif(
+    platform.system().lower() != 'linux', reason='ELF is Linux specific'
+)
+@pytest.mark.requires_executables('/usr/bin/gcc')
+def test_relocate_binary_in_place(rpath_executable, mutable_database):
+    old_dir = spack.store.layout.root
+    executable = rpath_executable(os.path.join(old_dir, 'foo/lib'))
+
+    spack.relocate.relocate_binary([executable], old_dir, '/new', False)
+    assert spack.relocate.get_existing_elf_rpaths(executable) == [
+        '/new/foo/lib']
+
+
+def test_mime_type(tmpdir):
+    with tmpdir.as_cwd():
+        with open('script.sh', 'w') as f:
+            f.write('#!/bin/sh\necho hello\n')
+        with open('data.bin', 'wb') as f:
+            f.write(b'\x00\x01\x02binary')
+        with open('lib.a', 'wb') as f:
+            f.write(b'!<arch>\n')
+        with open('empty', 'w'):
+            pass
+        os.symlink('script.sh', 'link')
+
+        mime_type = spack.relocate._mime_type
+        assert mime_type('script.sh') == ('text', 'x-script')
+        assert mime_type('data.bin') == ('application', 'octet-stream')
+        assert mime_type('lib.a') == ('application', 'x-archive')
+        assert mime_type('empty') == ('inode', 'x-empty')
+        assert mime_type('link') == ('inode', 'symlink')
+
+
+@pytest.mark.skipif(
+    platform.system().lower() != 'linux', reason='ELF is Linux specific'
+)
+def test_mime_type_elf():
+    assert spack.relocate._mime_type(os.path.realpath(sys.executable)) in (
+        ('application', 'x-executable'), ('application', 'x-sharedlib'))
+
+
+def test_elf_parsing_errors(tmpdir):
+    not_elf = tmpdir.join('not_elf')
+    not_elf.write('text')
+    with pytest.raises(spack.util.elf.ElfParsingError):
+        spack.util.elf.read_elf(str(not_elf))
+
+    truncated = tmpdir.join('truncated')
+    truncated.write_binary(spack.util.elf.ELF_MAGIC + b'\x02\x01\x01')
+    with pytest.raises(spack.util.elf.ElfParsingError):
+        spack.util.elf.read_elf(str(truncated))
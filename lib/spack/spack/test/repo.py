@@ -3,10 +3,15 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import collections
+import time
+
 import pytest
 
+import spack.caches
 import spack.repo
 import spack.paths
+import spack.util.file_cache
 
 
 # Unlike the repo_path fixture defined in conftest, this has a test-level
@@ -56,3 +61,125 @@ def test_repo_pkg_with_unknown_namespace(repo_for_test):
 def test_repo_unknown_pkg(repo_for_test):
     with pytest.raises(spack.repo.UnknownPackageError):
         repo_for_test.get('builtin.mock.nonexistentpackage')
+
+
+def test_repo_pkg_metadata(mock_packages, repo_for_test):
+    pkg_cls = repo_for_test.get_pkg_class('mpileaks')
+    metadata = repo_for_test.get_pkg_metadata('mpileaks')
+
+    assert metadata.fullname == 'builtin.mock.mpileaks'
+    assert metadata.description == pkg_cls.__doc__
+    assert set(metadata.versions) == set(str(v) for v in pkg_cls.versions)
+    assert set(metadata.variants) == set(pkg_cls.variants)
+    assert set(metadata.dependencies) == set(pkg_cls.dependencies)
+    assert metadata.dependencies['callpath'] == {
+        'mpileaks': {'spec': 'callpath', 'type': ['build', 'link']}}
+
+    provider = repo_for_test.get_pkg_metadata('builtin.mock.mpich')
+    assert provider.provided['mpi@:3'] == ['mpich@3:']
+
+    with pytest.raises(spack.repo.UnknownPackageError):
+        repo_for_test.get_pkg_metadata('nonexistentpackage')
+
+
+def test_repo_pkg_metadata_values(mock_packages, repo_for_test):
+    # Values that aren't plain data are stored the same way in every run
+    metadata = repo_for_test.get_pkg_metadata('a')
+    assert metadata.variants['foo']['values'] == [
+        ['none'], ['bar', 'baz', 'fee']]
+
+    assert spack.repo._json_value(
+        [set(['b', 'a']), spack.repo._json_value]) == [
+            ['a', 'b'], 'spack.repo._json_value']
+
+
+def test_repo_pkg_metadata_is_cached(mock_packages, monkeypatch):
+    # Build the index once, then check that a new repo reads it from
+    # the cache without importing any package module.
+    spack.repo.RepoPath(spack.paths.mock_packages_path).get_pkg_metadata('a')
+
+    def _no_import(self, pkg_name):
+        raise AssertionError('%s should not be imported' % pkg_name)
+    monkeypatch.setattr(spack.repo.Repo, '_get_pkg_module', _no_import)
+
+    repo = spack.repo.RepoPath(spack.paths.mock_packages_path)
+    metadata = repo.get_pkg_metadata('conflict')
+    assert metadata.conflicts['%clang'] == [['conflict+foo', None]]
+    assert metadata.variants['foo']['default'] is True
+
+
+def _build_mock_indexes(cache_dir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(str(cache_dir)))
+    repo = spack.repo.Repo(spack.paths.mock_packages_path)
+    return repo, dict((name, repo.index[name]) for name in repo.index.indexers)
+
+
+def test_repo_index_parallel(mock_packages, monkeypatch, tmpdir):
+    serial_repo, serial = _build_mock_indexes(tmpdir.join('serial'),
+                                              monkeypatch)
+
+    monkeypatch.setattr(spack.repo, 'index_batch_size', 8)
+    monkeypatch.setattr(spack.repo.multiprocessing, 'cpu_count', lambda: 4)
+
+    batches = []
+    parmap = spack.repo.mp.parmap
+
+    def _parmap(f, elements, **kwargs):
+        batches.extend(elements)
+        return parmap(f, elements, **kwargs)
+    monkeypatch.setattr(spack.repo.mp, 'parmap', _parmap)
+
+    parallel_repo, parallel = _build_mock_indexes(tmpdir.join('parallel'),
+                                                  monkeypatch)
+
+    assert serial['providers'] == parallel['providers']
+    assert serial['patches'].index == parallel['patches'].index
+    assert dict(serial['metadata']._metadata) == parallel['metadata']._metadata
+    assert (dict((t, sorted(p)) for t, p in serial['tags'].items()) ==
+            dict((t, sorted(p)) for t, p in parallel['tags'].items()))
+    assert len(batches) == 4
+    assert set(parallel_repo.index.timings) == set(parallel)
+
+
+def test_repo_index_incremental(mock_packages, monkeypatch, tmpdir):
+    _build_mock_indexes(tmpdir, monkeypatch)
+
+    reindexed = []
+    update_package = spack.repo.MetadataIndex.update_package
+
+    def _update_package(self, pkg_fullname):
+        reindexed.append(pkg_fullname)
+        update_package(self, pkg_fullname)
+    monkeypatch.setattr(
+        spack.repo.MetadataIndex, 'update_package', _update_package)
+
+    # Pretend one package was modified after the indexes were written
+    repo = spack.repo.Repo(spack.paths.mock_packages_path)
+    stats = repo._pkg_checker._packages_to_stats
+    modified = collections.namedtuple('stat', 'st_mtime')(time.time() + 60)
+    monkeypatch.setitem(stats, 'mpich', modified)
+
+    assert repo.get_pkg_metadata('mpich').provided
+    assert repo.provider_index.providers_for('mpi')
+    assert reindexed == ['builtin.mock.mpich']
+
+
+def test_repo_index_lazy(mock_packages, monkeypatch, tmpdir):
+    _build_mock_indexes(tmpdir, monkeypatch)
+
+    read = []
+    for name, cls in (('metadata', spack.repo.MetadataIndexer),
+                      ('providers', spack.repo.ProviderIndexer)):
+        def _read(self, stream, name=name, read_index=cls.read):
+            read.append(name)
+            read_index(self, stream)
+        monkeypatch.setattr(cls, 'read', _read)
+
+    # Indexes that are up to date are only read when they are used
+    repo = spack.repo.Repo(spack.paths.mock_packages_path)
+    assert repo.provider_index.providers_for('mpi')
+    assert read == ['providers']
+
+    assert repo.get_pkg_metadata('mpich').provided
+    assert read == ['providers', 'metadata']
@@ -9,13 +9,14 @@ YAML format preserves DAG information in the spec.
 
 """
 import os
+import pytest
 
 from collections import Iterable, Mapping
 
 import spack.util.spack_json as sjson
 import spack.util.spack_yaml as syaml
 from spack import repo
-from spack.spec import Spec, save_dependency_spec_yamls
+from spack.spec import Spec, save_dependency_spec_yamls, maxint
 from spack.util.spack_yaml import syaml_dict
 from spack.test.conftest import MockPackage, MockPackageMultiRepo
 
@@ -237,3 +238,70 @@ def test_save_dependency_spec_yamls_subset(tmpdir, config):
 
         assert check_specs_equal(b_spec, os.path.join(output_path, 'b.yaml'))
         assert check_specs_equal(c_spec, os.path.join(output_path, 'c.yaml'))
+
+
+@pytest.mark.parametrize('spec_str', [
+    'mpileaks ^zmpi', 'dttop', 'externaltool', 'externaltest',
+    'mpileaks+debug~opt', 'multivalue_variant foo="bar,baz"',
+    'mpileaks@1.0:5.0,6.1,7.3+debug~opt'
+])
+def test_dump_flow_matches_yaml(config, mock_packages, spec_str):
+    spec = Spec(spec_str)
+    concrete = spec.concretized()
+    spec.normalize()
+
+    for s in list(spec.traverse()) + list(concrete.traverse()):
+        node = s.to_node_dict()
+        assert syaml.dump_flow(node) == syaml.dump(
+            node, default_flow_style=True, width=maxint)
+
+
+@pytest.mark.parametrize('data', [
+    ['', 'plain', '1.0', '2', 'true', 'null', '~', "it's", ' lead', '-x',
+     '- x', 'a: b', 'a #b', '#a', '[a]', '{a}', '@1.2:', '-O2 -g'],
+    syaml_dict([('true', None), ('1.0', False), ('a b', 1), ('x', [])]),
+    {'b': {}, 'a': syaml_dict()},
+    # these go through the full emitter
+    ['line\nbreak'], [('a', 'tuple')], syaml_dict([('', 'empty key')]),
+])
+def test_dump_flow_scalars(data):
+    assert syaml.dump_flow(data) == syaml.dump(
+        data, default_flow_style=True, width=maxint)
+
+
+def test_dag_hash_caching(config, mock_packages):
+    spec = Spec('mpileaks ^zmpi')
+    spec.normalize()
+
+    # Abstract specs are hashed again after they change
+    abstract_hash = spec.dag_hash()
+    spec['zmpi'].constrain('@1.0')
+    assert spec.dag_hash() != abstract_hash
+    assert not spec._hash
+
+    # Concrete specs keep their hash, and share it with their copies
+    concrete = spec.concretized()
+    concrete_hash = concrete.dag_hash()
+    assert concrete._hash == concrete_hash
+    assert concrete.copy()._hash == concrete_hash
+
+    # Until they are not concrete anymore
+    concrete._mark_concrete(False)
+    assert not concrete._hash
+    assert concrete.dag_hash() != concrete_hash
+
+
+def test_concrete_specs_share_subobjects(config, mock_packages):
+    spec = Spec('mpileaks ^zmpi').concretized()
+    nodes = [s.to_node_dict() for s in spec.traverse()]
+    specs = [Spec.from_node_dict(node) for node in nodes]
+
+    # Equal architectures and compilers are the same object
+    assert len(set(id(s.architecture) for s in specs)) == 1
+    assert len(set(id(s.compiler) for s in specs)) == 1
+    assert specs[0].architecture == spec.architecture
+
+    # Until a spec is not concrete anymore
+    specs[0]._mark_concrete(False)
+    assert specs[0].architecture is not specs[1].architecture
+    assert specs[0].architecture == specs[1].architecture
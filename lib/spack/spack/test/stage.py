@@ -291,6 +291,31 @@ class TestStage(object):
                 root_stage.source_path, 'resource-dir', fname)
             assert os.path.exists(file_path)
 
+    @pytest.mark.disable_clean_stage_check
+    @pytest.mark.usefixtures('tmpdir_for_stage')
+    def test_composite_stage_check(
+            self, mock_archive, mock_expand_resource,
+            composite_stage_with_expanding_resource, monkeypatch):
+        composite_stage, root_stage, resource_stage = (
+            composite_stage_with_expanding_resource)
+
+        composite_stage.create()
+        composite_stage.fetch()
+
+        checked = []
+        for stage in composite_stage:
+            monkeypatch.setattr(
+                stage.fetcher, 'check', lambda s=stage: checked.append(s))
+        composite_stage.check()
+        assert sorted(checked, key=id) == sorted(composite_stage, key=id)
+
+        # Errors of the stages are raised
+        def fail():
+            raise spack.fetch_strategy.ChecksumError('bad resource')
+        monkeypatch.setattr(resource_stage.fetcher, 'check', fail)
+        with pytest.raises(spack.fetch_strategy.ChecksumError):
+            composite_stage.check()
+
     def test_setup_and_destroy_no_name_without_tmp(self, mock_archive):
         with Stage(mock_archive.url) as stage:
             check_setup(stage, None, mock_archive)
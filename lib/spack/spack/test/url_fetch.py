@@ -3,6 +3,7 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import hashlib
 import os
 import pytest
 
@@ -10,7 +11,11 @@ from llnl.util.filesystem import working_dir, is_exe
 
 import spack.repo
 import spack.config
+import spack.stage
+import spack.util.http_fetch
 from spack.fetch_strategy import from_list_url, URLFetchStrategy
+from spack.fetch_strategy import CacheURLFetchStrategy
+from spack.fetch_strategy import ChecksumError, FetchError
 from spack.spec import Spec
 from spack.version import ver
 import spack.util.crypto as crypto
@@ -62,6 +67,108 @@ def test_fetch(
             assert 'echo Building...' in contents
 
 
+@pytest.mark.parametrize('method', ['python', 'curl'])
+def test_fetch_http(mock_http_server, method, config, monkeypatch):
+    """Fetch over HTTP, in-process or with curl."""
+    data = b'not really a tarball' * 1000
+    mock_http_server.files['/archive.tar.gz'] = data
+    url = mock_http_server.url + '/archive.tar.gz'
+    digest = hashlib.sha256(data).hexdigest()
+    checksum = crypto.checksum
+
+    def record_checksum(*args, **kwargs):
+        checked.append(args)
+        return checksum(*args, **kwargs)
+    monkeypatch.setattr(crypto, 'checksum', record_checksum)
+
+    with spack.config.override('config:url_fetch_method', method):
+        for expected in (digest, '0' * 64):
+            checked = []
+            fetcher = URLFetchStrategy(url, expected, expand=False)
+            with spack.stage.Stage(fetcher) as stage:
+                stage.fetch()
+                with open(stage.archive_file, 'rb') as f:
+                    assert f.read() == data
+
+                if expected == digest:
+                    stage.check()
+                else:
+                    with pytest.raises(ChecksumError):
+                        stage.check()
+
+            # The in-process fetcher computes the checksum while fetching
+            assert bool(checked) == (method == 'curl')
+
+
+@pytest.mark.parametrize('url,verify_ssl,in_process', [
+    ('https://example.com/archive.tar.gz', True, False),
+    ('https://example.com/archive.tar.gz', False, True),
+    ('http://example.com/archive.tar.gz', True, True),
+])
+def test_fetch_in_process_without_ssl_verification(
+        url, verify_ssl, in_process, config, monkeypatch):
+    """Pythons that cannot verify certificates fetch https URLs with
+    curl."""
+    monkeypatch.setattr(spack.util.http_fetch, 'can_verify_ssl',
+                        lambda: False)
+    for var in ('http_proxy', 'HTTP_PROXY', 'https_proxy', 'HTTPS_PROXY'):
+        monkeypatch.delenv(var, raising=False)
+
+    fetcher = URLFetchStrategy(url, '0' * 64, expand=False)
+    settings = {'verify_ssl': verify_ssl, 'url_fetch_method': 'python'}
+    with spack.config.override('config', settings):
+        with spack.stage.Stage(fetcher):
+            assert fetcher._fetch_in_process() == in_process
+
+
+@pytest.mark.disable_clean_stage_check
+def test_checksum_ledger(tmpdir, config, monkeypatch):
+    """Cached archives that were verified are not hashed again, unless
+    they change."""
+    archive = tmpdir.join('archive.tar.gz')
+    archive.write('not really a tarball' * 1000)
+    digest = crypto.checksum(hashlib.sha256, str(archive))
+    checksum = crypto.checksum
+
+    def record_checksum(*args, **kwargs):
+        checked.append(args)
+        return checksum(*args, **kwargs)
+    monkeypatch.setattr(crypto, 'checksum', record_checksum)
+
+    def check(path, expected, copy=None):
+        fetcher = CacheURLFetchStrategy('file://' + str(path), expected,
+                                        expand=False)
+        with spack.stage.Stage(fetcher) as stage:
+            stage.fetch()
+            stage.check()
+            if copy:
+                fetcher.archive(str(copy))
+
+    checked = []
+    check(archive, digest)
+    assert len(checked) == 1
+
+    checked = []
+    check(archive, digest, copy=tmpdir.join('copy.tar.gz'))
+    assert not checked
+
+    # Copies of verified archives, e.g. in a mirror, are verified too
+    check(tmpdir.join('copy.tar.gz'), digest)
+    assert not checked
+
+    # A different digest, or a modified archive, are checked again when
+    # the cached archive is fetched
+    with pytest.raises(FetchError):
+        check(archive, '0' * 64)
+    assert len(checked) == 1
+
+    archive.write('not really a tarball' * 1001)
+    checked = []
+    with pytest.raises(FetchError):
+        check(archive, digest)
+    assert len(checked) == 1
+
+
 def test_from_list_url(mock_packages, config):
     pkg = spack.repo.get('url-list-test')
 
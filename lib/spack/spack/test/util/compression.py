@@ -0,0 +1,76 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Test Spack's compression utilities."""
+import errno
+import gzip
+import io
+from contextlib import closing
+
+import pytest
+
+from spack.util.compression import ParallelGzipWriter, CompressorProcess
+from spack.util.compression import decompressed
+from spack.util.executable import which, ProcessError
+
+#: Some data that compresses, but not to nothing
+data = b''.join(b'%d: %s\n' % (i, b'spack' * (i % 7)) for i in range(20000))
+
+
+def test_parallel_gzip(tmpdir):
+    path = str(tmpdir.join('data.gz'))
+    with open(path, 'wb') as f:
+        writer = ParallelGzipWriter(f, threads=3, block_size=4096)
+        for i in range(0, len(data), 1000):
+            writer.write(data[i:i + 1000])
+        writer.close()
+
+    with closing(gzip.open(path)) as f:
+        assert f.read() == data
+
+    # Blocks are independent gzip members, which stock gzip can read
+    gunzip = which('gzip', required=True)
+    assert gunzip('-dc', path, output=str) == data.decode('utf-8')
+
+
+@pytest.mark.skipif(not which('xz'), reason='needs xz')
+def test_compressor_process(tmpdir):
+    path = str(tmpdir.join('data.xz'))
+    with open(path, 'wb') as f:
+        compressor = CompressorProcess(f, ['xz', '-c'])
+        compressor.write(data)
+        compressor.close()
+
+    with decompressed(path, ['xz', '-d', '-c']) as stream:
+        assert stream.read(10) == data[:10]
+    with decompressed(path, ['xz', '-d', '-c']) as stream:
+        assert stream.read() == data
+
+    # Errors of the external programs are reported
+    with pytest.raises(ProcessError):
+        with decompressed(path, ['gzip', '-d', '-c']) as stream:
+            stream.read()
+
+    compressor = CompressorProcess(io.BytesIO(), ['false'])
+    with pytest.raises(ProcessError):
+        compressor.close()
+
+
+def test_compressor_process_output_error():
+    """Errors writing the output of the compressor are raised, rather than
+    leaving the compressor blocked on a full pipe."""
+    class FullDisk(object):
+        def write(self, data):
+            raise IOError(errno.ENOSPC, 'No space left on device')
+
+    compressor = CompressorProcess(FullDisk(), ['cat'])
+    with pytest.raises(IOError) as e:
+        for i in range(100):
+            compressor.write(data)
+    assert e.value.errno == errno.ENOSPC
+
+    with pytest.raises(IOError) as e:
+        compressor.close()
+    assert e.value.errno == errno.ENOSPC
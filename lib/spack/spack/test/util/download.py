@@ -0,0 +1,123 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Test Spack's concurrent downloads."""
+import os
+import threading
+import time
+
+import pytest
+
+import spack.util.download
+from spack.util.download import DownloadManager, DownloadError
+
+
+@pytest.fixture()
+def files(tmpdir):
+    """Files to download, as file:// URLs by name."""
+    urls = {}
+    for name in ('a', 'b', 'c', 'd'):
+        path = tmpdir.join('remote', name)
+        path.write(name * 1000, ensure=True)
+        urls[name] = 'file://' + str(path)
+    return urls
+
+
+def test_download_manager(tmpdir, files):
+    dest = tmpdir.join('dest')
+    with DownloadManager(connections=2, retries=0) as downloads:
+        for name, url in files.items():
+            downloads.add(name, [url], str(dest.join(name)))
+        downloads.add('missing', [files['a'] + '.missing'],
+                      str(dest.join('missing')))
+
+        results = dict((key, (path, error))
+                       for key, path, error in downloads.as_completed())
+
+    assert not downloads.pending
+    assert sorted(results) == ['a', 'b', 'c', 'd', 'missing']
+    for name in files:
+        path, error = results[name]
+        assert error is None
+        assert path == str(dest.join(name))
+        assert open(path).read() == name * 1000
+
+    path, error = results['missing']
+    assert isinstance(error, DownloadError)
+    assert not error.transient
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + '.part')
+
+
+def test_download_manager_error_drops_queued_downloads(
+        tmpdir, files, monkeypatch):
+    # Downloads run in another process: record them in files
+    started = tmpdir.mkdir('started')
+    download = spack.util.download.download
+
+    def _download(url, path, verify_ssl):
+        started.ensure(os.path.basename(url))
+        time.sleep(10)
+        return download(url, path, verify_ssl)
+    monkeypatch.setattr(spack.util.download, 'download', _download)
+
+    dest = tmpdir.join('dest')
+    start = time.time()
+    with pytest.raises(ValueError):
+        with DownloadManager(connections=1, retries=0) as downloads:
+            for name in sorted(files):
+                downloads.add(name, [files[name]], str(dest.join(name)))
+            while not started.listdir():
+                time.sleep(0.01)
+            raise ValueError('install failed')
+
+    # The download in flight was killed, and the others never started
+    assert time.time() - start < 10
+    assert not downloads.pending
+    assert [f.basename for f in started.listdir()] == ['a']
+    assert not dest.listdir()
+    assert list(downloads.as_completed()) == []
+
+
+def test_download_manager_forks_no_threads(tmpdir, files):
+    threads = threading.active_count()
+    with DownloadManager(connections=4, retries=0) as downloads:
+        for name, url in files.items():
+            downloads.add(name, [url], str(tmpdir.join(name)))
+        assert threading.active_count() == threads
+        assert len(list(downloads.as_completed())) == len(files)
+
+
+def test_download_falls_back_to_next_url(tmpdir, files):
+    path = str(tmpdir.join('a'))
+    url = spack.util.download.download_with_retries(
+        [files['b'] + '.missing', files['a']], path, retries=0)
+    assert url == files['a']
+    assert open(path).read() == 'a' * 1000
+
+
+def test_download_retries_transient_errors(tmpdir, files, monkeypatch):
+    monkeypatch.setattr(spack.util.download, 'retry_backoff', 0)
+    attempts = []
+    download = spack.util.download.download
+
+    def _download(url, path, verify_ssl):
+        attempts.append(url)
+        if len(attempts) < 3:
+            raise DownloadError(url, 56)  # failure receiving data
+        return download(url, path, verify_ssl)
+    monkeypatch.setattr(spack.util.download, 'download', _download)
+
+    path = str(tmpdir.join('a'))
+    spack.util.download.download_with_retries([files['a']], path, retries=2)
+    assert attempts == [files['a']] * 3
+    assert open(path).read() == 'a' * 1000
+
+    # Once the retries are exhausted, the error is reported
+    del attempts[:]
+    with pytest.raises(DownloadError):
+        spack.util.download.download_with_retries(
+            [files['a']], path, retries=1)
+    assert len(attempts) == 2
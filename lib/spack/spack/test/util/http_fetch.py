@@ -0,0 +1,89 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Test Spack's in-process HTTP fetcher."""
+import hashlib
+import os
+
+import pytest
+
+import spack.util.http_fetch as http_fetch
+from spack.util.http_fetch import HTTPFetchError
+
+data = b''.join(b'%d\n' % i for i in range(100000))
+
+
+def test_fetch_reuses_connections(tmpdir, mock_http_server):
+    for name in ('a', 'b', 'c'):
+        mock_http_server.files['/' + name] = name.encode('utf-8') + data
+
+    for name in ('a', 'b', 'c'):
+        path = str(tmpdir.join(name))
+        content_type, digest = http_fetch.fetch(
+            mock_http_server.url + '/' + name, path, hashlib.sha256)
+
+        expected = name.encode('utf-8') + data
+        assert content_type == 'application/octet-stream'
+        assert digest == hashlib.sha256(expected).hexdigest()
+        with open(path, 'rb') as f:
+            assert f.read() == expected
+        assert not os.path.exists(path + '.part')
+
+    assert len(mock_http_server.requests) == 3
+    assert len(mock_http_server.connections) == 1
+
+
+def test_fetch_resumes_partial_files(tmpdir, mock_http_server):
+    mock_http_server.files['/a'] = data
+    path = str(tmpdir.join('a'))
+    with open(path + '.part', 'wb') as f:
+        f.write(data[:1000])
+
+    _, digest = http_fetch.fetch(
+        mock_http_server.url + '/a', path, hashlib.md5)
+    assert mock_http_server.requests == [('/a', 'bytes=1000-')]
+    assert digest == hashlib.md5(data).hexdigest()
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+    # A partial file that is too long is downloaded again
+    with open(path + '.part', 'wb') as f:
+        f.write(data + b'garbage')
+    http_fetch.fetch(mock_http_server.url + '/a', path)
+    assert mock_http_server.requests[1:] == [
+        ('/a', 'bytes=%d-' % (len(data) + 7)), ('/a', None)]
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_fetch_redirects_and_errors(tmpdir, mock_http_server):
+    mock_http_server.files['/a'] = data
+    mock_http_server.files['/old/a'] = (301, {'Location': '/a'})
+    mock_http_server.files['/unavailable'] = (503, {})
+
+    path = str(tmpdir.join('a'))
+    http_fetch.fetch(mock_http_server.url + '/old/a', path)
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+    with pytest.raises(HTTPFetchError) as e:
+        http_fetch.fetch(mock_http_server.url + '/missing', path)
+    assert e.value.status == 404
+    assert not e.value.transient
+
+    with pytest.raises(HTTPFetchError) as e:
+        http_fetch.fetch(mock_http_server.url + '/unavailable', path)
+    assert e.value.transient
+
+    # Responses of errors are read, so the connection is still reused
+    assert len(mock_http_server.connections) == 1
+
+
+def test_supports(monkeypatch):
+    monkeypatch.delenv('no_proxy', raising=False)
+    monkeypatch.setenv('https_proxy', 'http://proxy.example.com:3128')
+    assert http_fetch.supports('http://example.com/a.tar.gz')
+    assert not http_fetch.supports('https://example.com/a.tar.gz')
+    assert not http_fetch.supports('file:///tmp/a.tar.gz')
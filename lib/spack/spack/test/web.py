@@ -4,10 +4,18 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 """Tests for web.py."""
+import multiprocessing.pool
 import os
 
+import pytest
+from six.moves.urllib.error import HTTPError
+
+import spack.caches
 import spack.paths
+import spack.util.web
+from spack.util.file_cache import FileCache
 from spack.util.web import spider, find_versions_of_archive
+from spack.util.web import read_from_url
 from spack.version import ver
 
 
@@ -103,6 +111,85 @@ def test_spider_3():
     assert page_4 in links
 
 
+def test_spider_session_shares_threads(monkeypatch):
+    pools = []
+    ThreadPool = multiprocessing.pool.ThreadPool
+
+    def _ThreadPool(processes):
+        pools.append(processes)
+        return ThreadPool(processes)
+    monkeypatch.setattr(multiprocessing.pool, 'ThreadPool', _ThreadPool)
+
+    session = spack.util.web.SpiderSession(connections=2)
+    try:
+        assert len(spider(root, depth=3, session=session)[0]) == 5
+        assert page_1 in spider(page_1, session=session)[0]
+    finally:
+        session.close()
+
+    # Spiders sharing a session only use its threads
+    assert pools == [2]
+
+
+def test_spider_http(tmpdir, mock_http_server, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'page_cache', spack.caches.PageCache(
+        FileCache(str(tmpdir.join('cache')))))
+    monkeypatch.setattr(spack.util.web, 'max_host_connections', 1)
+    for name in os.listdir(web_data_path):
+        with open(os.path.join(web_data_path, name), 'rb') as f:
+            mock_http_server.files['/' + name] = f.read()
+    http_root = mock_http_server.url + '/index.html'
+    http_page_4 = mock_http_server.url + '/4.html'
+
+    pages, links = spider(http_root, depth=3)
+    assert len(pages) == 5
+    assert "This is page 4." in pages[http_page_4]
+    assert http_root in links
+
+    # Each page is fetched once, over one connection to the host
+    paths = sorted(path for path, _ in mock_http_server.requests)
+    assert paths == ['/1.html', '/2.html', '/3.html', '/4.html',
+                     '/index.html']
+    assert len(mock_http_server.connections) == 1
+
+    # Pages that didn't change are read from the cache
+    assert spider(http_root, depth=3) == (pages, links)
+    assert sorted(mock_http_server.not_modified) == paths
+
+    mock_http_server.files['/4.html'] = b'<html>Page 4 changed</html>'
+    pages, _ = spider(http_root, depth=3)
+    assert pages[http_page_4] == '<html>Page 4 changed</html>'
+
+
+def test_spider_page_cache_eviction(tmpdir, mock_http_server, monkeypatch):
+    cache = spack.caches.PageCache(
+        FileCache(str(tmpdir.join('cache'))), max_entries=2)
+    monkeypatch.setattr(spack.caches, 'page_cache', cache)
+    for name in os.listdir(web_data_path):
+        with open(os.path.join(web_data_path, name), 'rb') as f:
+            mock_http_server.files['/' + name] = f.read()
+    http_root = mock_http_server.url + '/index.html'
+
+    spider(http_root, depth=3)
+    assert len(cache.entries()) == 2
+
+    # The root page is used again, so it's kept over the others
+    spider(http_root)
+    spider(mock_http_server.url + '/4.html')
+    assert cache.get(http_root) is not None
+    assert cache.get(mock_http_server.url + '/1.html') is None
+
+
+def test_read_from_url_http_errors(mock_http_server):
+    mock_http_server.files['/page.html'] = b'<html>page</html>'
+    url = mock_http_server.url
+    assert read_from_url(url + '/page.html') == '<html>page</html>'
+
+    with pytest.raises(HTTPError) as e:
+        read_from_url(url + '/missing.html')
+    assert e.value.code == 404
+
+
 def test_find_versions_of_archive_0():
     versions = find_versions_of_archive(root_tarball, root, list_depth=0)
     assert ver('0.0.0') in versions
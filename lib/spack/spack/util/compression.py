@@ -3,10 +3,18 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import collections
+import multiprocessing
 import re
 import os
+import subprocess
+import threading
+import zlib
+from contextlib import contextmanager
 from itertools import product
-from spack.util.executable import which
+from multiprocessing.pool import ThreadPool
+
+from spack.util.executable import which, ProcessError
 
 # Supported archive extensions.
 PRE_EXTS = ["tar", "TAR"]
@@ -60,3 +68,133 @@ def extension(path):
         if re.search(suffix, path):
             return t
     return None
+
+
+def _gzip_block(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ParallelGzipWriter(object):
+    """Write-only file object that compresses data to gzip with threads.
+
+    Data is split into blocks that are compressed in parallel, each into a
+    complete gzip member.  A sequence of members is a valid gzip file, so
+    the output can be read by ``gzip``, ``tar`` and Python's ``gzip`` and
+    ``tarfile`` modules.
+    """
+
+    def __init__(self, fileobj, threads=None, level=6, block_size=1 << 22):
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        self.threads = threads or multiprocessing.cpu_count()
+        self.pool = ThreadPool(self.threads)
+        self.pending = collections.deque()
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.block_size:
+            self._compress_buffer()
+
+    def _compress_buffer(self):
+        block = b''.join(self.buffer)
+        self.buffer, self.buffered = [], 0
+        self.pending.append(
+            self.pool.apply_async(_gzip_block, (block, self.level)))
+
+        # Write blocks in order, keeping at most two per thread in memory
+        while len(self.pending) > 2 * self.threads:
+            self.fileobj.write(self.pending.popleft().get())
+
+    def close(self):
+        if self.pool is None:
+            return
+        try:
+            if self.buffered:
+                self._compress_buffer()
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().get())
+        finally:
+            self.pool.terminate()
+            self.pool = None
+
+
+class CompressorProcess(object):
+    """Write-only file object that pipes data through an external
+    compressor, like ``xz`` or ``zstd``, into another file object.
+
+    The compressor runs concurrently with the code writing to this object.
+    Errors writing its output, e.g. when the disk is full, are raised by
+    the next call to ``write()`` or ``close()``.
+    """
+
+    def __init__(self, fileobj, args):
+        self.fileobj = fileobj
+        self.args = args
+        self.error = None
+        self.process = subprocess.Popen(
+            args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.thread = threading.Thread(
+            target=self._copy_output, args=(self.process,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _copy_output(self, process):
+        try:
+            for chunk in iter(lambda: process.stdout.read(1 << 16), b''):
+                self.fileobj.write(chunk)
+        except BaseException as e:
+            # Kill the compressor, so that writing to it fails instead of
+            # blocking once its output pipe is full
+            self.error = e
+            process.kill()
+
+    def write(self, data):
+        if self.error is not None:
+            raise self.error
+        try:
+            self.process.stdin.write(data)
+        except (IOError, OSError):
+            # a broken pipe after an error writing the output
+            self.thread.join()
+            if self.error is not None:
+                raise self.error
+            raise
+
+    def close(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+        except (IOError, OSError):
+            # the compressor died, which is reported below
+            pass
+        self.thread.join()
+        returncode = process.wait()
+        if self.error is not None:
+            raise self.error
+        if returncode:
+            raise ProcessError('%s exited with status %d' %
+                               (self.args[0], returncode))
+
+
+@contextmanager
+def decompressed(path, args):
+    """Context manager yielding the output of an external decompressor,
+    like ``xz -d -c``, run on ``path``, as a file object."""
+    process = subprocess.Popen(args + [path], stdout=subprocess.PIPE)
+    try:
+        yield process.stdout
+        # consume what the reader left, like the padding of a tarball
+        while process.stdout.read(1 << 16):
+            pass
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode:
+        raise ProcessError('%s exited with status %d' % (args[0], returncode))
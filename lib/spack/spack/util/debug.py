@@ -8,9 +8,12 @@
 ``register_interrupt_handler()`` enables a ctrl-C handler that prints
 a stack trace and drops the user into an interpreter.
 
+``peak_rss()`` reports how much memory this process used at most.
+
 """
 import os
 import code
+import sys
 import traceback
 import signal
 
@@ -32,3 +35,14 @@ def debug_handler(sig, frame):
 def register_interrupt_handler():
     """Print traceback and enter an interpreter on Ctrl-C"""
     signal.signal(signal.SIGINT, debug_handler)
+
+
+def peak_rss():
+    """Peak resident set size of this process, in MiB."""
+    # resource is only available on Unix
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in KiB everywhere else
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak / 1024.0
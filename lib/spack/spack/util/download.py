@@ -0,0 +1,337 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Concurrent downloads with a bounded number of connections.
+
+Files used to be downloaded one after the other, each through its own
+``Stage``, so installing many binary packages was dominated by network
+round trips.  ``DownloadManager`` downloads up to
+``config:download_connections`` files at the same time with a pool of
+threads, and hands each of them back as soon as it is complete, so that
+it can be used while the others are still in flight.
+
+The threads run in a child process: Spack forks to build packages and to
+extract binaries while files are downloading, and forking a process
+whose threads may hold locks can deadlock the child.
+
+Transient errors (failed connections, timeouts, interrupted transfers)
+are retried ``config:download_retries`` times, with an exponential
+backoff.  Interrupted transfers are resumed where they stopped.
+"""
+import multiprocessing
+import multiprocessing.pool
+import os
+import pickle
+import threading
+import time
+
+import llnl.util.tty as tty
+from llnl.util.filesystem import mkdirp
+
+import spack.config
+import spack.error
+from spack.util.executable import which
+
+#: Seconds to wait before retrying a download; doubled for each retry
+retry_backoff = 1.0
+
+#: curl exit codes of errors that may go away when retrying: proxy and
+#: host resolution, connection failures, partial transfers, timeouts,
+#: SSL handshakes and errors sending or receiving data
+transient_curl_errors = (5, 6, 7, 18, 28, 35, 52, 55, 56)
+
+#: curl exit code when a partial download cannot be resumed
+_cannot_resume = 33
+
+
+def backoff_delay(attempt):
+    """Seconds to wait before the ``attempt``-th retry (starting at 1)."""
+    return retry_backoff * 2 ** (attempt - 1)
+
+
+def download(url, path, verify_ssl=True):
+    """Download ``url`` to ``path`` with curl.
+
+    Data is written to ``path + '.part'``, which is renamed to ``path``
+    once complete.  A ``.part`` file left by an interrupted download is
+    resumed.
+
+    Raises:
+        DownloadError: if the download failed
+    """
+    partial = path + '.part'
+    args = ['-f', '-L', '-sS', '-C', '-', '-o', partial, url]
+    if not verify_ssl:
+        args.append('-k')
+
+    # Executables remember their last return code, so each thread needs
+    # its own
+    curl = which('curl', required=True)
+    output = curl(*args, output=str, error=str, fail_on_error=False)
+    if curl.returncode != 0:
+        if (curl.returncode not in transient_curl_errors and
+                os.path.exists(partial)):
+            os.remove(partial)
+        raise DownloadError(url, curl.returncode, output)
+
+    os.rename(partial, path)
+
+
+def download_with_retries(urls, path, retries=None, verify_ssl=None):
+    """Download the first available of ``urls`` to ``path``.
+
+    The URLs are tried in order, e.g. the same file on several mirrors.
+    Transient errors are retried up to ``retries`` times for each URL,
+    waiting ``backoff_delay()`` seconds before each retry.
+
+    Returns:
+        (str): the URL that was downloaded
+
+    Raises:
+        DownloadError: the error for the last URL, if none could be
+            downloaded
+    """
+    if retries is None:
+        retries = spack.config.get('config:download_retries', 3)
+    if verify_ssl is None:
+        verify_ssl = spack.config.get('config:verify_ssl', True)
+
+    error = None
+    for url in urls:
+        for attempt in range(retries + 1):
+            if attempt:
+                tty.debug('Retrying {0} in {1:g}s: {2}'.format(
+                    url, backoff_delay(attempt), error))
+                time.sleep(backoff_delay(attempt))
+            try:
+                download(url, path, verify_ssl)
+                return url
+            except DownloadError as e:
+                error = e
+                if not e.transient:
+                    break
+
+    if error is None:
+        raise ValueError('No URLs to download %s from' % path)
+    raise error
+
+
+def _serve_downloads(conn, connections, retries, verify_ssl):
+    """Run the downloads of a ``DownloadManager`` in a child process.
+
+    ``(key, urls, path)`` requests are read from ``conn`` until None,
+    and a ``(key, path, error)`` result is sent back for each of them.
+    None is sent once all downloads finished.
+    """
+    lock = threading.Lock()
+    pool = multiprocessing.pool.ThreadPool(connections)
+
+    def run(key, urls, path):
+        error = None
+        try:
+            download_with_retries(urls, path, retries, verify_ssl)
+        except Exception as e:
+            error = e
+        try:
+            pickle.dumps(error)
+        except Exception:
+            error = spack.error.SpackError(
+                '{0}: {1}'.format(type(error).__name__, str(error)))
+        with lock:
+            conn.send((key, path, error))
+
+    try:
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            pool.apply_async(run, request)
+        pool.close()
+        pool.join()
+        conn.send(None)
+    except (EOFError, KeyboardInterrupt):
+        # The parent is gone or was interrupted: drop the downloads
+        pool.terminate()
+
+
+class DownloadManager(object):
+    """Downloads files concurrently, with a bounded number of connections.
+
+    Files are queued with ``add()`` and downloaded in that order.
+    ``wait()`` and ``as_completed()`` return them as they finish::
+
+        with DownloadManager() as downloads:
+            for spec in specs:
+                downloads.add(spec.dag_hash(), urls(spec), path(spec))
+
+            for key, path, error in downloads.as_completed():
+                ...
+
+    The downloads run in a child process, started by the first ``add()``,
+    so the calling process has no threads of its own and can fork.
+
+    Args:
+        connections (int): maximum number of files downloaded at the
+            same time. Defaults to ``config:download_connections``.
+        retries (int): number of times transient errors are retried for
+            each URL. Defaults to ``config:download_retries``.
+    """
+
+    def __init__(self, connections=None, retries=None):
+        if connections is None:
+            connections = spack.config.get('config:download_connections', 8)
+        if retries is None:
+            retries = spack.config.get('config:download_retries', 3)
+        self.connections = max(1, connections)
+        self.retries = max(0, retries)
+        self.verify_ssl = spack.config.get('config:verify_ssl', True)
+
+        #: keys of the files that are queued or downloading
+        self.pending = set()
+
+        self._paths = {}
+        self._done = []
+        self._process = None
+        self._conn = None
+
+    def add(self, key, urls, path):
+        """Queue a download.
+
+        Arguments:
+            key: identifies the download in the results
+            urls (list of str): URLs the file can be downloaded from,
+                tried in order
+            path (str): where to save the file
+        """
+        if self._process is None:
+            self._conn, child_conn = multiprocessing.Pipe()
+            self._process = multiprocessing.Process(
+                target=_serve_downloads,
+                args=(child_conn, self.connections, self.retries,
+                      self.verify_ssl))
+            self._process.daemon = True
+            self._process.start()
+            child_conn.close()
+
+        mkdirp(os.path.dirname(path))
+        self.pending.add(key)
+        self._paths[key] = path
+        self._conn.send((key, list(urls), path))
+
+    def _receive(self, timeout=None):
+        """Receive the results of the downloads that finished.
+
+        Blocks for at most ``timeout`` seconds until there is one.
+
+        Returns:
+            (bool): False once the download process is done
+        """
+        try:
+            while self._conn.poll(timeout):
+                result = self._conn.recv()
+                if result is None:
+                    return False
+                self._done.append(result)
+                timeout = 0
+            return True
+        except (EOFError, IOError):
+            received = set(key for key, _, _ in self._done)
+            for key in self.pending - received:
+                error = spack.error.SpackError(
+                    'Download process exited before downloading {0}'.format(
+                        self._paths[key]))
+                self._done.append((key, self._paths[key], error))
+            return False
+
+    def wait(self, timeout=None):
+        """Return the downloads that finished since the last call.
+
+        Blocks until at least one download is finished, or for at most
+        ``timeout`` seconds. With a timeout of 0, this only polls.
+
+        Returns:
+            (list): ``(key, path, error)`` tuples, where ``error`` is
+                None if the download succeeded
+        """
+        if not self.pending:
+            return []
+
+        if not self._done and self._process is not None:
+            if not self._receive(timeout):
+                self._stop()
+
+        done, self._done = self._done, []
+        for key, _, _ in done:
+            self.pending.discard(key)
+            self._paths.pop(key, None)
+        return done
+
+    def as_completed(self):
+        """Yield ``(key, path, error)`` for each download as it finishes."""
+        while self.pending:
+            for result in self.wait():
+                yield result
+
+    def close(self):
+        """Wait for the downloads in flight and stop the process."""
+        if self._process is not None:
+            try:
+                self._conn.send(None)
+            except (IOError, OSError):
+                pass
+            while self._receive():
+                pass
+            self._stop()
+
+    def terminate(self):
+        """Drop the queued downloads without waiting for them.
+
+        The download process is killed, and the results of the downloads
+        in flight are discarded.
+        """
+        if self._process is not None:
+            self._process.terminate()
+            self._stop()
+        self.pending.clear()
+        self._paths.clear()
+        self._done = []
+
+    def _stop(self):
+        self._process.join()
+        self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+class DownloadError(spack.error.SpackError):
+    """Raised when a file could not be downloaded.
+
+    Attributes:
+        url (str): URL that failed
+        returncode (int): curl exit code
+        transient (bool): whether retrying may succeed
+    """
+
+    def __init__(self, url, returncode, output=''):
+        self.url = url
+        self.returncode = returncode
+        self.transient = returncode in transient_curl_errors or \
+            returncode == _cannot_resume
+        super(DownloadError, self).__init__(
+            'Failed to download {0} (curl error {1})'.format(url, returncode),
+            output.strip() or None)
+
+    def __reduce__(self):
+        return DownloadError, (
+            self.url, self.returncode, self._long_message or '')
@@ -0,0 +1,240 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Read and modify the RPATH of ELF files without external tools.
+
+Only the parts of the format needed for relocation are read: the file
+header, the program headers and the dynamic section.  RPATHs can be
+changed in place when the new value is not longer than the old one,
+which is the common case when relocating from a placeholder or padded
+install root.  Anything else is left to ``patchelf``.
+"""
+import mmap
+import struct
+
+import spack.error
+
+__all__ = ['ElfFile', 'parse_elf', 'read_elf', 'get_rpaths', 'set_rpaths',
+           'ElfParsingError']
+
+#: First bytes of every ELF file
+ELF_MAGIC = b'\x7fELF'
+
+# Object file types (e_type)
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+ET_CORE = 4
+
+# Segment types (p_type)
+PT_LOAD = 1
+PT_DYNAMIC = 2
+
+# Dynamic section tags (d_tag)
+DT_NULL = 0
+DT_STRTAB = 5
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+
+class ElfFile(object):
+    """Location of the RPATH of an ELF file.
+
+    Attributes:
+        is_64_bit (bool): whether this is an ELFCLASS64 file
+        byte_order (str): ``'<'`` or ``'>'``, as used by ``struct``
+        elf_type (int): object file type (e.g., ``ET_DYN``)
+        rpath (bytes): RPATH or RUNPATH string, or None if there is none
+        rpath_offset (int): file offset of the RPATH string
+        rpath_tag (int): ``DT_RPATH`` or ``DT_RUNPATH``
+        rpath_tag_offset (int): file offset of the dynamic entry with
+            the RPATH
+        dynamic_tags (set): tags present in the dynamic section
+    """
+
+    def __init__(self, is_64_bit, byte_order, elf_type):
+        self.is_64_bit = is_64_bit
+        self.byte_order = byte_order
+        self.elf_type = elf_type
+
+        self.rpath = None
+        self.rpath_offset = None
+        self.rpath_tag = None
+        self.rpath_tag_offset = None
+        self.dynamic_tags = set()
+
+    @property
+    def dynamic_entry_format(self):
+        """``struct`` format of an entry of the dynamic section."""
+        return self.byte_order + ('qQ' if self.is_64_bit else 'iI')
+
+
+def parse_header(data):
+    """Parse the identification and type of an ELF file.
+
+    Arguments:
+        data: the first bytes of the file (at least 18)
+
+    Returns:
+        (ElfFile): file without RPATH information
+    """
+    if data[:4] != ELF_MAGIC or len(data) < 18:
+        raise ElfParsingError('not an ELF file')
+
+    ei_class, ei_data = struct.unpack_from('BB', data, 4)
+    if ei_class not in (1, 2) or ei_data not in (1, 2):
+        raise ElfParsingError('unknown ELF class or data encoding')
+
+    byte_order = '<' if ei_data == 1 else '>'
+    elf_type, = struct.unpack_from(byte_order + 'H', data, 16)
+    return ElfFile(ei_class == 2, byte_order, elf_type)
+
+
+def parse_elf(data):
+    """Find the RPATH of an ELF file.
+
+    Arguments:
+        data: contents of the file, e.g. as bytes or an mmap
+
+    Returns:
+        (ElfFile): the parsed file
+    """
+    elf = parse_header(data)
+    bo = elf.byte_order
+
+    try:
+        # program headers
+        if elf.is_64_bit:
+            phoff, = struct.unpack_from(bo + 'Q', data, 32)
+            phentsize, phnum = struct.unpack_from(bo + 'HH', data, 54)
+        else:
+            phoff, = struct.unpack_from(bo + 'I', data, 28)
+            phentsize, phnum = struct.unpack_from(bo + 'HH', data, 42)
+
+        loads, dynamic = [], None
+        for i in range(phnum):
+            if elf.is_64_bit:
+                p_type, _, p_offset, p_vaddr, _, p_filesz = \
+                    struct.unpack_from(bo + 'IIQQQQ', data, phoff)
+            else:
+                p_type, p_offset, p_vaddr, _, p_filesz = \
+                    struct.unpack_from(bo + 'IIIII', data, phoff)
+            phoff += phentsize
+
+            if p_type == PT_LOAD:
+                loads.append((p_vaddr, p_offset, p_filesz))
+            elif p_type == PT_DYNAMIC:
+                dynamic = (p_offset, p_filesz)
+
+        if dynamic is None:
+            return elf
+
+        # dynamic section
+        dyn_format = elf.dynamic_entry_format
+        dyn_size = struct.calcsize(dyn_format)
+        offset, end = dynamic[0], dynamic[0] + dynamic[1]
+        strtab, rpath = None, None
+        while offset + dyn_size <= end:
+            tag, value = struct.unpack_from(dyn_format, data, offset)
+            if tag == DT_NULL:
+                break
+
+            elf.dynamic_tags.add(tag)
+            if tag == DT_STRTAB:
+                strtab = value
+            elif tag == DT_RUNPATH or (tag == DT_RPATH and rpath is None):
+                # the dynamic loader ignores RPATH if there is a RUNPATH
+                rpath = (tag, value, offset)
+            offset += dyn_size
+
+    except struct.error as e:
+        raise ElfParsingError('truncated ELF file: %s' % e)
+
+    if rpath is None:
+        return elf
+
+    if strtab is None:
+        raise ElfParsingError('dynamic section has no string table')
+
+    # map the string table address to a file offset
+    for vaddr, p_offset, p_filesz in loads:
+        if vaddr <= strtab < vaddr + p_filesz:
+            strtab_offset = strtab - vaddr + p_offset
+            break
+    else:
+        raise ElfParsingError('string table is not in a loaded segment')
+
+    elf.rpath_tag, value, elf.rpath_tag_offset = rpath
+    elf.rpath_offset = strtab_offset + value
+    end = data.find(b'\0', elf.rpath_offset)
+    if end < 0:
+        raise ElfParsingError('unterminated RPATH string')
+    elf.rpath = data[elf.rpath_offset:end]
+
+    return elf
+
+
+def read_elf(path):
+    """Parse the ELF file at ``path`` (see ``parse_elf()``)."""
+    with open(path, 'rb') as f:
+        if f.read(4) != ELF_MAGIC:
+            raise ElfParsingError('%s is not an ELF file' % path)
+
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return parse_elf(data)
+        finally:
+            data.close()
+
+
+def get_rpaths(path):
+    """Return the entries of the RPATH (or RUNPATH) of an ELF file."""
+    rpath = read_elf(path).rpath
+    if not rpath:
+        return []
+    return rpath.decode('utf-8').split(':')
+
+
+def set_rpaths(path, rpaths, force_rpath=True):
+    """Rewrite the RPATH of an ELF file in place, if the new one fits.
+
+    The new string overwrites the old one in the string table, padded
+    with NUL bytes, so the file layout does not change.
+
+    Arguments:
+        path (str): path to the ELF file
+        rpaths (list of str): new RPATH entries
+        force_rpath (bool): turn a ``DT_RUNPATH`` into a ``DT_RPATH``,
+            like ``patchelf --force-rpath``
+
+    Returns:
+        (bool): True if the file was modified, False if it has no RPATH
+            or the new one is longer than the old one
+    """
+    new_rpath = ':'.join(rpaths).encode('utf-8')
+
+    with open(path, 'rb+') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            elf = parse_elf(data)
+        finally:
+            data.close()
+
+        if elf.rpath is None or len(new_rpath) > len(elf.rpath):
+            return False
+
+        f.seek(elf.rpath_offset)
+        f.write(new_rpath + b'\0' * (len(elf.rpath) - len(new_rpath)))
+
+        if (force_rpath and elf.rpath_tag == DT_RUNPATH and
+                DT_RPATH not in elf.dynamic_tags):
+            f.seek(elf.rpath_tag_offset)
+            f.write(struct.pack(elf.dynamic_entry_format[:2], DT_RPATH))
+
+    return True
+
+
+class ElfParsingError(spack.error.SpackError):
+    """Raised when a file cannot be parsed as ELF."""
@@ -3,6 +3,8 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import multiprocessing
+import multiprocessing.pool
 import os
 
 import spack.paths
@@ -92,6 +94,35 @@ class Gpg(object):
     def verify(cls, signature, file):
         cls.gpg()('--verify', signature, file)
 
+    @classmethod
+    def verify_all(cls, pairs, jobs=None):
+        """Verify many ``(signature, file)`` pairs at the same time.
+
+        gpg only verifies one detached signature per call, so up to
+        ``jobs`` (by default, the number of cores) calls run at once.
+
+        Returns:
+            (list): for each pair, the exception raised by ``verify()``,
+                or None if the signature is valid
+        """
+        def verify(pair):
+            try:
+                cls.verify(*pair)
+            except Exception as e:
+                return e
+
+        pairs = list(pairs)
+        if len(pairs) <= 1:
+            return [verify(pair) for pair in pairs]
+
+        jobs = min(jobs or multiprocessing.cpu_count(), len(pairs))
+        pool = multiprocessing.pool.ThreadPool(jobs)
+        try:
+            return pool.map(verify, pairs)
+        finally:
+            pool.close()
+            pool.join()
+
     @classmethod
     def list(cls, trusted, signing):
         if trusted:
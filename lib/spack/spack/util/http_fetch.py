@@ -0,0 +1,367 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""HTTP(S) downloads in the Spack process, over persistent connections.
+
+Fetching each archive with a new ``curl`` process costs a fork, a new
+TCP connection and a new TLS handshake, which dominates the time taken
+to mirror many small files from the same host.  Here, connections are
+kept open after each request in a pool, by host, and reused by the next
+request to the same host.
+
+``fetch()`` streams the response to a ``.part`` file, computes its
+checksum as it is written, and resumes interrupted downloads with a
+``Range`` request.  URLs that go through a proxy are left to ``curl``,
+see ``supports()``.
+"""
+import os
+import socket
+import ssl
+import sys
+import threading
+
+from six.moves import http_client
+from six.moves.urllib.parse import urljoin, urlparse
+from six.moves.urllib.request import getproxies, proxy_bypass
+
+import llnl.util.tty as tty
+
+import spack
+import spack.config
+import spack.error
+
+#: Timeout in seconds for connections, and for each read
+timeout = 30
+
+#: Maximum number of idle connections kept open for each host
+max_idle_connections = 4
+
+#: Maximum number of redirects followed for a request
+max_redirects = 10
+
+#: Size of the blocks read from responses
+block_size = 1 << 20
+
+#: HTTP status codes of errors that may go away when retrying
+transient_statuses = (408, 429, 500, 502, 503, 504)
+
+#: Errors raised by connections that were closed or reset
+_connection_errors = (http_client.HTTPException, socket.error)
+
+
+def supports(url):
+    """Whether ``url`` can be fetched in-process: it is an http or https
+    URL that does not go through a proxy."""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https'):
+        return False
+    return parsed.scheme not in getproxies() or proxy_bypass(parsed.hostname)
+
+
+def can_verify_ssl():
+    """Whether this Python can verify the certificates of servers: older
+    ones than 2.7.9 and 3.4.3 cannot."""
+    pyver = sys.version_info
+    return not (pyver < (2, 7, 9) or (3,) < pyver < (3, 4, 3))
+
+
+def _ssl_context(verify_ssl):
+    if not can_verify_ssl():
+        return None
+    elif verify_ssl:
+        return ssl.create_default_context()
+    else:
+        return ssl._create_unverified_context()
+
+
+class ConnectionPool(object):
+    """Idle HTTP connections, by scheme, host and port.
+
+    Connections are taken out of the pool for a request, and put back
+    once its response was read, so a connection is never used by two
+    threads at the same time.
+    """
+
+    def __init__(self, max_idle=None):
+        self.max_idle = max_idle or max_idle_connections
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, scheme, netloc, verify_ssl):
+        """Return ``(connection, reused)`` for a host: an idle connection
+        if there is one, otherwise a new one."""
+        key = (scheme, netloc, verify_ssl)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+
+        if scheme == 'https':
+            context = _ssl_context(verify_ssl)
+            if context is None:
+                if verify_ssl:
+                    tty.warn("Spack will not check SSL certificates. You "
+                             "need to update your Python to enable "
+                             "certificate verification.")
+                connection = http_client.HTTPSConnection(
+                    netloc, timeout=timeout)
+            else:
+                connection = http_client.HTTPSConnection(
+                    netloc, timeout=timeout, context=context)
+        else:
+            connection = http_client.HTTPConnection(netloc, timeout=timeout)
+        return connection, False
+
+    def put(self, scheme, netloc, verify_ssl, connection):
+        """Make a connection available for the next request to its host,
+        or close it if there are enough idle ones."""
+        key = (scheme, netloc, verify_ssl)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def clear(self):
+        """Close all the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+#: Connections shared by all the requests of this process
+pool = ConnectionPool()
+
+
+class Response(object):
+    """Response to a request made with ``request()``.
+
+    The connection goes back to the pool when the response is closed,
+    if its body was read entirely.
+
+    Attributes:
+        url (str): URL of the response, after redirects
+        status (int): HTTP status code
+        reason (str): HTTP reason phrase
+    """
+
+    def __init__(self, url, response, connection, key):
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self._response = response
+        self._connection = connection
+        self._key = key
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    @property
+    def content_type(self):
+        return self.getheader('Content-Type')
+
+    @property
+    def complete(self):
+        """Whether the whole body was read."""
+        length = self._response.length
+        return self._response.isclosed() and not length
+
+    def read(self, size=None):
+        try:
+            data = self._response.read(size)
+        except _connection_errors as e:
+            self.close()
+            raise HTTPFetchError(self.url, str(e), transient=True)
+
+        # Python 2 returns short reads when the connection is closed
+        # early, instead of raising IncompleteRead
+        if not data and size and self._response.length:
+            self.close()
+            raise HTTPFetchError(
+                self.url, 'connection closed with %d bytes left' %
+                self._response.length, transient=True)
+        return data
+
+    def drain(self):
+        """Read the rest of the body, so the connection can be reused."""
+        while self.read(block_size):
+            pass
+
+    def close(self):
+        if self._connection is None:
+            return
+        if self.complete and not self._response.will_close:
+            pool.put(*(self._key + (self._connection,)))
+        else:
+            self._response.close()
+            self._connection.close()
+        self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _send(url, method, headers, verify_ssl):
+    """Send one request, over an idle connection to the host if there is
+    one, and return its ``Response``."""
+    parsed = urlparse(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    key = (parsed.scheme, parsed.netloc, verify_ssl)
+
+    while True:
+        connection, reused = pool.get(*key)
+        try:
+            connection.request(method, path, headers=headers)
+            response = connection.getresponse()
+            return Response(url, response, connection, key)
+        except _connection_errors as e:
+            connection.close()
+            # the server may have closed an idle connection: retry once
+            # with a new one
+            if reused:
+                continue
+            if isinstance(e, ssl.SSLError):
+                raise SSLFetchError(url, str(e))
+            raise HTTPFetchError(url, str(e), transient=True)
+        except ssl.CertificateError as e:
+            connection.close()
+            raise SSLFetchError(url, str(e))
+
+
+def request(url, method='GET', headers=None, verify_ssl=None):
+    """Make an HTTP request, following redirects.
+
+    Arguments:
+        url (str): http or https URL
+        method (str): HTTP method, e.g. ``GET`` or ``HEAD``
+        headers (dict): additional request headers
+        verify_ssl (bool): whether to check certificates; defaults to
+            ``config:verify_ssl``
+
+    Returns:
+        (Response): the response, which must be closed
+    """
+    if verify_ssl is None:
+        verify_ssl = spack.config.get('config:verify_ssl', True)
+    all_headers = {'User-Agent': 'Spack/%s' % spack.spack_version}
+    all_headers.update(headers or {})
+
+    for _ in range(max_redirects + 1):
+        response = _send(url, method, all_headers, verify_ssl)
+        location = response.getheader('Location')
+        if response.status not in (301, 302, 303, 307, 308) or not location:
+            return response
+
+        with response:
+            if method != 'HEAD':
+                response.drain()
+        url = urljoin(url, location)
+        if response.status == 303:
+            method = 'GET'
+
+    raise HTTPFetchError(url, 'too many redirects')
+
+
+def fetch(url, path, hash_fun=None, verify_ssl=None):
+    """Download ``url`` to ``path``.
+
+    Data is written to ``path + '.part'``, which is renamed to ``path``
+    once complete.  A ``.part`` file left by an interrupted download is
+    resumed, if the server supports ``Range`` requests.
+
+    Arguments:
+        url (str): http or https URL
+        path (str): where to save the file
+        hash_fun: function returning a ``hashlib`` object, e.g.
+            ``hashlib.sha256``, to compute the checksum of the file
+        verify_ssl (bool): whether to check certificates; defaults to
+            ``config:verify_ssl``
+
+    Returns:
+        (tuple): the content type of the response, and the hex digest of
+            the file, or None if there is no ``hash_fun``
+
+    Raises:
+        HTTPFetchError: if the file could not be downloaded
+    """
+    partial = path + '.part'
+    offset = 0
+    headers = {}
+    if os.path.exists(partial):
+        offset = os.path.getsize(partial)
+    if offset:
+        headers['Range'] = 'bytes=%d-' % offset
+
+    with request(url, headers=headers, verify_ssl=verify_ssl) as response:
+        if response.status == 416 and offset:
+            # the partial file is not a prefix of this one: start over
+            response.drain()
+            os.remove(partial)
+            return fetch(url, path, hash_fun, verify_ssl)
+
+        if response.status >= 400:
+            error = HTTPFetchError(
+                response.url, '%d %s' % (response.status, response.reason),
+                status=response.status)
+            response.drain()
+            raise error
+
+        content_range = response.getheader('Content-Range', '')
+        resume = (response.status == 206 and
+                  content_range.startswith('bytes %d-' % offset))
+        if offset and not resume:
+            tty.debug('Cannot resume %s, starting over' % url)
+
+        hasher = hash_fun() if hash_fun else None
+        if resume and hasher:
+            with open(partial, 'rb') as f:
+                for data in iter(lambda: f.read(block_size), b''):
+                    hasher.update(data)
+
+        with open(partial, 'ab' if resume else 'wb') as f:
+            for data in iter(lambda: response.read(block_size), b''):
+                if hasher:
+                    hasher.update(data)
+                f.write(data)
+
+        content_type = response.content_type
+
+    os.rename(partial, path)
+    return content_type, hasher.hexdigest() if hasher else None
+
+
+class HTTPFetchError(spack.error.SpackError):
+    """Raised when a request fails.
+
+    Attributes:
+        url (str): URL that failed
+        status (int): HTTP status code, or None if there was no response
+        transient (bool): whether retrying may succeed
+    """
+
+    def __init__(self, url, message, status=None, transient=None):
+        self.url = url
+        self.status = status
+        if transient is None:
+            transient = status in transient_statuses
+        self.transient = transient
+        super(HTTPFetchError, self).__init__(
+            'Failed to fetch {0}: {1}'.format(url, message))
+
+
+class SSLFetchError(HTTPFetchError):
+    """Raised when an SSL connection cannot be made, e.g. because the
+    certificate of the server cannot be verified."""
+
+    def __init__(self, url, message):
+        super(SSLFetchError, self).__init__(url, message, transient=False)
@@ -25,7 +25,7 @@ from llnl.util.tty.color import colorize, clen, cextra
 import spack.error
 
 # Only export load and dump
-__all__ = ['load', 'dump', 'SpackYAMLError']
+__all__ = ['load', 'dump', 'dump_flow', 'SpackYAMLError']
 
 # Make new classes so we can add custom attributes.
 # Also, use OrderedDict instead of just dict.
@@ -359,6 +359,112 @@ def dump_annotated(data, stream=None, *args, **kwargs):
         return getvalue()
 
 
+class _NotFlowDumpable(Exception):
+    """Raised by the fast flow emitter for data it cannot reproduce."""
+
+
+#: Emitter used to analyze scalars for ``dump_flow()``
+_flow_analyzer = OrderedLineDumper(StringIO())
+
+#: Memoized flow representation of scalars, keyed by (value, is_key)
+_flow_scalars = {}
+
+#: Line width for the fallback emitter, large enough to never wrap
+_flow_width = 2 ** 31 - 1
+
+
+def _flow_scalar(value, key):
+    """Render a string exactly as the emitter does inside a flow
+    collection, or raise ``_NotFlowDumpable`` if it would need double
+    quotes, escapes or a complex key."""
+    cache_key = (value, key)
+    text = _flow_scalars.get(cache_key)
+    if text is not None:
+        return text
+
+    if any(not (' ' <= c <= '~') for c in value):
+        raise _NotFlowDumpable(value)
+    if key and not (0 < len(value) < 100):
+        # the emitter writes these as complex ``? key`` entries
+        raise _NotFlowDumpable(value)
+
+    # Plain style needs the string to resolve back to a str when loaded,
+    # e.g. '1.0' or 'true' must be quoted.
+    resolvers = (
+        _flow_analyzer.yaml_implicit_resolvers.get(value[:1], []) +
+        _flow_analyzer.yaml_implicit_resolvers.get(None, []))
+    implicit = not any(regexp.match(value) for _, regexp in resolvers)
+
+    analysis = _flow_analyzer.analyze_scalar(value)
+    if implicit and analysis.allow_flow_plain and not analysis.empty:
+        text = value
+    elif analysis.allow_single_quoted and not analysis.multiline:
+        text = "'%s'" % value.replace("'", "''")
+    else:
+        raise _NotFlowDumpable(value)
+
+    if len(_flow_scalars) > 10000:
+        _flow_scalars.clear()
+    _flow_scalars[cache_key] = text
+    return text
+
+
+def _flow_node(data, out):
+    data_type = type(data)
+    if data_type in (str, syaml_str):
+        out.append(_flow_scalar(data, False))
+    elif data is None:
+        out.append('null')
+    elif data_type is bool:
+        out.append('true' if data else 'false')
+    elif data_type in (int, syaml_int):
+        out.append(str(data))
+    elif data_type in (list, syaml_list):
+        out.append('[')
+        for i, item in enumerate(data):
+            if i:
+                out.append(', ')
+            _flow_node(item, out)
+        out.append(']')
+    elif data_type in (dict, syaml_dict):
+        items = list(data.items())
+        if data_type is dict:
+            items.sort()
+        out.append('{')
+        for i, (key, value) in enumerate(items):
+            if type(key) not in (str, syaml_str):
+                raise _NotFlowDumpable(key)
+            if i:
+                out.append(', ')
+            out.append(_flow_scalar(key, True))
+            out.append(': ')
+            _flow_node(value, out)
+        out.append('}')
+    else:
+        raise _NotFlowDumpable(data)
+
+
+def dump_flow(data):
+    """Fast equivalent of ``dump(data, default_flow_style=True,
+    width=maxint)`` for a collection of plain data.
+
+    This is what spec hashes are computed from, so it produces the very
+    same text as the YAML emitter, without building a node graph and an
+    event stream first. Anything that the emitter would not write as a
+    plain or single-quoted scalar (non-ASCII text, line breaks, tuples,
+    floats, ...) is handed to the full emitter instead.
+    """
+    out = []
+    try:
+        if not isinstance(data, (list, dict)):
+            raise _NotFlowDumpable(data)
+        _flow_node(data, out)
+    except _NotFlowDumpable:
+        return dump(data, default_flow_style=True, width=_flow_width)
+    out.append('\n')
+    return ''.join(out)
+
+
 class SpackYAMLError(spack.error.SpackError):
     """Raised when there are issues with YAML parsing."""
     def __init__(self, msg, yaml_error):
@@ -9,12 +9,13 @@ import re
 import os
 import ssl
 import sys
+import threading
 import traceback
 import hashlib
 
 from six.moves.urllib.request import urlopen, Request
-from six.moves.urllib.error import URLError
-from six.moves.urllib.parse import urljoin
+from six.moves.urllib.error import HTTPError, URLError
+from six.moves.urllib.parse import urljoin, urlparse
 import multiprocessing.pool
 
 try:
@@ -30,18 +31,25 @@ except ImportError:
 
 import llnl.util.tty as tty
 
+import spack.caches
 import spack.config
 import spack.cmd
 import spack.url
 import spack.stage
 import spack.error
 import spack.util.crypto
+import spack.util.http_fetch
 from spack.util.compression import ALLOWED_ARCHIVE_TYPES
+from spack.util.http_fetch import HTTPFetchError, SSLFetchError
 
 
 # Timeout in seconds for web requests
 _timeout = 10
 
+#: Maximum number of pages the spider fetches at the same time from one
+#: host
+max_host_connections = 4
+
 
 class LinkParser(HTMLParser):
     """This parser just takes an HTML page and strips out the hrefs on the
@@ -58,35 +66,10 @@ class LinkParser(HTMLParser):
                     self.links.append(val)
 
 
-class NonDaemonProcess(multiprocessing.Process):
-    """Process tha allows sub-processes, so pools can have sub-pools."""
-    @property
-    def daemon(self):
-        return False
-
-    @daemon.setter
-    def daemon(self, value):
-        pass
-
-
-if sys.version_info[0] < 3:
-    class NonDaemonPool(multiprocessing.pool.Pool):
-        """Pool that uses non-daemon processes"""
-        Process = NonDaemonProcess
-else:
-
-    class NonDaemonContext(type(multiprocessing.get_context())):
-        Process = NonDaemonProcess
+def _read_from_url(url, accept_content_type=None, cache=False):
+    if spack.util.http_fetch.supports(url):
+        return _read_from_http(url, accept_content_type, cache)
 
-    class NonDaemonPool(multiprocessing.pool.Pool):
-        """Pool that uses non-daemon processes"""
-
-        def __init__(self, *args, **kwargs):
-            kwargs['context'] = NonDaemonContext()
-            super(NonDaemonPool, self).__init__(*args, **kwargs)
-
-
-def _read_from_url(url, accept_content_type=None):
     context = None
     verify_ssl = spack.config.get('config:verify_ssl')
     pyver = sys.version_info
@@ -133,93 +116,130 @@ def _read_from_url(url, accept_content_type=None):
     return response_url, page
 
 
-def read_from_url(url, accept_content_type=None):
-    resp_url, contents = _read_from_url(url, accept_content_type)
-    return contents
-
-
-def _spider(url, visited, root, depth, max_depth, raise_on_error):
-    """Fetches URL and any pages it links to up to max_depth.
+def _urlopen(*args, **kwargs):
+    """Wrapper for compatibility with old versions of Python."""
+    # We don't pass 'context' parameter to urlopen because it
+    # was introduces only starting versions 2.7.9 and 3.4.3 of Python.
+    if 'context' in kwargs and kwargs['context'] is None:
+        del kwargs['context']
+    return urlopen(*args, **kwargs)
 
-       depth should initially be zero, and max_depth is the max depth of
-       links to follow from the root.
 
-       Prints out a warning only if the root can't be fetched; it ignores
-       errors with pages that the root links to.
+def _read_from_http(url, accept_content_type, cache):
+    """Read a page over a pooled connection.
 
-       Returns a tuple of:
-       - pages: dict of pages visited (URL) mapped to their full text.
-       - links: set of links encountered while visiting the pages.
+    With ``cache``, pages that have an ETag or a Last-Modified date are
+    kept in the ``misc_cache``, and are only downloaded again if they
+    changed.
     """
-    pages = {}     # dict from page URL -> text content.
-    links = set()  # set of all links seen on visited pages.
-
-    # root may end with index.html -- chop that off.
-    if root.endswith('/index.html'):
-        root = re.sub('/index.html$', '', root)
-
-    try:
-        response_url, page = _read_from_url(url, 'text/html')
+    cached = _cached_page(url) if cache else None
+    headers = {}
+    if cached and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    with spack.util.http_fetch.request(url, headers=headers) as response:
+        if response.status == 304 and cached:
+            tty.debug("using cached page " + url)
+            return cached['response_url'], cached['page']
+
+        if response.status >= 400:
+            error = HTTPFetchError(
+                response.url, '%d %s' % (response.status, response.reason),
+                status=response.status)
+            response.drain()
+            raise error
+
+        # Responses that aren't pages are closed before their body is read
+        content_type = response.content_type or ''
+        if accept_content_type and \
+                not content_type.startswith(accept_content_type):
+            tty.debug("ignoring page " + url + " with content type " +
+                      content_type)
+            return None, None
 
-        if not response_url or not page:
-            return pages, links
+        page = response.read().decode('utf-8')
+        etag = response.getheader('ETag')
+        last_modified = response.getheader('Last-Modified')
 
-        pages[response_url] = page
+    if cache and (etag or last_modified):
+        _cache_page(url, {
+            'response_url': response.url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'page': page,
+        })
+    return response.url, page
 
-        # Parse out the links in the page
-        link_parser = LinkParser()
-        subcalls = []
-        link_parser.feed(page)
 
-        while link_parser.links:
-            raw_link = link_parser.links.pop()
-            abs_link = urljoin(response_url, raw_link.strip())
+def _cached_page(url):
+    """Return the cache entry of a page, or None."""
+    try:
+        return spack.caches.page_cache.get(url)
+    except Exception as e:
+        tty.debug("Cannot read cached page {0}: {1}".format(url, e))
+        return None
 
-            links.add(abs_link)
 
-            # Skip stuff that looks like an archive
-            if any(raw_link.endswith(suf) for suf in ALLOWED_ARCHIVE_TYPES):
-                continue
+def _cache_page(url, entry):
+    try:
+        spack.caches.page_cache.put(url, entry)
+    except Exception as e:
+        tty.debug("Cannot cache page {0}: {1}".format(url, e))
 
-            # Skip things outside the root directory
-            if not abs_link.startswith(root):
-                continue
 
-            # Skip already-visited links
-            if abs_link in visited:
-                continue
+def read_from_url(url, accept_content_type=None):
+    """Read a page, or return None if it isn't of ``accept_content_type``.
 
-            # If we're not at max depth, follow links.
-            if depth < max_depth:
-                subcalls.append((abs_link, visited, root,
-                                 depth + 1, max_depth, raise_on_error))
-                visited.add(abs_link)
+    Raises:
+        URLError: if the page cannot be read, or its subclass HTTPError if
+            the server answered with an error status
+    """
+    try:
+        resp_url, contents = _read_from_url(url, accept_content_type)
+    except HTTPFetchError as e:
+        # Pooled http(s) requests fail like urlopen() does for callers
+        if e.status is not None:
+            raise HTTPError(e.url, e.status, str(e), None, None)
+        raise URLError(str(e))
+    return contents
 
-        if subcalls:
-            pool = NonDaemonPool(processes=len(subcalls))
-            try:
-                results = pool.map(_spider_wrapper, subcalls)
 
-                for sub_pages, sub_links in results:
-                    pages.update(sub_pages)
-                    links.update(sub_links)
+def _get_page(url):
+    """Fetch a page for the spider.
 
-            finally:
-                pool.terminate()
-                pool.join()
+    Returns:
+        (tuple): the URL of the page after redirects and its text, or
+            ``(None, None)`` if it could not be fetched or isn't HTML
+    """
+    try:
+        return _read_from_url(url, 'text/html', cache=True)
 
-    except URLError as e:
+    except (URLError, HTTPFetchError) as e:
         tty.debug(e)
 
-        if hasattr(e, 'reason') and isinstance(e.reason, ssl.SSLError):
+        if isinstance(e, SSLFetchError) or (
+                hasattr(e, 'reason') and isinstance(e.reason, ssl.SSLError)):
             tty.warn("Spack was unable to fetch url list due to a certificate "
                      "verification problem. You can try running spack -k, "
                      "which will not check SSL certificates. Use this at your "
                      "own risk.")
 
-        if raise_on_error:
-            raise NoNetworkConnectionError(str(e), url)
+    except Exception as e:
+        # Other types of errors are completely ignored, except in debug mode.
+        tty.debug("Error in spider: %s:%s" % (type(e), e),
+                  traceback.format_exc())
+
+    return None, None
+
 
+def _page_links(url, page):
+    """Return the links of a page, as they appear in it and made
+    absolute."""
+    link_parser = LinkParser()
+    try:
+        link_parser.feed(page)
     except HTMLParseError as e:
         # This error indicates that Python's HTML parser sucks.
         msg = "Got an error parsing HTML."
@@ -230,43 +250,146 @@ def _spider(url, visited, root, depth, max_depth, raise_on_error):
 
         tty.warn(msg, url, "HTMLParseError: " + str(e))
 
-    except Exception as e:
-        # Other types of errors are completely ignored, except in debug mode.
-        tty.debug("Error in _spider: %s:%s" % (type(e), e),
-                  traceback.format_exc())
+    return [(raw_link, urljoin(url, raw_link.strip()))
+            for raw_link in link_parser.links]
 
-    return pages, links
 
+class SpiderSession(object):
+    """Pages fetched by spiders, shared by the spiders that run at the
+    same time, e.g. to find the versions of many packages.
 
-def _spider_wrapper(args):
-    """Wrapper for using spider with multiprocessing."""
-    return _spider(*args)
-
+    Each page is fetched once.  The spiders share a pool of
+    ``connections`` threads (by default ``config:download_connections``),
+    and at most ``max_host_connections`` pages are fetched at the same
+    time from one host.
+    """
 
-def _urlopen(*args, **kwargs):
-    """Wrapper for compatibility with old versions of Python."""
-    # We don't pass 'context' parameter to urlopen because it
-    # was introduces only starting versions 2.7.9 and 3.4.3 of Python.
-    if 'context' in kwargs and kwargs['context'] is None:
-        del kwargs['context']
-    return urlopen(*args, **kwargs)
+    def __init__(self, connections=None):
+        if connections is None:
+            connections = spack.config.get('config:download_connections', 8)
+        self.connections = max(1, connections)
+        self._lock = threading.Lock()
+        self._host_slots = {}
+        self._pages = {}
+        self._pool = None
+
+    def get_pages(self, urls):
+        """Fetch pages concurrently, and return what ``get_page()`` does
+        for each of them."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.pool.ThreadPool(self.connections)
+        return self._pool.map(self.get_page, urls)
+
+    def close(self):
+        """Stop the threads that fetch pages."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def get_page(self, url):
+        """Return the URL of a page after redirects and its text, or
+        ``(None, None)`` if it could not be fetched or isn't HTML."""
+        with self._lock:
+            slots = self._host_slots.setdefault(
+                urlparse(url).netloc,
+                threading.BoundedSemaphore(max_host_connections))
+            entry = self._pages.get(url)
+            fetch = entry is None
+            if fetch:
+                entry = self._pages[url] = [threading.Event(), (None, None)]
+
+        if fetch:
+            # other spiders that need the page wait until it's fetched
+            try:
+                with slots:
+                    entry[1] = _get_page(url)
+            finally:
+                entry[0].set()
+        else:
+            entry[0].wait()
+        return entry[1]
 
 
-def spider(root_url, depth=0):
+def spider(root_url, depth=0, session=None):
     """Gets web pages from a root URL.
 
        If depth is specified (e.g., depth=2), then this will also follow
        up to <depth> levels of links from the root.
 
-       This will spawn processes to fetch the children, for much improved
-       performance over a sequential fetch.
+       Pages are fetched level by level by the threads of a
+       ``SpiderSession``, at most ``max_host_connections`` of them from
+       the same host, and each page is fetched once.  Pages are kept in
+       the ``misc_cache`` and only downloaded again if they changed on
+       the server.
 
+       Spiders that run at the same time can share a ``SpiderSession``,
+       so that pages they have in common are fetched once, and the
+       number of threads is bounded by the session.
+
+       Prints out nothing if pages can't be fetched, except in debug mode.
+
+       Returns a tuple of:
+       - pages: dict of pages visited (URL) mapped to their full text.
+       - links: set of links encountered while visiting the pages.
     """
-    pages, links = _spider(root_url, set(), root_url, 0, depth, False)
+    pages = {}     # dict from page URL -> text content.
+    links = set()  # set of all links seen on visited pages.
+
+    # root may end with index.html -- chop that off.
+    root = root_url
+    if root.endswith('/index.html'):
+        root = re.sub('/index.html$', '', root)
+
+    visited = set([root_url])
+    own_session = session is None
+    if own_session:
+        session = SpiderSession()
+
+    try:
+        to_visit = [root_url]
+        for level in range(depth + 1):
+            next_level = []
+            for response_url, page in session.get_pages(to_visit):
+                if not response_url or not page:
+                    continue
+                pages[response_url] = page
+
+                for raw_link, abs_link in _page_links(response_url, page):
+                    links.add(abs_link)
+
+                    # Skip stuff that looks like an archive
+                    if any(raw_link.endswith(suf)
+                           for suf in ALLOWED_ARCHIVE_TYPES):
+                        continue
+
+                    # Skip things outside the root directory
+                    if not abs_link.startswith(root):
+                        continue
+
+                    # Skip already-visited links
+                    if abs_link in visited:
+                        continue
+
+                    # If we're not at max depth, follow links.
+                    if level < depth:
+                        next_level.append(abs_link)
+                        visited.add(abs_link)
+
+            to_visit = next_level
+            if not to_visit:
+                break
+    finally:
+        if own_session:
+            session.close()
+
     return pages, links
 
 
-def find_versions_of_archive(archive_urls, list_url=None, list_depth=0):
+def find_versions_of_archive(archive_urls, list_url=None, list_depth=0,
+                             session=None):
     """Scrape web pages for new versions of a tarball.
 
     Arguments:
@@ -284,6 +407,9 @@ def find_versions_of_archive(archive_urls, list_url=None, list_depth=0):
       list_depth:
           Max depth to follow links on list_url pages. Default 0.
 
+      session:
+          ``SpiderSession`` shared with searches running at the same time.
+
     """
     if not isinstance(archive_urls, (list, tuple)):
         archive_urls = [archive_urls]
@@ -307,7 +433,7 @@ def find_versions_of_archive(archive_urls, list_url=None, list_depth=0):
     pages = {}
     links = set()
     for lurl in list_urls:
-        pg, lnk = spider(lurl, depth=list_depth)
+        pg, lnk = spider(lurl, depth=list_depth, session=session)
         pages.update(pg)
         links.update(lnk)
 
@@ -209,6 +209,9 @@ class AbstractVariant(object):
     values.
     """
 
+    __slots__ = ('name', '_value', '_original_value',
+                 '_patches_in_order_of_appearance')
+
     def __init__(self, name, value):
         self.name = name
 
@@ -355,6 +358,9 @@ class AbstractVariant(object):
 
 class MultiValuedVariant(AbstractVariant):
     """A variant that can hold multiple values at once."""
+
+    __slots__ = ()
+
     @implicit_variant_conversion
     def satisfies(self, other):
         """Returns true if ``other.name == self.name`` and ``other.value`` is
@@ -378,6 +384,8 @@ class MultiValuedVariant(AbstractVariant):
 class SingleValuedVariant(MultiValuedVariant):
     """A variant that can hold multiple values, but one at a time."""
 
+    __slots__ = ()
+
     def _value_setter(self, value):
         # Treat the value as a multi-valued variant
         super(SingleValuedVariant, self)._value_setter(value)
@@ -421,6 +429,8 @@ class SingleValuedVariant(MultiValuedVariant):
 class BoolValuedVariant(SingleValuedVariant):
     """A variant that can hold either True or False."""
 
+    __slots__ = ()
+
     def _value_setter(self, value):
         # Check the string representation of the value and turn
         # it to a boolean
@@ -447,6 +457,8 @@ class VariantMap(lang.HashableMap):
     if the key is not already present.
     """
 
+    __slots__ = ('spec',)
+
     def __init__(self, spec):
         super(VariantMap, self).__init__()
         self.spec = spec
@@ -92,6 +92,8 @@ def coerced(method):
 class Version(object):
     """Class to represent versions"""
 
+    __slots__ = ('version', 'separators', 'string')
+
     def __init__(self, string):
         string = str(string)
 
@@ -404,6 +406,8 @@ class Version(object):
 
 class VersionRange(object):
 
+    __slots__ = ('start', 'end')
+
     def __init__(self, start, end):
         if isinstance(start, string_types):
             start = Version(start)
@@ -607,6 +611,8 @@ class VersionRange(object):
 class VersionList(object):
     """Sorted, non-redundant list of Versions and VersionRanges."""
 
+    __slots__ = ('versions',)
+
     def __init__(self, vlist=None):
         self.versions = []
         if vlist is not None:
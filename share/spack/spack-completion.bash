@@ -174,7 +174,7 @@ function _spack_buildcache_create {
     if $list_options
     then
         compgen -W "-h --help -r --rel -f --force -u --unsigned -a --allow-root
-                    -k --key -d --directory" -- "$cur"
+                    -k --key -d --directory --compression --blobs" -- "$cur"
     else
         compgen -W "$(_all_packages)" -- "$cur"
     fi
@@ -227,7 +227,8 @@ function _spack_clean {
     if $list_options
     then
         compgen -W "-h --help -s --stage -d --downloads
-                    -m --misc-cache -p --python-cache -a --all" -- "$cur"
+                    -m --misc-cache -c --concretization-cache
+                    -p --python-cache -a --all" -- "$cur"
     else
         compgen -W "$(_all_packages)" -- "$cur"
     fi
@@ -370,7 +371,7 @@ function _spack_debug {
     then
         compgen -W "-h --help" -- "$cur"
     else
-        compgen -W "create-db-tarball" -- "$cur"
+        compgen -W "create-db-tarball lockfile-memory" -- "$cur"
     fi
 }
 
@@ -378,6 +379,15 @@ function _spack_debug_create_db_tarball {
     compgen -W "-h --help" -- "$cur"
 }
 
+function _spack_debug_lockfile_memory {
+    if $list_options
+    then
+        compgen -W "-h --help" -- "$cur"
+    else
+        compgen -f -- "$cur"
+    fi
+}
+
 function _spack_dependencies {
     if $list_options
     then
@@ -634,6 +644,7 @@ function _spack_install {
     if $list_options
     then
         compgen -W "-h --help --only -j --jobs -I --install-status
+                    -p --concurrent-builds
                     --overwrite --keep-prefix --keep-stage --dont-restage
                     --use-cache --no-cache --show-log-on-error --source
                     -n --no-checksum -v --verbose --fake --only-concrete
@@ -1181,7 +1192,8 @@ function _spack_use {
 function _spack_versions {
     if $list_options
     then
-        compgen -W "-h --help -s --safe-only" -- "$cur"
+        compgen -W "-h --help -s --safe-only -a --all -j --jobs
+                    --refresh" -- "$cur"
     else
         compgen -W "$(_all_packages)" -- "$cur"
     fi